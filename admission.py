@@ -0,0 +1,260 @@
+"""
+Admission control for the public booking and upload endpoints.
+
+    @app.route("/api/patient/book", methods=["POST"])
+    @idempotent("patient-book")   # above the guard: replays spend no tokens
+    @ADMISSION.guard
+    def book_appointment(): ...
+
+Two layers, both answering 429 with Retry-After before the view does any work:
+  - token buckets per client IP and per national ID (BOOK_RATE_PER_MIN /
+    BOOK_BURST and BOOK_NID_RATE_PER_MIN / BOOK_NID_BURST)
+  - a cap on bookings running at once in this process (BOOK_MAX_CONCURRENT)
+    with a bounded wait queue (BOOK_MAX_QUEUE, waiting at most BOOK_QUEUE_WAIT
+    seconds); when the queue is full, requests are shed immediately
+
+Buckets live in process memory by default. With RATE_LIMIT_BACKEND=sqlite they
+live in a small separate SQLite file (RATE_LIMIT_DB), so the limits hold across
+several worker processes without adding writes to the appointments database.
+
+Starting an upload (Admission.uploads_from_env) has its own buckets
+(UPLOAD_RATE_PER_MIN / UPLOAD_BURST and UPLOAD_NID_RATE_PER_MIN /
+UPLOAD_NID_BURST) and no concurrency cap.
+
+Shed load is counted in admission_rejected_total{reason=...}.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request
+
+from metrics import REGISTRY
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, str(default)))
+
+
+class MemoryBuckets:
+    """Token buckets in a dict: `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> [tokens, last refill time]
+
+    def take(self, key):
+        """Spend one token. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state
+        full = [k for k, (tokens, last) in self._buckets.items() if tokens + (now - last) * self.rate >= self.burst]
+        for k in full:
+            del self._buckets[k]
+
+
+class SqliteBuckets:
+    """
+    The same buckets in a SQLite table, shared by every process that opens `path`.
+    Several limits can share the table: each stores its keys under its own
+    `prefix` ("ip:", "nid:") and only ever purges those.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path, rate, burst, prefix):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        # Keys of this prefix sort in [prefix, upper): the purge is a range on the primary key
+        self._upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        self._local = threading.local()
+        self._takes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # losing the last few buckets in a crash is fine
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key):
+        key = self.prefix + key
+        now = time.time()
+        conn = self._conn()
+        # Refill and spend in one statement, so concurrent workers cannot both take the last token
+        row = conn.execute(
+            """
+            INSERT INTO rate_limits (key, tokens, updated) VALUES (:key, :burst - 1, :now)
+            ON CONFLICT(key) DO UPDATE SET
+                tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1,
+                updated = :now
+             WHERE MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+            RETURNING tokens
+            """,
+            {"key": key, "burst": self.burst, "now": now, "rate": self.rate},
+        ).fetchone()
+        self._takes += 1
+        if self._takes % 1000 == 0:
+            conn.execute(
+                "DELETE FROM rate_limits WHERE key >= ? AND key < ? AND updated < ?",
+                (self.prefix, self._upper, now - self.burst / self.rate),
+            )
+        if row is not None:
+            return 0
+        tokens, updated = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        return max((1 - tokens) / self.rate, 0.001)
+
+
+class ConcurrencyLimiter:
+    """At most `max_active` holders; at most `max_queue` waiting, each for at most `wait_seconds`."""
+
+    def __init__(self, max_active, max_queue, wait_seconds):
+        self.max_queue = max_queue
+        self.wait_seconds = wait_seconds
+        self._slots = threading.BoundedSemaphore(max_active)
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def acquire(self):
+        """Returns None when admitted, else the reason for shedding ('queue_full' or 'queue_timeout')."""
+        if self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                return "queue_full"
+            self._waiting += 1
+        REGISTRY.gauge_add("booking_queue_waiting", 1)
+        t0 = time.monotonic()
+        try:
+            admitted = self._slots.acquire(timeout=self.wait_seconds)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+            REGISTRY.gauge_add("booking_queue_waiting", -1)
+            REGISTRY.observe("admission_wait_seconds", time.monotonic() - t0)
+        return None if admitted else "queue_timeout"
+
+    def release(self):
+        self._slots.release()
+
+
+def buckets(prefix, rate, burst):
+    """Token buckets from RATE_LIMIT_BACKEND: in memory (per process), or SQLite (shared; RATE_LIMIT_DB)."""
+    if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "sqlite":
+        path = os.getenv("RATE_LIMIT_DB", os.path.join(HERE, "yarab", "rate_limits.db"))
+        return SqliteBuckets(path, rate, burst, prefix)
+    return MemoryBuckets(rate, burst)
+
+
+def _too_many(reason, retry_after):
+    REGISTRY.inc("admission_rejected_total", (("reason", reason),))
+    seconds = max(1, math.ceil(retry_after))
+    resp = jsonify({"error": "Too many requests. Please try again shortly.", "retry_after": seconds})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(seconds)
+    return resp
+
+
+def client_ip():
+    if os.getenv("TRUST_PROXY", "").lower() in {"1", "true", "yes"}:
+        forwarded = request.headers.get("X-Forwarded-For", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.remote_addr or "unknown"
+
+
+def request_national_id():
+    nid = request.form.get("national_id")
+    if nid is None:
+        nid = (request.get_json(silent=True) or {}).get("national_id")
+    return str(nid or "").strip()
+
+
+class Admission:
+    def __init__(self, ip_buckets, nid_buckets, limiter=None):
+        """limiter: a ConcurrencyLimiter, or None for rate limits only."""
+        self.ip_buckets = ip_buckets
+        self.nid_buckets = nid_buckets
+        self.limiter = limiter
+
+    @classmethod
+    def from_env(cls):
+        ip_rate = _env_float("BOOK_RATE_PER_MIN", 10) / 60
+        ip_burst = _env_float("BOOK_BURST", 5)
+        nid_rate = _env_float("BOOK_NID_RATE_PER_MIN", 3) / 60
+        nid_burst = _env_float("BOOK_NID_BURST", 3)
+        ip_buckets = buckets("ip:", ip_rate, ip_burst)
+        nid_buckets = buckets("nid:", nid_rate, nid_burst)
+        limiter = ConcurrencyLimiter(
+            int(_env_float("BOOK_MAX_CONCURRENT", 8)),
+            int(_env_float("BOOK_MAX_QUEUE", 32)),
+            _env_float("BOOK_QUEUE_WAIT", 2),
+        )
+        return cls(ip_buckets, nid_buckets, limiter)
+
+    @classmethod
+    def uploads_from_env(cls):
+        """Buckets for starting an upload, separate from booking's; no concurrency cap."""
+        ip_buckets = buckets("upload-ip:", _env_float("UPLOAD_RATE_PER_MIN", 20) / 60, _env_float("UPLOAD_BURST", 10))
+        nid_buckets = buckets("upload-nid:", _env_float("UPLOAD_NID_RATE_PER_MIN", 6) / 60, _env_float("UPLOAD_NID_BURST", 6))
+        return cls(ip_buckets, nid_buckets)
+
+    def guard(self, fn):
+        """Decorator: rate-limit and concurrency-cap a Flask view."""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            retry = self.ip_buckets.take(client_ip())
+            if retry:
+                return _too_many("ip", retry)
+            nid = request_national_id()
+            if nid:
+                retry = self.nid_buckets.take(nid)
+                if retry:
+                    return _too_many("national_id", retry)
+
+            if self.limiter is None:
+                return fn(*args, **kwargs)
+            shed = self.limiter.acquire()
+            if shed:
+                return _too_many(shed, 1)
+            REGISTRY.gauge_add("booking_active", 1)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REGISTRY.gauge_add("booking_active", -1)
+                self.limiter.release()
+        return wrapper
@@ -4,11 +4,29 @@ import datetime as dt
 import json
 import random
 import re
+from concurrent.futures import TimeoutError as FutureTimeout
 from functools import wraps
 from urllib.parse import urlencode
 
-from flask import Flask, send_from_directory, abort, request, jsonify, session, redirect, url_for, render_template, current_app
-from dotenv import load_dotenv
+from flask import Blueprint, Flask, send_from_directory, abort, request, jsonify, session, redirect, url_for, render_template, current_app
+
+import admission
+import availability
+import chunked_uploads
+import idempotency
+import image_ingest
+import live_queue
+import metrics
+import pending_rule
+import services
+from slots import SlotsFull
+# Connection factory and caches of the request's clinic, shared with the staff app in one process
+from services import (
+    AVAILABILITY, CAPACITY, PENDING, SLOTS, TODAY_QUEUE, AfterCommit, capacity_for, clinic_routes, dict_factory,
+    get_conn, idempotent, per_clinic,
+)
+
+PHONE_RE = re.compile(r"0\d{10}")
 
 # --- PHONE NORMALIZATION + DEBUG LOGGING ---
 def _debug(msg):
@@ -42,31 +60,18 @@ def get_phone_string(req):
         digits = "0" + digits
 
     # Final validation (Egypt style): 0 + 10 digits = 11 total
-    if not re.fullmatch(r"0\d{10}", digits):
+    if not PHONE_RE.fullmatch(digits):
         raise ValueError(f"invalid phone format: {repr(s)} -> digits={digits}")
 
     return digits
 
-# Load environment variables
-load_dotenv()
-
 # --- ABSOLUTE PATHS TO BUILDS ---
 HERE = os.path.abspath(os.path.dirname(__file__))
 PATIENT_DIST = os.path.abspath(os.path.join(HERE, 'patient', 'dist'))
 
-app = Flask(__name__, static_folder=PATIENT_DIST, static_url_path="")
-
-# Session configuration
-app.secret_key = os.getenv("FLASK_SECRET", "change-me")
-
-# Database setup
-def dict_factory(cursor, row):
-    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
-
-def get_conn():
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'yarab', 'dental_appointments.db'))
-    conn.row_factory = dict_factory
-    return conn
+# Routes live on a blueprint; create_app() builds the Flask app around it
+bp = Blueprint("patient", __name__)
+clinic_routes(bp)  # /clinics/<clinic_id>/api/... runs against that clinic's database
 
 # Capacity checking and date assignment
 WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
@@ -78,48 +83,51 @@ class CapacityError(Exception):
         self.capacity = capacity
         self.used = used
 
+class NoAvailability(Exception):
+    def __init__(self, days: int):
+        super().__init__(f"No appointments available in the next {days} days")
+        self.days = days
+
 def check_capacity(scheduled_date: str, conn: sqlite3.Connection):
     d = dt.date.fromisoformat(scheduled_date)
     day = WEEK[d.weekday()]
-    cap = conn.execute(
-        "SELECT capacity FROM daily_capacity WHERE day_name=?", (day,)
-    ).fetchone()
     # Default capacity is 10 per day when not set in DB
-    cap_val = (cap["capacity"] if cap else 10)
+    cap_val = CAPACITY.for_date(d, 10)
     used = conn.execute(
         "SELECT COUNT(*) AS c FROM appointments WHERE scheduled_date=?",
         (scheduled_date,),
     ).fetchone()["c"]
-    if cap_val and used >= cap_val:
+    # A date override of 0 closes the day; a weekday capacity of 0 means "not limited"
+    if (cap_val or CAPACITY.override_for(d)) and used >= cap_val:
         raise CapacityError(day, cap_val, used)
 
-def get_next_available_date(conn: sqlite3.Connection) -> str:
+def get_next_available_date(conn: sqlite3.Connection, after: AfterCommit | None = None) -> str:
     """Find the next available date based on daily capacity"""
     today = dt.date.today()
+    index = AVAILABILITY._get_current_object()  # the callbacks may run outside this clinic's context
     
     # Check up to 30 days ahead
     for days_ahead in range(30):
         check_date = today + dt.timedelta(days=days_ahead)
-        day_name = WEEK[check_date.weekday()]
         
-        # Get capacity for this day
-        cap_row = conn.execute(
-            "SELECT capacity FROM daily_capacity WHERE day_name=?", (day_name,)
-        ).fetchone()
-        capacity = cap_row["capacity"] if cap_row else 10  # Default capacity is 10
+        # Skip days the in-memory index already knows are full
+        if AVAILABILITY.remaining(check_date) <= 0:
+            continue
         
-        # Get current appointments for this date
+        # Confirm with the database: another process may have booked since the last refresh
         used = conn.execute(
             "SELECT COUNT(*) AS c FROM appointments WHERE scheduled_date=?",
             (check_date.isoformat(),)
         ).fetchone()["c"]
         
         # If there's capacity, return this date
-        if used < capacity:
+        if used < capacity_for(check_date):
             return check_date.isoformat()
+        # `used` counts this transaction's own inserts: correct the index only once they are committed
+        if after is not None:
+            after.on_commit(lambda day=check_date, used=used: index.set_booked(day, used))
     
-    # If no capacity found in 30 days, return today + 30 days
-    return (today + dt.timedelta(days=30)).isoformat()
+    raise NoAvailability(30)
 
 # Ticket generation with national_id dependency
 def make_ticket(scheduled_date: str, national_id: str, conn: sqlite3.Connection) -> int:
@@ -144,12 +152,151 @@ def find_by_last4(last4: int, phone: str | None, date: str | None, conn: sqlite3
 def find_by_ticket(ticket: int, conn: sqlite3.Connection):
     return conn.execute("SELECT * FROM appointments WHERE ticket_number=? ORDER BY created_at DESC", (ticket,)).fetchall()
 
+def duplicate_booking(nid, existing):
+    """409 for a patient who already has a pending appointment (`existing` is that row)."""
+    _debug(f"[book] duplicate pending for national_id={nid}: ticket={existing['ticket_number'] if existing else None}")
+    # Return clear message that user cannot make another appointment
+    return {
+        "error": "You already have a pending appointment. Please complete your current appointment before booking a new one.",
+        "ticket_number": str(existing["ticket_number"]) if existing else None,
+        "scheduled_date": existing["scheduled_date"] if existing else None,
+        "status": existing["status"] if existing else "pending",
+        "duplicate": True
+    }, 409
+
+def insert_booking(conn: sqlite3.Connection, payload: dict, phone: str, after: AfterCommit):
+    """
+    Date/ticket allocation + INSERT (duplicates rejected by the insert); the caller
+    commits, then calls after.committed() (or after.rolled_back()). Returns (body, status).
+    """
+    nid = str(payload["national_id"]).strip()
+    index, seats = AVAILABILITY._get_current_object(), SLOTS._get_current_object()
+
+    # Auto-assign next available scheduled_date
+    try:
+        scheduled_date = get_next_available_date(conn, after)
+    except NoAvailability as exc:
+        return {"error": str(exc), "full": True}, 409
+    payload["scheduled_date"] = scheduled_date
+
+    # Generate ticket number
+    ticket_number = make_ticket(scheduled_date, nid, conn)
+
+    # Insert appointment into database (with phone_text column) in the first free time slot
+    def insert(slot_time, slot_chair):
+        try:
+            _insert(slot_time, slot_chair)
+        except sqlite3.IntegrityError as exc:
+            # A pending appointment whose date has passed no longer counts (see pending_rule.py)
+            if not (pending_rule.is_duplicate(exc) and pending_rule.close_stale(conn, nid)):
+                raise
+            _insert(slot_time, slot_chair)
+
+    def _insert(slot_time, slot_chair):
+        conn.execute(
+            """
+            INSERT INTO appointments (ticket_number, name, phone, phone_text, national_id, symptoms, image_paths, voice_note_path, status, scheduled_date, slot_time, slot_chair)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                ticket_number,
+                payload["name"],
+                phone,  # Store in both phone and phone_text for compatibility
+                phone,  # Store normalized phone in phone_text
+                nid,
+                payload.get("symptoms"),
+                payload.get("image_paths"),
+                payload.get("voice_note_path"),
+                'pending',
+                scheduled_date,
+                slot_time,
+                slot_chair
+            )
+        )
+
+    # Duplicate rule: one PENDING appointment per national_id (see pending_rule.py).
+    # The insert enforces it; check() only looks while the index cannot be built.
+    existing = PENDING.check(conn, nid)
+    if existing is not None:
+        return duplicate_booking(nid, existing)
+    day = dt.date.fromisoformat(scheduled_date)
+    try:
+        _, slot_time, slot_chair = seats.book(conn, day, insert)
+    except SlotsFull:  # every seat taken since the date was picked
+        return {"error": f"{scheduled_date} is fully booked. Please try again.", "full": True}, 409
+    except sqlite3.IntegrityError as exc:
+        if not pending_rule.is_duplicate(exc):
+            raise
+        return duplicate_booking(nid, pending_rule.conflicting(conn, nid))
+    # The seat is held from now on (later bookings in the same batch must not get it);
+    # it is given back if the transaction rolls back. The day's count moves on commit.
+    after.on_rollback(lambda: seats.release(day, slot_time, slot_chair))
+    after.on_commit(lambda: index.add(day))
+
+    return {
+        "ticket_number": str(ticket_number),
+        "scheduled_date": scheduled_date,
+        "slot_time": slot_time,
+        "slot_chair": slot_chair,
+        "status": "pending",
+        "symptoms": payload.get("symptoms"),
+        "image_paths": [payload.get("image_paths")] if payload.get("image_paths") else [],
+        "voice_note_path": payload.get("voice_note_path")
+    }, 201
+
+# Per-IP / per-national-ID token buckets and a concurrency cap for booking (see admission.py)
+ADMISSION = admission.Admission.from_env()
+
+# Optional single-writer pipeline: bookings are queued and group-committed in batches,
+# one writer per clinic database
+BOOKING_WRITER = None
+if os.getenv("BOOKING_QUEUE", "").lower() in {"1", "true", "yes"}:
+    import booking_queue
+    BOOKING_WRITER = per_clinic(
+        "booking_writer", lambda clinic: booking_queue.BookingWriter(
+            clinic.get_conn, clinic.bind(insert_booking), after_commit=AfterCommit
+        )
+    )
+BOOKING_TIMEOUT = float(os.getenv("BOOKING_TIMEOUT", "10"))
+
+# Resumable chunked uploads, referenced from a booking by upload ID (see chunked_uploads.py).
+# The uploads tree is shared by every clinic, and so is this store.
+UPLOADS = chunked_uploads.UploadStore()
+UPLOAD_ADMISSION = admission.Admission.uploads_from_env()
+
+def settle_uploads(claimed, booked):
+    """Keep the uploads a booking claimed if it answered 201, else give them back."""
+    if claimed:
+        (UPLOADS.settle if booked else UPLOADS.unclaim)(claimed)
+
+def finish_later(claimed, finish, clinic, nid, image_path):
+    """
+    Done-callback for a queued booking whose request already answered 202:
+    settle its uploads, store its response under the Idempotency-Key (finish,
+    from idempotency.defer(); None without a key) and queue its image.
+    """
+    def done(fut):
+        if fut.cancelled() or fut.exception() is not None:
+            body, status_code = None, None
+        else:
+            body, status_code = fut.result()
+        settle_uploads(claimed, status_code == 201)
+        if finish is not None:
+            finish(status_code, json.dumps(body))
+        if IMAGES is not None and status_code == 201 and image_path:
+            IMAGES.submit(image_path, clinic.get_conn, nid)
+    return done
+
+# Booking photos are downsized and re-encoded in a process pool after the booking
+# commits (see image_ingest.py); None without Pillow or with IMAGE_INGEST=0
+IMAGES = image_ingest.ImageIngest.from_env()
+
 def envelope(ok: bool, data=None, error=None):
     return jsonify({"ok": ok, "data": data, "error": error})
 
 # ------------- PATIENT API ROUTES -------------
 
-@app.route("/api/health", methods=["GET"])
+@bp.route("/api/health", methods=["GET"])
 def health_check():
     try:
         with get_conn() as conn:
@@ -158,7 +305,7 @@ def health_check():
     except Exception as exc:
         return {"status": "unhealthy", "service": "patient", "error": str(exc)}, 500
 
-@app.route("/api/patient/appointments", methods=["GET"])
+@bp.route("/api/patient/appointments", methods=["GET"])
 def get_patient_appointments():
     # Get query parameters
     ticket = request.args.get('ticket')
@@ -202,7 +349,55 @@ def get_patient_appointments():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/patient/book", methods=["POST"])
+@bp.route("/api/patient/availability", methods=["GET"])
+def get_availability():
+    """Remaining slots per date, e.g. ?from=2025-10-01&to=2025-12-31 (at most a year)."""
+    today = dt.date.today()
+    try:
+        first = dt.date.fromisoformat(request.args.get("from") or today.isoformat())
+        last = dt.date.fromisoformat(request.args.get("to") or (first + dt.timedelta(days=30)).isoformat())
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if last < first:
+        return jsonify({"error": "to must not be before from"}), 400
+    first = max(first, today)
+    last = min(last, today + dt.timedelta(days=availability.HORIZON_DAYS - 1))
+
+    # Cheap revalidation: the ETag is a hash of the days themselves, so it is the
+    # same from every worker and changes only when a count or capacity does
+    days = AVAILABILITY.days(first, last)
+    etag = availability.etag(days)
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = jsonify({
+            "from": first.isoformat(),
+            "to": last.isoformat(),
+            "days": days,
+        })
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, max-age=5"
+    return resp
+
+@bp.route("/api/patient/queue/<int:ticket>", methods=["GET"])
+def get_queue_position(ticket):
+    """Position in today's queue and estimated wait for a ticket scheduled today."""
+    SLOTS.prepare()
+    entry = TODAY_QUEUE.lookup(ticket)
+    if entry is None:
+        return jsonify({"error": "Ticket is not in today's queue"}), 404
+    etag = live_queue.etag(entry)
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = jsonify(entry)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, max-age=5"
+    return resp
+
+@bp.route("/api/patient/book", methods=["POST"])
+@idempotent("patient-book")  # outermost: a replay is answered before admission control spends tokens
+@ADMISSION.guard
 def book_appointment():
     # Accept JSON or multipart/form-data with optional image and voice files
     is_multipart = request.content_type and "multipart/form-data" in request.content_type
@@ -268,104 +463,133 @@ def book_appointment():
         _debug(f"[book] phone validation error: {e}")
         return jsonify({"error": "Phone must be 11 digits starting with 0 (e.g., 01XXXXXXXXX)"}), 400
 
-    # Duplicate prevention: same person (national_id) cannot book if any non-completed exists
+    # Files sent ahead through /api/patient/uploads. They are claimed (moved into the
+    # patient's folder) now and settled with the booking's outcome: anything but a
+    # 201 gives them back, so a retry can use the same upload IDs.
+    source = request.form if is_multipart else payload
+    claimed = []  # (upload_id, stored path)
     try:
-        with get_conn() as conn:
-            # 2) Duplicate rule: only block if PENDING for today/future based on national_id
-            existing = conn.execute(
-                """
-                SELECT id, status, ticket_number, scheduled_date, name
-                  FROM appointments
-                 WHERE national_id = ?
-                   AND COALESCE(status,'pending')='pending'
-                   AND date(COALESCE(scheduled_date, date('now'))) >= date('now')
-                 ORDER BY created_at DESC
-                 LIMIT 1
-                """,
-                (nid,),
-            ).fetchone()
-            
-            if existing:
-                _debug(f"[book] duplicate pending for national_id={nid}: ticket={existing['ticket_number']}")
-                # Return clear message that user cannot make another appointment
-                return jsonify({
-                    "error": "You already have a pending appointment. Please complete your current appointment before booking a new one.",
-                    "ticket_number": str(existing["ticket_number"]),
-                    "scheduled_date": existing["scheduled_date"],
-                    "status": existing["status"],
-                    "duplicate": True
-                }), 409
-
-            # Auto-assign next available scheduled_date
-            scheduled_date = get_next_available_date(conn)
-            payload["scheduled_date"] = scheduled_date
-
-            # Generate ticket number
-            ticket_number = make_ticket(scheduled_date, payload["national_id"], conn)
-            
-            # Insert appointment into database (with phone_text column)
-            cursor = conn.execute(
-                """
-                INSERT INTO appointments (ticket_number, name, phone, phone_text, national_id, symptoms, image_paths, voice_note_path, status, scheduled_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    ticket_number,
-                    payload["name"],
-                    phone,  # Store in both phone and phone_text for compatibility
-                    phone,  # Store normalized phone in phone_text
-                    payload["national_id"],
-                    payload.get("symptoms"),
-                    payload.get("image_paths"),
-                    payload.get("voice_note_path"),
-                    'pending',
-                    scheduled_date
-                )
-            )
-            conn.commit()
-            
-            # Get the created appointment
-            appointment = conn.execute("SELECT * FROM appointments WHERE id = ?", (cursor.lastrowid,)).fetchone()
-            
-            response_data = {
-                "ticket_number": str(ticket_number),
-                "scheduled_date": scheduled_date,
-                "status": "pending",
-                "symptoms": payload.get("symptoms"),
-                "image_paths": [payload.get("image_paths")] if payload.get("image_paths") else [],
-                "voice_note_path": payload.get("voice_note_path")
-            }
-            
-            return jsonify(response_data), 201
-            
+        for kind, field in (("image", "image_paths"), ("voice", "voice_note_path")):
+            upload_id = str(source.get(f"{kind}_upload_id") or "").strip()
+            if upload_id:
+                path = UPLOADS.claim(upload_id, nid, kind)
+                claimed.append((upload_id, path))
+                payload = {**payload, field: path}
+    except chunked_uploads.UploadError as e:
+        settle_uploads(claimed, False)
+        return jsonify({"error": str(e)}), e.status
+
+    # Duplicate check, date/ticket allocation and insert run in one transaction,
+    # either right here or batched on the booking writer thread (BOOKING_QUEUE=1)
+    settling = False  # once set, the booking's outcome settles the claimed uploads
+    try:
+        # First use loads the caches and applies migrations on their own
+        # connections; do that here rather than inside the booking transaction
+        AVAILABILITY.remaining(dt.date.today())
+        SLOTS.prepare()
+        PENDING.prepare()
+        if BOOKING_WRITER is not None:
+            fut = BOOKING_WRITER.submit(payload, phone)
+            try:
+                body, status_code = fut.result(timeout=BOOKING_TIMEOUT)
+            except FutureTimeout:
+                # Still queued or running: the writer may yet commit it, so the
+                # outcome is unknown. Settle uploads and the Idempotency-Key when it is done.
+                settling = True
+                fut.add_done_callback(finish_later(claimed, idempotency.defer(), services.current(), nid,
+                                                   payload.get("image_paths")))
+                resp = jsonify({
+                    "pending": True,
+                    "message": "Your booking is still being processed and its outcome is not known yet. "
+                               "Retry with the same Idempotency-Key, or check your appointments, before booking again.",
+                    "idempotency_key": request.headers.get(idempotency.HEADER),
+                })
+                resp.headers["Retry-After"] = str(max(1, int(BOOKING_TIMEOUT)))
+                return resp, 202
+        else:
+            after = AfterCommit()
+            try:
+                with get_conn() as conn:
+                    body, status_code = insert_booking(conn, payload, phone, after)
+                    conn.commit()
+            except BaseException:
+                after.rolled_back()
+                raise
+            after.committed()
+        settling = True
+        settle_uploads(claimed, status_code == 201)
+        if IMAGES is not None and status_code == 201 and payload.get("image_paths"):
+            IMAGES.submit(payload["image_paths"], services.current().get_conn, nid)
+        return jsonify(body), status_code
     except Exception as e:
+        if not settling:
+            settle_uploads(claimed, False)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/uploads/patients/<patient_folder>/images/<filename>", methods=["GET"])
+@bp.route("/api/patient/uploads", methods=["POST"])
+@UPLOAD_ADMISSION.guard
+def create_upload():
+    """Start a resumable upload: {"kind": "image"|"voice", "size": bytes, "filename", "national_id"}."""
+    data = request.get_json(silent=True) or {}
+    nid = str(data.get("national_id") or "").strip()
+    if not (nid.isdigit() and len(nid) == 14):
+        return jsonify({"error": "National ID must be 14 digits"}), 400
+    try:
+        size = data.get("size")
+        body = UPLOADS.create(nid, data.get("kind"), size if isinstance(size, int) else None, data.get("filename") or "",
+                              admission.client_ip())
+    except chunked_uploads.UploadError as e:
+        return jsonify({"error": str(e), **e.extra}), e.status
+    return jsonify(body), 201
+
+@bp.route("/api/patient/uploads/<upload_id>", methods=["GET", "PUT"])
+def upload_chunk(upload_id):
+    """GET: bytes received so far (where to resume). PUT: the next chunk, at Upload-Offset."""
+    try:
+        if request.method == "GET":
+            return jsonify(UPLOADS.status(upload_id))
+        raw = request.headers.get("Upload-Offset", request.args.get("offset", ""))
+        if not raw.isdigit():
+            return jsonify({"error": "Upload-Offset header is required"}), 400
+        body = UPLOADS.write(upload_id, int(raw), request.content_length, request.stream)
+    except chunked_uploads.UploadError as e:
+        return jsonify({"error": str(e), **e.extra}), e.status
+    return jsonify(body)
+
+@bp.route("/api/patient/uploads/<upload_id>/complete", methods=["POST"])
+def complete_upload(upload_id):
+    """Finish an upload once every byte is in; an optional "sha256" is checked."""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(UPLOADS.complete(upload_id, data.get("sha256")))
+    except chunked_uploads.UploadError as e:
+        return jsonify({"error": str(e), **e.extra}), e.status
+
+@bp.route("/uploads/patients/<patient_folder>/images/<filename>", methods=["GET"])
 def uploaded_patient_image(patient_folder, filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'patients', patient_folder, 'images')
     return send_from_directory(upload_dir, filename)
 
-@app.route("/uploads/patients/<patient_folder>/voices/<filename>", methods=["GET"])
+@bp.route("/uploads/patients/<patient_folder>/voices/<filename>", methods=["GET"])
 def uploaded_patient_voice(patient_folder, filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'patients', patient_folder, 'voices')
     return send_from_directory(upload_dir, filename)
 
 # Legacy endpoints for backward compatibility
-@app.route("/uploads/images/<filename>", methods=["GET"])
+@bp.route("/uploads/images/<filename>", methods=["GET"])
 def uploaded_image(filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'images')
     return send_from_directory(upload_dir, filename)
 
-@app.route("/uploads/voices/<filename>", methods=["GET"])
+@bp.route("/uploads/voices/<filename>", methods=["GET"])
 def uploaded_voice(filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'voices')
     return send_from_directory(upload_dir, filename)
 
 # ------------- STATIC FILES (PATIENT REACT UI) -------------
 # Catch-all must be LAST and must not intercept /api or /uploads.
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
+@bp.route("/", defaults={"path": ""})
+@bp.route("/<path:path>")
 def serve_patient_ui(path):
     # Don't serve index.html for API routes or uploads
     if path.startswith("api") or path.startswith("uploads"):
@@ -373,17 +597,56 @@ def serve_patient_ui(path):
 
     # For static assets (JS, CSS, images, etc.), serve them if they exist
     if path and not path.endswith('/'):
-        full = os.path.join(app.static_folder, path)
+        full = os.path.join(current_app.static_folder, path)
         if os.path.exists(full) and os.path.isfile(full):
-            return send_from_directory(app.static_folder, path)
+            return send_from_directory(current_app.static_folder, path)
 
     # For all other routes (including client-side routes), serve index.html
     # This allows React Router to handle client-side routing
-    index_path = os.path.join(app.static_folder, "index.html")
+    index_path = os.path.join(current_app.static_folder, "index.html")
     if not os.path.exists(index_path):
         return "Build not found: {}".format(index_path), 500
-    return send_from_directory(app.static_folder, "index.html")
+    return send_from_directory(current_app.static_folder, "index.html")
+
+# ------------- APP FACTORY -------------
+
+def start_background_jobs():
+    """
+    Start the upload expiry thread: unclaimed uploads are deleted every
+    UPLOAD_EXPIRE_EVERY_MINUTES (see chunked_uploads.py). It belongs in one
+    process: create_app calls this unless PATIENT_JOBS=hook, which gunicorn.conf.py
+    sets so that one worker starts it instead (post_worker_init).
+    """
+    UPLOADS.start()
+
+def create_app(config=None):
+    """
+    Build the patient app. `config` (a mapping) is applied over the defaults.
+    Caches and background services are module-level, so every app built in
+    one process shares them.
+    """
+    app = Flask(__name__, static_folder=PATIENT_DIST, static_url_path="")
+    # Session configuration
+    app.config.update(SECRET_KEY=os.getenv("FLASK_SECRET", "change-me"))
+    app.config.update(config or {})
+    app.register_blueprint(bp)
+    app.register_blueprint(bp, url_prefix="/clinics/<clinic_id>", name="patient_clinic")
+
+    # Request/SQL timing; /api/metrics is served here only behind METRICS_TOKEN
+    metrics.init_app(app, "patient")
+    if os.getenv("PATIENT_JOBS", "create_app").lower() == "create_app":
+        start_background_jobs()
+    return app
+
+def __getattr__(name):
+    # `app` is built on first access (gunicorn "app_patient:app", older scripts);
+    # serve.py and combined.py call create_app() and never pay for a second one
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     print("[patient] serving UI from:", PATIENT_DIST)
-    app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
@@ -1,12 +1,39 @@
 import os
 import sqlite3
 import datetime as dt
+import json
 import random
 import re
 from functools import wraps
 
-from flask import Flask, send_from_directory, abort, request, jsonify, session, redirect, url_for, render_template, current_app
-from dotenv import load_dotenv
+try:
+    from zoneinfo import ZoneInfo  # py3.9+
+except ImportError:
+    from backports.zoneinfo import ZoneInfo  # if needed: pip install backports.zoneinfo
+
+from flask import Blueprint, Flask, send_from_directory, abort, request, jsonify, session, redirect, url_for, render_template, current_app
+
+import attachments_zip
+import backup
+import metrics
+import reporting
+import schema
+import slots
+import storage
+import upload_sweeper
+from slots import SlotsFull
+from storage import PendingConflict, SQLiteStorage, decode_image_paths
+# Connection factory and caches of the request's clinic, shared with the patient app in one process
+import services
+from services import (
+    CAPACITY, PENDING, SLOTS, AfterCommit, appointments_changed, capacity_for, clinic_routes, dict_factory,
+    get_conn, idempotent, per_clinic,
+)
+
+# Built once at import instead of on every request
+CAIRO = ZoneInfo("Africa/Cairo")
+PHONE_RE = re.compile(r"0\d{10}")
+HHMM_RE = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
 
 # --- PHONE NORMALIZATION + DEBUG LOGGING ---
 def _debug(msg):
@@ -40,35 +67,66 @@ def get_phone_string(req):
         digits = "0" + digits
 
     # Final validation (Egypt style): 0 + 10 digits = 11 total
-    if not re.fullmatch(r"0\d{10}", digits):
+    if not PHONE_RE.fullmatch(digits):
         raise ValueError(f"invalid phone format: {repr(s)} -> digits={digits}")
 
     return digits
 
-# Load environment variables
-load_dotenv()
-
 # --- ABSOLUTE PATHS TO BUILDS ---
 HERE = os.path.abspath(os.path.dirname(__file__))
 STAFF_DIST = os.path.abspath(os.path.join(HERE, 'staff', 'dist'))
 
-app = Flask(__name__, static_folder=STAFF_DIST, static_url_path="")
+# Routes live on a blueprint; create_app() builds the Flask app around it
+bp = Blueprint("staff", __name__)
+clinic_routes(bp)  # /clinics/<clinic_id>/api/... runs against that clinic's database
 
-# Session configuration for staff authentication
-app.config.update(
-    SESSION_COOKIE_SAMESITE="Lax", 
-    SESSION_COOKIE_SECURE=False
-)
-app.secret_key = os.getenv("FLASK_SECRET", "change-me")
+# Weekday demand forecast for the capacity screen, cached until new data (see forecast.py).
+# forecast/reports serve two screens only, so they are imported on first use.
+# Cross-clinic search: one lookup per branch database, run side by side
+NATIONAL_ID_MIGRATION = "2026-10-19_add_national_id_index.sql"
+CLINIC_SEARCH_WORKERS = int(os.getenv("CLINIC_SEARCH_WORKERS", "8"))
+CLINIC_SEARCH_TIMEOUT = float(os.getenv("CLINIC_SEARCH_TIMEOUT", "5"))
+_search_pool = None
+
+def _new_recommender(clinic):
+    import forecast
+    return forecast.Recommender(clinic.get_conn, clinic.capacity_for, lambda: clinic.capacity.version)
+
+def recommender():
+    return services.current().state("recommender", _new_recommender)
+
+# Heavy reads on read-only connections; seconds of staleness allowed per endpoint,
+# where > 0 lets it read a backup-API snapshot instead (see reporting.py)
+REPORTING_STALENESS = {
+    "appointments": 0,
+    "dashboard": 0,
+    "dashboard_stats": 0,
+    "reports": 0,
+    "attachments": 0,
+}
+# Appointment writes go through the Storage interface (see storage.py)
+STORAGE = per_clinic("storage", lambda clinic: storage.SQLiteStorage(clinic.get_conn))
+
+REPORTING = per_clinic("reporting", lambda clinic: reporting.ReportingSource(
+    clinic.db_path, dict_factory, REPORTING_STALENESS, subdir=None if clinic is services.DEFAULT else clinic.id,
+))
 
-# Database setup
-def dict_factory(cursor, row):
-    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+# Orphaned uploads are quarantined every SWEEP_INTERVAL_MINUTES, off by default (see upload_sweeper.py)
+SWEEPER = upload_sweeper.UploadSweeper([c.get_conn for c in services.CLINICS.values()])
 
-def get_conn():
-    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), 'yarab', 'dental_appointments.db'))
-    conn.row_factory = dict_factory
-    return conn
+# Online snapshots every BACKUP_INTERVAL_MINUTES, off by default (see backup.py)
+def _new_backup_job(clinic):
+    return backup.BackupJob(clinic.db_path, subdir=None if clinic is services.DEFAULT else clinic.id)
+
+def start_background_jobs():
+    """
+    Start the backup and upload sweeper threads (each a no-op unless its interval is set).
+    They belong in one process: create_app calls this unless STAFF_JOBS=hook, which
+    gunicorn.conf.py sets so that one worker starts them instead (post_worker_init).
+    """
+    for clinic in services.CLINICS.values():
+        clinic.state("backups", _new_backup_job).start()
+    SWEEPER.start()
 
 # Capacity checking and date assignment
 WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
@@ -80,18 +138,21 @@ class CapacityError(Exception):
         self.capacity = capacity
         self.used = used
 
+class NoAvailability(Exception):
+    def __init__(self, days: int):
+        super().__init__(f"No appointments available in the next {days} days")
+        self.days = days
+
 def check_capacity(scheduled_date: str, conn: sqlite3.Connection):
     d = dt.date.fromisoformat(scheduled_date)
     day = WEEK[d.weekday()]
-    cap = conn.execute(
-        "SELECT capacity FROM daily_capacity WHERE day_name=?", (day,)
-    ).fetchone()
-    cap_val = (cap["capacity"] if cap else 0)
+    cap_val = CAPACITY.for_date(d, 0)
     used = conn.execute(
         "SELECT COUNT(*) AS c FROM appointments WHERE scheduled_date=?",
         (scheduled_date,),
     ).fetchone()["c"]
-    if cap_val and used >= cap_val:
+    # A date override of 0 closes the day; a weekday capacity of 0 means "not limited"
+    if (cap_val or CAPACITY.override_for(d)) and used >= cap_val:
         raise CapacityError(day, cap_val, used)
 
 def get_next_available_date(conn: sqlite3.Connection) -> str:
@@ -101,13 +162,10 @@ def get_next_available_date(conn: sqlite3.Connection) -> str:
     # Check up to 30 days ahead
     for days_ahead in range(30):
         check_date = today + dt.timedelta(days=days_ahead)
-        day_name = WEEK[check_date.weekday()]
         
-        # Get capacity for this day
-        cap_row = conn.execute(
-            "SELECT capacity FROM daily_capacity WHERE day_name=?", (day_name,)
-        ).fetchone()
-        capacity = cap_row["capacity"] if cap_row else 10  # Default capacity is 10
+        # Get capacity for this day (date overrides first, then weekday)
+        capacity = CAPACITY.for_date(check_date, 10)  # Default capacity is 10
+        capacity = SLOTS.capacity(check_date, capacity)  # no more than the day's seats
         
         # Get current appointments for this date
         used = conn.execute(
@@ -119,8 +177,7 @@ def get_next_available_date(conn: sqlite3.Connection) -> str:
         if used < capacity:
             return check_date.isoformat()
     
-    # If no capacity found in 30 days, return today + 30 days
-    return (today + dt.timedelta(days=30)).isoformat()
+    raise NoAvailability(30)
 
 # Ticket generation with national_id dependency
 def make_ticket(scheduled_date: str, national_id: str, conn: sqlite3.Connection) -> int:
@@ -130,6 +187,15 @@ def make_ticket(scheduled_date: str, national_id: str, conn: sqlite3.Connection)
     national_id_last4 = int(national_id[-4:]) if national_id and len(national_id) >= 4 else random.randint(0, 9999)
     return int(f"{ymd}{seq:03d}{national_id_last4:04d}")
 
+def duplicate_response(existing):
+    """409 for a patient who already has a pending appointment (`existing` is that row)."""
+    return jsonify({
+        "error": "Patient already has a pending appointment. Please complete the current appointment before creating a new one.",
+        "ticket_number": str(existing["ticket_number"]) if existing else None,
+        "scheduled_date": existing["scheduled_date"] if existing else None,
+        "duplicate": True
+    }), 409
+
 def envelope(ok: bool, data=None, error=None):
     return jsonify({"ok": ok, "data": data, "error": error})
 
@@ -164,7 +230,7 @@ def parse_sort(sort_param: str):
 
 # ------------- STAFF API ROUTES -------------
 
-@app.route("/api/health", methods=["GET"])
+@bp.route("/api/health", methods=["GET"])
 def health_check():
     try:
         with get_conn() as conn:
@@ -173,7 +239,7 @@ def health_check():
     except Exception as exc:
         return {"status": "unhealthy", "service": "staff", "error": str(exc)}, 500
 
-@app.route("/api/login/staff", methods=["POST"])
+@bp.route("/api/login/staff", methods=["POST"])
 def staff_login():
     data = request.get_json(silent=True) or request.form or {}
     username = (data.get("username") or "").strip()
@@ -193,12 +259,12 @@ def staff_login():
     else:
         return jsonify({"error": "Invalid credentials"}), 401
 
-@app.route("/api/logout", methods=["POST"])
+@bp.route("/api/logout", methods=["POST"])
 def staff_logout():
     session.clear()
     return jsonify({"message": "Logged out successfully"}), 200
 
-@app.route("/api/auth/verify", methods=["GET"])
+@bp.route("/api/auth/verify", methods=["GET"])
 def verify_auth():
     if session.get('staff_logged_in'):
         return jsonify({
@@ -211,7 +277,7 @@ def verify_auth():
     else:
         return jsonify({"authenticated": False}), 401
 
-@app.route("/api/appointments", methods=["GET"])
+@bp.route("/api/appointments", methods=["GET"])
 def get_appointments():
     # Get query parameters
     q = request.args.get('q', '')
@@ -251,7 +317,7 @@ def get_appointments():
     count_sql = f"SELECT COUNT(*) AS c {base_sql}"
     
     try:
-        with get_conn() as conn:
+        with REPORTING.connect("appointments") as conn:
             # Get total count
             total = conn.execute(count_sql, tuple(args)).fetchone()["c"]
             
@@ -265,7 +331,6 @@ def get_appointments():
                 # Ensure image_paths is a list
                 if appointment.get('image_paths'):
                     try:
-                        import json
                         appointment['image_paths'] = json.loads(appointment['image_paths'])
                     except:
                         appointment['image_paths'] = []
@@ -284,7 +349,7 @@ def get_appointments():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/appointments/search", methods=["GET"])
+@bp.route("/api/appointments/search", methods=["GET"])
 def search_appointments():
     """Staff endpoint to search appointments by phone or ticket"""
     phone = request.args.get('phone')
@@ -315,7 +380,6 @@ def search_appointments():
                 # Ensure image_paths is a list
                 if appointment.get('image_paths'):
                     try:
-                        import json
                         appointment['image_paths'] = json.loads(appointment['image_paths'])
                     except:
                         appointment['image_paths'] = []
@@ -327,7 +391,52 @@ def search_appointments():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/appointments", methods=["POST"])
+def _search_clinic(clinic, national_id):
+    conn = clinic.get_conn()
+    try:
+        schema.ensure(conn, NATIONAL_ID_MIGRATION)
+        rows = conn.execute(
+            "SELECT * FROM appointments WHERE national_id = ? ORDER BY created_at DESC",
+            (national_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        try:
+            row['image_paths'] = json.loads(row['image_paths']) if row.get('image_paths') else []
+        except ValueError:
+            row['image_paths'] = []
+    return rows
+
+def search_pool():
+    global _search_pool
+    if _search_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _search_pool = ThreadPoolExecutor(max_workers=CLINIC_SEARCH_WORKERS, thread_name_prefix="clinic-search")
+    return _search_pool
+
+@bp.route("/api/clinics", methods=["GET"])
+def list_clinics():
+    return jsonify([{"id": c.id, "default": c is services.DEFAULT} for c in services.CLINICS.values()])
+
+@bp.route("/api/clinics/search", methods=["GET"])
+def search_clinics():
+    """Every appointment of a national ID in every branch, searched in parallel"""
+    national_id = (request.args.get('national_id') or '').strip()
+    if not (national_id.isdigit() and len(national_id) == 14):
+        return jsonify({"error": "National ID must be 14 digits"}), 400
+
+    futures = {c.id: search_pool().submit(_search_clinic, c, national_id) for c in services.CLINICS.values()}
+    results, errors = {}, {}
+    for clinic_id, fut in futures.items():
+        try:
+            results[clinic_id] = fut.result(timeout=CLINIC_SEARCH_TIMEOUT)
+        except Exception as e:  # one branch down must not hide the others
+            errors[clinic_id] = str(e) or type(e).__name__
+    return jsonify({"national_id": national_id, "clinics": results, "errors": errors})
+
+@bp.route("/api/appointments", methods=["POST"])
+@idempotent("staff-create")
 def create_appointment():
     """Staff endpoint to create new appointments"""
     data = request.get_json()
@@ -351,114 +460,149 @@ def create_appointment():
         return jsonify({"error": "Phone must be 11 digits starting with 0 (e.g., 01XXXXXXXXX)"}), 400
     
     try:
+        SLOTS.prepare()
+        PENDING.prepare()
+        STORAGE.prepare()
+        after = AfterCommit()
         with get_conn() as conn:
-            # Check for duplicate appointments (national_id + non-completed)
-            existing = conn.execute(
-                """
-                SELECT id, ticket_number, scheduled_date FROM appointments
-                WHERE national_id=? AND COALESCE(status,'pending') != 'completed'
-                ORDER BY created_at DESC
-                """,
-                (national_id,),
-            ).fetchall()
-            
-            if existing:
-                return jsonify({
-                    "error": "Patient already has a pending appointment. Please complete the current appointment before creating a new one.",
-                    "ticket_number": str(existing[0]["ticket_number"]),
-                    "scheduled_date": existing[0]["scheduled_date"],
-                    "duplicate": True
-                }), 409
-            
             # Automatically assign the next available date
-            scheduled_date = get_next_available_date(conn)
+            try:
+                scheduled_date = get_next_available_date(conn)
+            except NoAvailability as exc:
+                return jsonify({"error": str(exc)}), 409
             ticket_number = make_ticket(scheduled_date, national_id, conn)
+            day = dt.date.fromisoformat(scheduled_date)
+            tx = SQLiteStorage.on(conn)  # the seat and the row in one transaction
             
-            # Insert appointment
-            cursor = conn.execute(
-                """
-                INSERT INTO appointments (ticket_number, name, phone, phone_text, national_id, symptoms, image_paths, voice_note_path, status, scheduled_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    ticket_number,
-                    name,
-                    phone,  # Store in both phone and phone_text for compatibility
-                    phone,  # Store normalized phone in phone_text
-                    national_id,
-                    data.get('symptoms', ''),
-                    None,  # image_paths
-                    None,  # voice_note_path
-                    'pending',
-                    scheduled_date
-                )
-            )
-            conn.commit()
-            
-            # Get the created appointment
-            appointment = conn.execute("SELECT * FROM appointments WHERE id = ?", (cursor.lastrowid,)).fetchone()
+            # Insert appointment in the first free time slot of that date
+            def insert(slot_time, slot_chair):
+                return tx.insert_appointment({
+                    "ticket_number": ticket_number,
+                    "name": name,
+                    "phone": phone,  # Store in both phone and phone_text for compatibility
+                    "phone_text": phone,  # Store normalized phone in phone_text
+                    "national_id": national_id,
+                    "symptoms": data.get('symptoms', ''),
+                    "status": 'pending',
+                    "scheduled_date": scheduled_date,
+                    "slot_time": slot_time,
+                    "slot_chair": slot_chair,
+                })
             
-            return jsonify({
-                "message": "Appointment created successfully",
-                "appointment": dict(appointment)
-            }), 201
+            # Duplicate rule: one PENDING appointment per national_id (see pending_rule.py).
+            # The insert enforces it; check() only looks while the index cannot be built.
+            existing = PENDING.check(conn, national_id)
+            if existing is not None:
+                return duplicate_response(existing)
+            try:
+                appointment, slot_time, slot_chair = SLOTS.book(conn, day, insert)
+            except PendingConflict as exc:
+                return duplicate_response(exc.existing)
+            except SlotsFull as exc:
+                return jsonify({"error": f"{exc.day.isoformat()} is fully booked"}), 409
+            after.on_rollback(lambda: SLOTS.release(day, slot_time, slot_chair))
+            try:
+                conn.commit()
+            except BaseException:
+                after.rolled_back()
+                raise
+            after.committed()
+        appointments_changed()
+        
+        return jsonify({
+            "message": "Appointment created successfully",
+            "appointment": appointment
+        }), 201
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/appointments/<int:appointment_id>", methods=["PUT", "DELETE"])
+@bp.route("/api/appointments/<int:appointment_id>", methods=["PUT", "DELETE"])
 def update_appointment(appointment_id):
     if request.method == "PUT":
-        import re
-        import datetime
-        try:
-            from zoneinfo import ZoneInfo  # py3.9+
-        except ImportError:
-            from backports.zoneinfo import ZoneInfo  # if needed: pip install backports.zoneinfo
-
-        CAIRO = ZoneInfo("Africa/Cairo")
-        
         body = request.get_json(force=True, silent=True) or {}
         status = body.get("status")
         use_now = bool(body.get("use_now"))
         manual = body.get("completion_hour")  # "HH:MM"
         procedures_done = body.get("procedures_done")
 
-        fields, params = [], []
+        changes = {}
 
         # include your existing editable fields handling here, e.g.:
         for key in ("name","phone","symptoms","image_paths","voice_note_path","scheduled_date"):
             if key in body and body[key] is not None:
-                fields.append(f"{key} = ?"); params.append(body[key])
+                changes[key] = body[key]
+        if isinstance(changes.get("image_paths"), str):
+            changes["image_paths"] = decode_image_paths(changes["image_paths"])
+
+        new_date = body.get("scheduled_date")
+        if new_date is not None:
+            try:
+                new_day = dt.date.fromisoformat(new_date)
+            except (TypeError, ValueError):
+                return jsonify({"message": "scheduled_date must be YYYY-MM-DD"}), 400
 
         if status is not None:
-            fields.append("status = ?"); params.append(status)
+            changes["status"] = status
 
         if status == "completed":
             if use_now:
-                now_hhmm = datetime.datetime.now(CAIRO).strftime("%H:%M")
-                fields.append("completion_hour = ?"); params.append(now_hhmm)
+                changes["completion_hour"] = dt.datetime.now(CAIRO).strftime("%H:%M")
             else:
-                if not manual or not re.match(r"^([01]\d|2[0-3]):[0-5]\d$", manual):
+                if not manual or not HHMM_RE.match(manual):
                     return jsonify({"message": "completion_hour must be HH:MM (24h) or set use_now=true"}), 400
-                fields.append("completion_hour = ?"); params.append(manual)
+                changes["completion_hour"] = manual
 
-            if procedures_done:
-                fields.append("symptoms = COALESCE(symptoms,'') || ?")
-                params.append(f"\nProcedures: {procedures_done}")
-
-        if not fields:
+        if not changes:
             return jsonify({"message": "No changes"}), 400
 
-        params.append(appointment_id)
-        
         try:
+            SLOTS.prepare()
+            STORAGE.prepare()
+            after = AfterCommit()
             with get_conn() as conn:
-                conn.execute(f"UPDATE appointments SET {', '.join(fields)} WHERE id = ?", params)
-                conn.commit()
-                
-                # Get updated appointment
-                updated = conn.execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+                tx = SQLiteStorage.on(conn)  # the seat and the row in one transaction
+                before = tx.get_appointment(appointment_id)
+                if before is None:
+                    return jsonify({"error": "Appointment not found"}), 404
+                if status == "pending" and before["national_id"]:
+                    existing = PENDING.check(conn, before["national_id"], appointment_id)
+                    if existing is not None:
+                        return duplicate_response(existing)
+
+                def update(slot_time, slot_chair):
+                    return tx.update_appointment(appointment_id, {**changes, "slot_time": slot_time, "slot_chair": slot_chair})
+
+                try:
+                    if new_date is not None and new_date != before["scheduled_date"]:
+                        # A new date must have room; it gives up the old seat and takes the first free one there
+                        check_capacity(new_date, conn)
+                        updated, slot_time, slot_chair = SLOTS.book(conn, new_day, update)
+                        after.on_rollback(lambda: SLOTS.release(new_day, slot_time, slot_chair))
+                        if before["slot_time"]:
+                            old_day = dt.date.fromisoformat(before["scheduled_date"])
+                            after.on_commit(lambda: SLOTS.release(old_day, before["slot_time"], before["slot_chair"]))
+                    else:
+                        updated = tx.update_appointment(appointment_id, changes)
+                    if status == "completed" and procedures_done:
+                        # Appended by the UPDATE itself, after any symptoms sent in this body
+                        updated = tx.append_symptoms(appointment_id, f"\nProcedures: {procedures_done}")
+                except PendingConflict as exc:
+                    # Setting an appointment back to pending while the patient has another pending one
+                    return duplicate_response(exc.existing)
+                except CapacityError as exc:
+                    return jsonify({"error": str(exc)}), 409
+                except SlotsFull as exc:
+                    return jsonify({"error": f"{exc.day.isoformat()} is fully booked"}), 409
+                try:
+                    conn.commit()
+                except BaseException:
+                    after.rolled_back()
+                    raise
+                after.committed()
+            appointments_changed()
+            if updated is None:  # deleted meanwhile
+                return jsonify({"error": "Appointment not found"}), 404
                 
             return jsonify({"ok": True, "message": f"Appointment {appointment_id} updated", "data": updated}), 200
         except Exception as e:
@@ -466,28 +610,46 @@ def update_appointment(appointment_id):
     
     elif request.method == "DELETE":
         try:
-            with get_conn() as conn:
-                cursor = conn.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
-                conn.commit()
-                
-                if cursor.rowcount == 0:
-                    return jsonify({"error": "Appointment not found"}), 404
+            SLOTS.prepare()
+            row = STORAGE.delete_appointment(appointment_id)
+            if row is None:
+                return jsonify({"error": "Appointment not found"}), 404
+            appointments_changed()
+            if row["slot_time"]:
+                SLOTS.release(dt.date.fromisoformat(row["scheduled_date"]), row["slot_time"], row["slot_chair"])
                     
             return jsonify({"message": f"Appointment {appointment_id} deleted"}), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
-@app.route("/api/capacity", methods=["GET"])
-@app.route("/api/capacity/<day_name>", methods=["PUT"])
+@bp.route("/api/capacity", methods=["GET"])
+@bp.route("/api/capacity/<day_name>", methods=["PUT"])
 def manage_capacity(day_name=None):
     WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     
     if request.method == "GET":
         try:
-            with get_conn() as conn:
-                rows = conn.execute("SELECT day_name, capacity FROM daily_capacity").fetchall()
+            # ?from=&to= returns the effective per-date capacity (overrides applied)
+            if request.args.get("from") or request.args.get("to"):
+                try:
+                    first = dt.date.fromisoformat(request.args.get("from") or dt.date.today().isoformat())
+                    last = dt.date.fromisoformat(request.args.get("to") or (first + dt.timedelta(days=30)).isoformat())
+                except ValueError:
+                    return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+                if last < first or (last - first).days > 366:
+                    return jsonify({"error": "Range must be 0-366 days"}), 400
+                data = []
+                for i in range((last - first).days + 1):
+                    day = first + dt.timedelta(days=i)
+                    data.append({
+                        "date": day.isoformat(),
+                        "day": WEEK[day.weekday()],
+                        "capacity": CAPACITY.for_date(day, 0),
+                        "override": CAPACITY.override_for(day),
+                    })
+                return jsonify(data)
             
-            existing = {r["day_name"]: r["capacity"] for r in rows}
+            existing = CAPACITY.get()
             data = [{"day": d, "capacity": int(existing.get(d, 0) or 0)} for d in WEEK]
             
             return jsonify(data)
@@ -508,16 +670,144 @@ def manage_capacity(day_name=None):
                     (day_name, capacity)
                 )
                 conn.commit()
+            CAPACITY.invalidate()
             
             return jsonify({"message": f"Capacity for {day_name} updated to {capacity}"}), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
-@app.route("/api/dashboard", methods=["GET"])
+@bp.route("/api/capacity/recommendations", methods=["GET"])
+def get_capacity_recommendations():
+    """Suggested capacity per weekday and the upcoming days expected to overflow"""
+    try:
+        CAPACITY.get()
+        return jsonify(recommender().get())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route("/api/capacity/overrides", methods=["GET", "POST"])
+@bp.route("/api/capacity/overrides/<int:override_id>", methods=["DELETE"])
+def manage_capacity_overrides(override_id=None):
+    """Date-specific capacity (holidays, doctor leave) that replaces the weekday value"""
+    CAPACITY.get()  # first load also creates capacity_overrides
+    
+    if request.method == "GET":
+        try:
+            return jsonify(CAPACITY.overrides())
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    
+    elif request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        capacity = data.get('capacity')
+        try:
+            start_date = dt.date.fromisoformat(str(data.get('start_date') or ''))
+            end_date = dt.date.fromisoformat(str(data.get('end_date') or start_date.isoformat()))
+        except ValueError:
+            return jsonify({"error": "start_date/end_date must be YYYY-MM-DD"}), 400
+        
+        if end_date < start_date:
+            return jsonify({"error": "end_date must not be before start_date"}), 400
+        if not isinstance(capacity, int) or capacity < 0:
+            return jsonify({"error": "Capacity must be a non-negative integer"}), 400
+        
+        try:
+            with get_conn() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO capacity_overrides (start_date, end_date, capacity, reason) VALUES (?, ?, ?, ?)",
+                    (start_date.isoformat(), end_date.isoformat(), capacity, (data.get('reason') or '').strip() or None)
+                )
+                conn.commit()
+            CAPACITY.invalidate()
+            
+            return jsonify({
+                "id": cursor.lastrowid,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "capacity": capacity,
+                "reason": (data.get('reason') or '').strip() or None
+            }), 201
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    
+    elif request.method == "DELETE":
+        try:
+            with get_conn() as conn:
+                cursor = conn.execute("DELETE FROM capacity_overrides WHERE id = ?", (override_id,))
+                conn.commit()
+                
+                if cursor.rowcount == 0:
+                    return jsonify({"error": "Override not found"}), 404
+            CAPACITY.invalidate()
+            
+            return jsonify({"message": f"Capacity override {override_id} deleted"}), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+@bp.route("/api/slot-templates", methods=["GET"])
+@bp.route("/api/slot-templates/<day_name>", methods=["PUT", "DELETE"])
+def manage_slot_templates(day_name=None):
+    """Per-weekday time slots, e.g. PUT {"start_time": "09:00", "slot_minutes": 20, "slot_count": 24, "chairs": 2}"""
+    templates = CAPACITY.slot_templates()  # first load also creates slot_templates
+    
+    if request.method == "GET":
+        return jsonify([
+            dict({"day": d}, **templates[d].as_dict()) if d in templates else {"day": d, "slots": None}
+            for d in WEEK
+        ])
+    
+    if day_name not in WEEK:
+        return jsonify({"error": f"day_name must be one of {', '.join(WEEK)}"}), 400
+    
+    if request.method == "PUT":
+        data = request.get_json(silent=True) or {}
+        row = {
+            "start_time": data.get('start_time'),
+            "slot_minutes": data.get('slot_minutes'),
+            "slot_count": data.get('slot_count'),
+            "chairs": data.get('chairs', 1),
+        }
+        if not all(isinstance(row[k], int) for k in ("slot_minutes", "slot_count", "chairs")):
+            return jsonify({"error": "slot_minutes, slot_count and chairs must be integers"}), 400
+        try:
+            template = slots.SlotTemplate.from_row(row)
+        except (TypeError, ValueError):
+            return jsonify({"error": "start_time must be HH:MM and all slots must fit in the day"}), 400
+        
+        try:
+            with get_conn() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO slot_templates (day_name, start_time, slot_minutes, slot_count, chairs) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(day_name) DO UPDATE SET start_time=excluded.start_time, slot_minutes=excluded.slot_minutes,
+                        slot_count=excluded.slot_count, chairs=excluded.chairs
+                    """,
+                    (day_name, template.time_of(0), template.slot_minutes, template.slot_count, template.chairs)
+                )
+                conn.commit()
+            CAPACITY.invalidate()
+            
+            return jsonify(dict({"day": day_name}, **template.as_dict())), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    
+    elif request.method == "DELETE":
+        try:
+            with get_conn() as conn:
+                conn.execute("DELETE FROM slot_templates WHERE day_name = ?", (day_name,))
+                conn.commit()
+            CAPACITY.invalidate()
+            
+            return jsonify({"message": f"Time slots for {day_name} removed"}), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+@bp.route("/api/dashboard", methods=["GET"])
 def get_dashboard_data():
     """Get comprehensive dashboard data from the database"""
     try:
-        with get_conn() as conn:
+        SLOTS.prepare()
+        with REPORTING.connect("dashboard") as conn:
             # Get today's date
             today = dt.date.today().isoformat()
             
@@ -544,7 +834,7 @@ def get_dashboard_data():
             recent_appointments = conn.execute(
                 """
                 SELECT id, ticket_number, name, phone_text as phone, national_id, 
-                       scheduled_date, status, symptoms, created_at
+                       scheduled_date, slot_time, slot_chair, status, symptoms, created_at
                 FROM appointments 
                 ORDER BY created_at DESC 
                 LIMIT 10
@@ -555,10 +845,10 @@ def get_dashboard_data():
             today_appointments_details = conn.execute(
                 """
                 SELECT id, ticket_number, name, phone_text as phone, national_id,
-                       scheduled_date, status, symptoms, created_at, completion_hour
+                       scheduled_date, slot_time, slot_chair, status, symptoms, created_at, completion_hour
                 FROM appointments 
                 WHERE scheduled_date = ?
-                ORDER BY created_at ASC
+                ORDER BY slot_time IS NULL, slot_time ASC, slot_chair ASC, created_at ASC
                 """,
                 (today,)
             ).fetchall()
@@ -585,22 +875,11 @@ def get_dashboard_data():
                 (week_ago,)
             ).fetchall()
             
-            # 9. Capacity information
-            capacity_info = conn.execute(
-                """
-                SELECT day_name, capacity FROM daily_capacity
-                ORDER BY 
-                CASE day_name
-                    WHEN 'Monday' THEN 1
-                    WHEN 'Tuesday' THEN 2
-                    WHEN 'Wednesday' THEN 3
-                    WHEN 'Thursday' THEN 4
-                    WHEN 'Friday' THEN 5
-                    WHEN 'Saturday' THEN 6
-                    WHEN 'Sunday' THEN 7
-                END
-                """
-            ).fetchall()
+            # 9. Capacity information (Monday..Sunday order)
+            capacity_by_day = CAPACITY.get()
+            capacity_info = [
+                {"day_name": d, "capacity": capacity_by_day[d]} for d in WEEK if d in capacity_by_day
+            ]
             
             # 10. Today's capacity usage
             today_capacity_used = conn.execute(
@@ -612,12 +891,7 @@ def get_dashboard_data():
             ).fetchone()["used"]
             
             # Get today's capacity
-            today_day = WEEK[dt.date.today().weekday()]
-            today_capacity = conn.execute(
-                "SELECT capacity FROM daily_capacity WHERE day_name = ?", 
-                (today_day,)
-            ).fetchone()
-            today_capacity_value = today_capacity["capacity"] if today_capacity else 10
+            today_capacity_value = CAPACITY.for_date(dt.date.today(), 10)
             
             # Format the response
             dashboard_data = {
@@ -634,7 +908,7 @@ def get_dashboard_data():
                 "today_appointments": [dict(row) for row in today_appointments_details],
                 "status_counts": [dict(row) for row in status_counts],
                 "daily_counts": [dict(row) for row in daily_counts],
-                "capacity_info": [dict(row) for row in capacity_info],
+                "capacity_info": capacity_info,
                 "last_updated": dt.datetime.utcnow().isoformat() + "Z"
             }
             
@@ -643,11 +917,11 @@ def get_dashboard_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/dashboard/stats", methods=["GET"])
+@bp.route("/api/dashboard/stats", methods=["GET"])
 def get_dashboard_stats():
     """Get quick stats for dashboard widgets"""
     try:
-        with get_conn() as conn:
+        with REPORTING.connect("dashboard_stats") as conn:
             today = dt.date.today().isoformat()
             
             # Quick stats query
@@ -673,30 +947,97 @@ def get_dashboard_stats():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/uploads/images/<filename>", methods=["GET"])
+@bp.route("/api/reports", methods=["GET"])
+def get_reports():
+    """Booked/completed/pending/no-show per day, week or month, read from daily_rollups only"""
+    import reports  # loaded on first use
+
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in reports.GRANULARITIES:
+        return jsonify({"error": "granularity must be day, week or month"}), 400
+    
+    today = dt.date.today()
+    try:
+        last = dt.date.fromisoformat(request.args.get('to') or today.isoformat())
+        first = dt.date.fromisoformat(request.args.get('from') or (last - dt.timedelta(days=365)).isoformat())
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if last < first or (last - first).days > 3660:
+        return jsonify({"error": "Range must be 0-10 years"}), 400
+    
+    try:
+        reports.ensure_rollups(get_conn)  # first call backfills from appointments
+        with REPORTING.connect("reports") as conn:
+            rows = reports.query(conn, granularity, first, last, today)
+        
+        return jsonify({
+            "granularity": granularity,
+            "from": first.isoformat(),
+            "to": last.isoformat(),
+            "periods": rows
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route("/uploads/images/<filename>", methods=["GET"])
 def uploaded_image(filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'images')
     return send_from_directory(upload_dir, filename)
 
-@app.route("/uploads/voices/<filename>", methods=["GET"])
+@bp.route("/uploads/voices/<filename>", methods=["GET"])
 def uploaded_voice(filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'voices')
     return send_from_directory(upload_dir, filename)
 
+@bp.route("/api/patients/<national_id>/attachments.zip", methods=["GET"])
+@require_role("staff")
+def patient_attachments_zip(national_id):
+    """All of a patient's images and voice notes as one ZIP, streamed (see attachments_zip.py)"""
+    if not (national_id.isdigit() and len(national_id) == 14):
+        return jsonify({"error": "National ID must be 14 digits"}), 400
+    try:
+        first = dt.date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        last = dt.date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+
+    sql = ("SELECT id, ticket_number, scheduled_date, image_paths, voice_note_path FROM appointments "
+           "WHERE national_id = ?")
+    args = [national_id]
+    if first:
+        sql += " AND scheduled_date >= ?"
+        args.append(first.isoformat())
+    if last:
+        sql += " AND scheduled_date <= ?"
+        args.append(last.isoformat())
+    with REPORTING.connect("attachments") as conn:
+        rows = conn.execute(sql + " ORDER BY scheduled_date, id", args).fetchall()
+    for row in rows:
+        row["image_paths"] = decode_image_paths(row["image_paths"])
+
+    files = [(name, path) for name, path in attachments_zip.entries(rows) if os.path.isfile(path)]
+    if not files:
+        return jsonify({"error": "No attachments for this patient in that range"}), 404
+    suffix = (f"_from-{first}" if first else "") + (f"_to-{last}" if last else "")
+    resp = current_app.response_class(attachments_zip.stream(files), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = f'attachment; filename="patient_{national_id}{suffix}_attachments.zip"'
+    resp.headers["Cache-Control"] = "private, no-store"
+    return resp
+
 # ------------- PATIENT FILE SERVING ENDPOINTS -------------
-@app.route("/uploads/patients/<patient_folder>/images/<filename>", methods=["GET"])
+@bp.route("/uploads/patients/<patient_folder>/images/<filename>", methods=["GET"])
 def uploaded_patient_image(patient_folder, filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'patients', patient_folder, 'images')
     return send_from_directory(upload_dir, filename)
 
-@app.route("/uploads/patients/<patient_folder>/voices/<filename>", methods=["GET"])
+@bp.route("/uploads/patients/<patient_folder>/voices/<filename>", methods=["GET"])
 def uploaded_patient_voice(patient_folder, filename):
     upload_dir = os.path.join(os.path.dirname(__file__), 'yarab', 'uploads', 'patients', patient_folder, 'voices')
     return send_from_directory(upload_dir, filename)
 
 # ------------- STATIC FILES (STAFF REACT UI) -------------
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
+@bp.route("/", defaults={"path": ""})
+@bp.route("/<path:path>")
 def serve_staff_ui(path):
     # Don't serve index.html for API routes or uploads
     if path.startswith("api") or path.startswith("uploads"):
@@ -704,17 +1045,51 @@ def serve_staff_ui(path):
 
     # For static assets (JS, CSS, images, etc.), serve them if they exist
     if path and not path.endswith('/'):
-        full = os.path.join(app.static_folder, path)
+        full = os.path.join(current_app.static_folder, path)
         if os.path.exists(full) and os.path.isfile(full):
-            return send_from_directory(app.static_folder, path)
+            return send_from_directory(current_app.static_folder, path)
 
     # For all other routes (including client-side routes), serve index.html
     # This allows React Router to handle client-side routing
-    index_path = os.path.join(app.static_folder, "index.html")
+    index_path = os.path.join(current_app.static_folder, "index.html")
     if not os.path.exists(index_path):
         return "Build not found: {}".format(index_path), 500
-    return send_from_directory(app.static_folder, "index.html")
+    return send_from_directory(current_app.static_folder, "index.html")
+
+# ------------- APP FACTORY -------------
+
+def create_app(config=None):
+    """
+    Build the staff app. `config` (a mapping) is applied over the defaults.
+    Caches and background services are module-level, so every app built in
+    one process shares them.
+    """
+    app = Flask(__name__, static_folder=STAFF_DIST, static_url_path="")
+    # Session configuration for staff authentication
+    app.config.update(
+        SECRET_KEY=os.getenv("FLASK_SECRET", "change-me"),
+        SESSION_COOKIE_SAMESITE="Lax",
+        SESSION_COOKIE_SECURE=False,
+    )
+    app.config.update(config or {})
+    app.register_blueprint(bp)
+    app.register_blueprint(bp, url_prefix="/clinics/<clinic_id>", name="staff_clinic")
+
+    # Request/SQL timing, exposed at /api/metrics for both apps in this process
+    metrics.init_app(app, "staff", endpoint=True, guard=require_role("staff"))
+    if os.getenv("STAFF_JOBS", "create_app").lower() == "create_app":
+        start_background_jobs()
+    return app
+
+def __getattr__(name):
+    # `app` is built on first access (gunicorn "app_staff:app", older scripts);
+    # serve.py and combined.py call create_app() and never pay for a second one
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     print("[staff] serving UI from:", STAFF_DIST)
-    app.run(host="127.0.0.1", port=5001, debug=True)
\ No newline at end of file
+    create_app().run(host="127.0.0.1", port=5001, debug=True)
\ No newline at end of file
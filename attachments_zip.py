@@ -0,0 +1,84 @@
+"""
+A patient's photos and voice notes as one ZIP, streamed while it is built.
+
+    GET /api/patients/<national_id>/attachments.zip[?from=YYYY-MM-DD&to=YYYY-MM-DD]   (staff)
+
+Files go into the archive stored, not compressed: JPEG, WebP and WebM are
+compressed already, and deflating them again would cost CPU for nothing.
+zipfile writes into a sink that is emptied after every 64 KB block, so
+memory stays the same whatever the archive size. There is no
+Content-Length, because the size is not known until the last file is in.
+Files are grouped by appointment:
+
+    2026-10-19_ticket-202610190012345/images/img_20261019101737.webp
+    2026-10-19_ticket-202610190012345/voices/voice_20261019101737.webm
+
+The from/to filters apply to the appointment's scheduled date.
+"""
+import os
+import zipfile
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+BASE = os.path.join(HERE, "yarab")  # stored paths are relative to this ("uploads/patients/...")
+UPLOADS = os.path.join(BASE, "uploads")
+BLOCK = 64 * 1024
+
+
+class _Sink:
+    """Write-only, unseekable file object; zipfile then writes data descriptors instead of seeking back."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def entries(rows, base=BASE):
+    """
+    (archive name, file path) for each stored file of `rows`
+    ({id, ticket_number, scheduled_date, image_paths: [...], voice_note_path}).
+    Paths outside the uploads tree are ignored.
+    """
+    uploads = os.path.join(base, "uploads") + os.sep
+    for row in rows:
+        folder = f"{row['scheduled_date'] or 'undated'}_ticket-{row['ticket_number'] or row['id']}"
+        stored = [("images", p) for p in row["image_paths"]]
+        if row.get("voice_note_path"):
+            stored.append(("voices", row["voice_note_path"]))
+        for kind, rel in stored:
+            path = os.path.realpath(os.path.join(base, *str(rel).split("/")))
+            if path.startswith(uploads):
+                yield f"{folder}/{kind}/{os.path.basename(path)}", path
+
+
+def stream(files):
+    """Yield a ZIP of `files` [(archive name, path)] chunk by chunk; missing files are skipped."""
+    sink = _Sink()
+    seen = set()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for arcname, path in files:
+            if arcname in seen:
+                continue
+            try:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                src = open(path, "rb")
+            except OSError:  # deleted or moved since the query
+                continue
+            seen.add(arcname)
+            info.compress_type = zipfile.ZIP_STORED
+            with src, zf.open(info, "w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dst:
+                for block in iter(lambda: src.read(BLOCK), b""):
+                    dst.write(block)
+                    yield sink.drain()
+            yield sink.drain()  # data descriptor
+    yield sink.drain()  # central directory
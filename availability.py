@@ -0,0 +1,143 @@
+"""
+Precomputed per-date availability for the booking horizon.
+
+`booked[i]` is the number of appointments on `start + i days` for the next
+HORIZON_DAYS days (one GROUP BY to build). Remaining slots are capacity minus
+booked, with capacity coming from the caller's `capacity_for(date)`. The
+array is kept current in two ways:
+  - writers in this process call add(date, +1/-1) once their insert/delete has committed
+  - a background thread watches PRAGMA data_version and rebuilds when another
+    connection (the staff app, a script) committed, at most every
+    AVAILABILITY_REFRESH_SECONDS
+The index is a fast path, not the source of truth: booking confirms the
+chosen date with one COUNT before using it.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+from array import array
+
+import schema
+from refresher import DataVersionWatcher
+
+HORIZON_DAYS = 366
+MIGRATION = "2026-10-19_add_scheduled_date_index.sql"
+
+
+def etag(days) -> str:
+    """
+    ETag for a days() result, taken from its content: the same counts and
+    capacities give the same tag in every worker and after a restart.
+    """
+    body = json.dumps(days, separators=(",", ":")).encode()
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class AvailabilityIndex:
+    def __init__(self, connect, capacity_for, horizon_days=HORIZON_DAYS, refresh_seconds=None):
+        """
+        connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn)
+        capacity_for: (datetime.date) -> int
+        """
+        self.connect = connect
+        self.capacity_for = capacity_for
+        self.horizon_days = horizon_days
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None else float(os.getenv("AVAILABILITY_REFRESH_SECONDS", "2"))
+        )
+        self._lock = threading.Lock()
+        self._state = None  # (start date, booked array), swapped atomically
+        self._watcher = DataVersionWatcher("availability-refresh", connect, self._poll, self.refresh_seconds)
+
+    # ------------- reads -------------
+
+    def _current(self):
+        state = self._state
+        if state is None or state[0] != dt.date.today():  # first use or the day rolled over
+            self.rebuild()
+            self._watcher.start()
+            state = self._state
+        return state
+
+    def booked(self, day: dt.date) -> int:
+        start, booked = self._current()
+        i = (day - start).days
+        return booked[i] if 0 <= i < len(booked) else 0
+
+    def remaining(self, day: dt.date) -> int:
+        return max(self.capacity_for(day) - self.booked(day), 0)
+
+    def days(self, first: dt.date, last: dt.date):
+        """[{date, capacity, booked, remaining}] for first..last (inclusive, clamped to the horizon)."""
+        start, booked = self._current()
+        lo = max((first - start).days, 0)
+        hi = min((last - start).days, len(booked) - 1)
+        out = []
+        for i in range(lo, hi + 1):
+            day = start + dt.timedelta(days=i)
+            cap = self.capacity_for(day)
+            out.append({"date": day.isoformat(), "capacity": cap, "booked": booked[i], "remaining": max(cap - booked[i], 0)})
+        return out
+
+    # ------------- writes -------------
+
+    def add(self, day, delta=1):
+        """Adjust the booked count for `day` (date or ISO string) after a local write."""
+        if isinstance(day, str):
+            day = dt.date.fromisoformat(day)
+        with self._lock:
+            if self._state is None:
+                return
+            start, booked = self._state
+            i = (day - start).days
+            if 0 <= i < len(booked):
+                booked[i] = max(booked[i] + delta, 0)
+
+    def set_booked(self, day: dt.date, count: int):
+        """Correct one date from an authoritative COUNT."""
+        with self._lock:
+            if self._state is None:
+                return
+            start, booked = self._state
+            i = (day - start).days
+            if 0 <= i < len(booked) and booked[i] != count:
+                booked[i] = count
+
+    def invalidate(self):
+        """Forget the snapshot (after a write the caller cannot express as add()); the next read rebuilds."""
+        with self._lock:
+            self._state = None
+
+    def rebuild(self):
+        start = dt.date.today()
+        end = start + dt.timedelta(days=self.horizon_days - 1)
+        conn = self.connect()
+        try:
+            schema.ensure(conn, MIGRATION)
+            rows = conn.execute(
+                """
+                SELECT scheduled_date, COUNT(*) AS c FROM appointments
+                 WHERE scheduled_date BETWEEN ? AND ?
+                 GROUP BY scheduled_date
+                """,
+                (start.isoformat(), end.isoformat()),
+            ).fetchall()
+        finally:
+            conn.close()
+        booked = array("l", [0]) * self.horizon_days
+        for r in rows:
+            try:
+                booked[(dt.date.fromisoformat(r["scheduled_date"]) - start).days] = r["c"]
+            except (TypeError, ValueError):
+                continue  # malformed scheduled_date
+        with self._lock:
+            self._state = (start, booked)
+
+    # ------------- cross-process refresh -------------
+
+    def _poll(self, conn, changed):
+        state = self._state
+        if changed or state is None or state[0] != dt.date.today():
+            self.rebuild()
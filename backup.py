@@ -0,0 +1,342 @@
+"""
+Online backups of the appointments database with the SQLite backup API.
+
+A backup copies BACKUP_PAGES pages per step and sleeps BACKUP_STEP_SLEEP_MS
+between steps, so each step holds the source's read lock only briefly and
+bookings keep committing while it runs. If another connection writes in
+between, SQLite restarts the copy from the first page. After
+BACKUP_MAX_RESTARTS restarts the job copies everything in one step instead;
+in WAL mode that step is a single read transaction, so writers still do not
+wait for it.
+
+Each snapshot is written as <dir>/<db name>-<UTC timestamp>.db. Every clinic
+but the default one gets its own <dir>/<clinic id>/, so two clinics whose
+databases share a file name never mix snapshots. The name ends in .partial until the copy is complete and passes PRAGMA quick_check.
+Next to it is a .sha256 file in `sha256sum` format. Only the newest
+BACKUP_KEEP snapshots are kept.
+
+    python backup.py now     [--db yarab/dental_appointments.db | --clinic ID] [--dir yarab/backups]
+    python backup.py list    [--db ... | --clinic ID] [--dir yarab/backups]
+    python backup.py verify  [--db ... | --clinic ID] [--dir yarab/backups] [FILE ...]
+    python backup.py restore [--db ... | --clinic ID] [--dir ...] (--file FILE | --at 2026-10-19T08:00 | --latest)
+
+With BACKUP_INTERVAL_MINUTES > 0 the staff app also runs the job in a
+background thread (see BackupJob.start). A lock file per database in the backup
+directory makes sure only one process takes a given backup. Metrics go to /api/metrics:
+  - backup_duration_seconds, backup_restarts_total, backup_failures_total
+  - backup_last_success_timestamp and backup_last_bytes
+  - http_request_duration_during_job_seconds{job="backup"}: latency of
+    requests served while a backup runs. Compare it with
+    http_request_duration_seconds to see what a backup costs live traffic.
+"""
+import argparse
+import datetime as dt
+import glob
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from metrics import REGISTRY
+from schema import ro_uri
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_DB = os.path.join(HERE, "yarab", "dental_appointments.db")
+STAMP = "%Y%m%dT%H%M%SZ"
+LOCK_STALE_SECONDS = 6 * 3600  # a lock this old was left by a crashed process
+
+log = logging.getLogger(__name__)
+
+
+class BackupError(Exception):
+    pass
+
+
+def sha256_file(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _stem(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def snapshots(backup_dir, db_path=DEFAULT_DB):
+    """[(taken_at UTC datetime, path)] of complete snapshots, oldest first."""
+    out = []
+    prefix = _stem(db_path) + "-"
+    for path in glob.glob(os.path.join(backup_dir, prefix + "*.db")):
+        try:
+            taken = dt.datetime.strptime(os.path.basename(path)[len(prefix):-3], STAMP).replace(tzinfo=dt.timezone.utc)
+        except ValueError:
+            continue
+        out.append((taken, path))
+    return sorted(out)
+
+
+def verify(path):
+    """Raise BackupError unless `path` matches its .sha256 file and passes quick_check."""
+    try:
+        with open(path + ".sha256", encoding="utf-8") as fh:
+            expected = fh.read().split()[0]
+    except (OSError, IndexError):
+        raise BackupError(f"{path}: missing checksum file")
+    if sha256_file(path) != expected:
+        raise BackupError(f"{path}: checksum mismatch")
+    conn = sqlite3.connect(ro_uri(path), uri=True)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"{path}: quick_check failed: {result}")
+
+
+class BackupJob:
+    def __init__(self, db_path, backup_dir=None, keep=None, interval_minutes=None, pages=None,
+                 step_sleep_ms=None, max_restarts=None, subdir=None):
+        """subdir: keeps this database's snapshots apart when several share the backup directory"""
+        self.db_path = db_path
+        self.backup_dir = backup_dir or os.getenv("BACKUP_DIR", os.path.join(HERE, "yarab", "backups"))
+        if subdir:
+            self.backup_dir = os.path.join(self.backup_dir, subdir)
+        self.keep = keep if keep is not None else int(os.getenv("BACKUP_KEEP", "24"))
+        self.interval_minutes = (
+            interval_minutes if interval_minutes is not None else float(os.getenv("BACKUP_INTERVAL_MINUTES", "0"))
+        )
+        self.pages = pages if pages is not None else int(os.getenv("BACKUP_PAGES", "256"))
+        self.step_sleep = (step_sleep_ms if step_sleep_ms is not None else float(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))) / 1000
+        self.max_restarts = max_restarts if max_restarts is not None else int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ------------- one backup -------------
+
+    def run(self):
+        """Take one snapshot now. Returns its path."""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        lock = self._acquire_lock()
+        t0 = time.perf_counter()
+        try:
+            with metrics.background_job("backup"):
+                path = self._copy()
+        except Exception:
+            REGISTRY.inc("backup_failures_total")
+            raise
+        finally:
+            os.remove(lock)
+        REGISTRY.observe("backup_duration_seconds", time.perf_counter() - t0)
+        REGISTRY.gauge_set("backup_last_success_timestamp", time.time())
+        REGISTRY.gauge_set("backup_last_bytes", os.path.getsize(path))
+        self.prune()
+        return path
+
+    def _copy(self):
+        taken = dt.datetime.now(dt.timezone.utc)
+        final = os.path.join(self.backup_dir, f"{_stem(self.db_path)}-{taken.strftime(STAMP)}.db")
+        partial = final + ".partial"
+        src = sqlite3.connect(ro_uri(self.db_path), uri=True, timeout=30)
+        dst = sqlite3.connect(partial)
+        try:
+            if not self._copy_in_steps(src, dst):
+                REGISTRY.inc("backup_restarts_total", (("mode", "single_step"),))
+                src.backup(dst)  # one read transaction for the whole file
+            # The copy carries the source's WAL flag; make it a self-contained file
+            dst.execute("PRAGMA journal_mode=DELETE")
+            result = dst.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise BackupError(f"snapshot failed quick_check: {result}")
+        except BaseException:
+            dst.close()
+            os.remove(partial)
+            raise
+        finally:
+            src.close()
+        dst.close()
+        digest = sha256_file(partial)
+        with open(final + ".sha256", "w", encoding="utf-8") as fh:
+            fh.write(f"{digest}  {os.path.basename(final)}\n")
+        os.replace(partial, final)
+        return final
+
+    def _copy_in_steps(self, src, dst):
+        """Copy in page steps. False when writers kept restarting it (the caller finishes in one step)."""
+        restarts = [0]
+        last_remaining = [None]
+
+        class _GiveUp(Exception):
+            pass
+
+        def progress(status, remaining, total):
+            # A write by another connection restarts the copy: `remaining` goes back up
+            if last_remaining[0] is not None and remaining > last_remaining[0]:
+                restarts[0] += 1
+                REGISTRY.inc("backup_restarts_total", (("mode", "paged"),))
+                if restarts[0] > self.max_restarts:
+                    raise _GiveUp()
+            last_remaining[0] = remaining
+            if remaining and self.step_sleep:
+                time.sleep(self.step_sleep)  # let bookings take the write lock between steps
+
+        try:
+            src.backup(dst, pages=self.pages, progress=progress)
+        except _GiveUp:
+            return False
+        return True
+
+    def _acquire_lock(self):
+        lock = os.path.join(self.backup_dir, f".{_stem(self.db_path)}.lock")
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) > LOCK_STALE_SECONDS:
+                        os.remove(lock)
+                        continue
+                except OSError:
+                    continue
+                raise BackupError(f"another backup is running ({lock})")
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return lock
+        raise BackupError(f"could not take {lock}")
+
+    def prune(self):
+        if self.keep <= 0:  # keep everything
+            return
+        for _, path in snapshots(self.backup_dir, self.db_path)[:-self.keep]:
+            for name in (path, path + ".sha256"):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+    # ------------- schedule -------------
+
+    def start(self):
+        """Back up every BACKUP_INTERVAL_MINUTES in a daemon thread (no-op when 0)."""
+        if self.interval_minutes <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="db-backup", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        interval = self.interval_minutes * 60
+        while True:
+            existing = snapshots(self.backup_dir, self.db_path)
+            age = time.time() - existing[-1][0].timestamp() if existing else None
+            if age is None or age >= interval:
+                try:
+                    self.run()
+                    age = 0
+                except BackupError as exc:  # another worker took it, or the copy was bad
+                    log.warning("%s", exc)
+                    age = interval - 60
+                except Exception:
+                    log.exception("backup of %s failed", self.db_path)
+                    age = interval - 60  # try again in a minute
+            time.sleep(max(interval - age, 1))
+
+
+# ------------- restore -------------
+
+def pick(backup_dir, db_path, at=None):
+    """Newest snapshot taken at or before `at` (aware datetime; None = newest)."""
+    candidates = [p for taken, p in snapshots(backup_dir, db_path) if at is None or taken <= at]
+    if not candidates:
+        raise BackupError(f"no snapshot in {backup_dir}" + (f" taken before {at.isoformat()}" if at else ""))
+    return candidates[-1]
+
+
+def restore(snapshot, db_path):
+    """
+    Verify `snapshot` and copy it over `db_path` with the backup API, which
+    takes the database's write lock for the copy. Running apps see the
+    restored data on their next read and their caches rebuild, but stopping
+    them first is safer.
+    """
+    verify(snapshot)
+    src = sqlite3.connect(ro_uri(snapshot), uri=True)
+    dst = sqlite3.connect(db_path, timeout=30)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _parse_at(text):
+    at = dt.datetime.fromisoformat(text)
+    return (at if at.tzinfo else at.astimezone()).astimezone(dt.timezone.utc)  # naive = local time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backups of the appointments database")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, text in (("now", "take a snapshot"), ("list", "list snapshots"),
+                       ("verify", "check snapshot checksums"), ("restore", "restore a snapshot")):
+        p = sub.add_parser(name, help=text)
+        target = p.add_mutually_exclusive_group()
+        target.add_argument("--db", default=None, help="database file (DENTAL_DB, default yarab/dental_appointments.db)")
+        target.add_argument("--clinic", default=None, help="a clinic from CLINICS: its database and backup folder")
+        p.add_argument("--dir", default=None, help="backup directory (BACKUP_DIR, default yarab/backups)")
+        if name == "verify":
+            p.add_argument("files", nargs="*")
+        if name == "restore":
+            which = p.add_mutually_exclusive_group(required=True)
+            which.add_argument("--file")
+            which.add_argument("--at", type=_parse_at, help="newest snapshot taken at or before this time")
+            which.add_argument("--latest", action="store_true")
+
+    args = parser.parse_args(argv)
+    subdir = None
+    if args.clinic:
+        import services  # DENTAL_DB and CLINICS
+        clinic = services.CLINICS.get(args.clinic)
+        if clinic is None:
+            parser.error(f"unknown clinic {args.clinic!r} (known: {', '.join(services.CLINICS)})")
+        args.db = clinic.db_path
+        subdir = None if clinic is services.DEFAULT else clinic.id
+    elif args.db is None:
+        args.db = os.getenv("DENTAL_DB", DEFAULT_DB)
+    job = BackupJob(args.db, args.dir, subdir=subdir)
+    if args.cmd == "now":
+        t0 = time.perf_counter()
+        path = job.run()
+        print(f"✅ {path} ({os.path.getsize(path)} bytes, {time.perf_counter() - t0:.2f}s)")
+    elif args.cmd == "list":
+        for taken, path in snapshots(job.backup_dir, args.db):
+            print(f"{taken.isoformat()}  {os.path.getsize(path):>12}  {path}")
+    elif args.cmd == "verify":
+        files = args.files or [p for _, p in snapshots(job.backup_dir, args.db)]
+        bad = 0
+        for path in files:
+            try:
+                verify(path)
+                print(f"ok   {path}")
+            except BackupError as exc:
+                bad += 1
+                print(f"BAD  {exc}")
+        return 1 if bad else 0
+    elif args.cmd == "restore":
+        try:
+            snapshot = args.file or pick(job.backup_dir, args.db, None if args.latest else args.at)
+            restore(snapshot, args.db)
+        except BackupError as exc:
+            print(f"❌ {exc}")
+            return 1
+        print(f"✅ Restored {args.db} from {snapshot}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+"""
+Booking throughput: one transaction per request vs. the group-commit writer.
+
+Uses app_patient.insert_booking (the real duplicate check + date/ticket
+allocation + INSERT) against throwaway databases, each with its own
+services.Clinic so the availability index and slot bitmaps are that database's.
+
+    python benchmarks/bench_booking_queue.py [bookings] [threads]
+"""
+import datetime as dt
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app_patient  # noqa: E402
+import services  # noqa: E402
+from booking_queue import BookingWriter  # noqa: E402
+from seed import SCHEMA, WEEK  # noqa: E402
+
+
+def make_db(path):
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executemany("INSERT INTO daily_capacity (day_name, capacity) VALUES (?, 999)", [(d,) for d in WEEK])
+    con.commit()
+    con.close()
+
+
+def clinic_for(path):
+    """A Clinic on `path` with its caches loaded, as book_appointment does before booking."""
+    clinic = services.Clinic("bench", path)
+
+    def prepare():
+        clinic.availability.remaining(dt.date.today())
+        clinic.slots.prepare()
+        clinic.pending.prepare()
+    clinic.bind(prepare)()
+    return clinic
+
+
+def bookings(n, offset):
+    for i in range(n):
+        nid = f"2990101{offset + i:07d}"
+        yield {"name": f"Bench {i}", "national_id": nid, "symptoms": None}, f"010{offset + i:08d}"
+
+
+def run(n, threads, book):
+    per_thread = n // threads
+    errors = []
+
+    def worker(t):
+        for payload, phone in bookings(per_thread, t * per_thread):
+            try:
+                body, status = book(payload, phone)
+                if status != 201:
+                    errors.append(body)
+            except Exception as exc:  # database is locked, ...
+                errors.append(str(exc))
+
+    ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return per_thread * threads / (time.perf_counter() - t0), len(errors)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    with tempfile.TemporaryDirectory() as tmp:
+        direct_db, queued_db = os.path.join(tmp, "direct.db"), os.path.join(tmp, "queued.db")
+        make_db(direct_db)
+        make_db(queued_db)
+
+        direct = clinic_for(direct_db)
+        insert_booking = direct.bind(app_patient.insert_booking)
+
+        def book_direct(payload, phone):
+            after = services.AfterCommit()
+            conn = direct.get_conn()
+            try:
+                result = insert_booking(conn, payload, phone, after)
+                conn.commit()
+            except BaseException:
+                after.rolled_back()
+                raise
+            finally:
+                conn.close()
+            after.committed()
+            return result
+
+        direct_rate, direct_err = run(n, threads, book_direct)
+        print(f"direct       {direct_rate:8.0f} bookings/s  errors={direct_err}")
+
+        for batch in (1, 8, 64):
+            queued = clinic_for(queued_db)  # fresh caches: the table was emptied after the last round
+            writer = BookingWriter(queued.get_conn, queued.bind(app_patient.insert_booking), max_batch=batch,
+                                   after_commit=services.AfterCommit)
+            rate, err = run(n, threads, lambda p, ph: writer.submit(p, ph).result(timeout=60))
+            writer.stop()
+            print(f"queue b={batch:<3}  {rate:8.0f} bookings/s  errors={err}")
+            con = sqlite3.connect(queued_db)
+            con.execute("DELETE FROM appointments")
+            con.commit()
+            con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Overhead of the /api/metrics instrumentation.
+
+Runs the same trivial Flask route (one SQLite query) with and without
+metrics.init_app and prints the per-request difference.
+
+    python benchmarks/bench_metrics.py [requests]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask, jsonify  # noqa: E402
+
+import metrics  # noqa: E402
+
+
+def build_app(db_path, instrumented):
+    app = Flask(__name__)
+    connect = metrics.connect if instrumented else sqlite3.connect
+    if instrumented:
+        metrics.init_app(app, "bench")
+
+    @app.route("/api/ping")
+    def ping():
+        with connect(db_path) as conn:
+            conn.execute("SELECT 1").fetchone()
+        return jsonify({"ok": True})
+
+    return app
+
+
+def run(app, n):
+    client = app.test_client()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        client.get("/api/ping")
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        sqlite3.connect(db_path).close()
+        plain, timed = build_app(db_path, False), build_app(db_path, True)
+        # Interleave rounds and keep the best of each to cancel out machine noise
+        rounds = [(run(plain, n), run(timed, n)) for _ in range(3)]
+        base = min(r[0] for r in rounds)
+        inst = min(r[1] for r in rounds)
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        metrics.REGISTRY.observe("bench_observe_seconds", i * 1e-6, (("endpoint", "/api/ping"),))
+    observe = (time.perf_counter() - t0) / n
+
+    print(f"requests:          {n}")
+    print(f"baseline:          {base * 1e6:8.1f} us/request")
+    print(f"instrumented:      {inst * 1e6:8.1f} us/request")
+    print(f"overhead:          {(inst - base) * 1e6:8.1f} us/request ({(inst / base - 1) * 100:.1f}%)")
+    print(f"histogram observe: {observe * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Patient-app throughput per server / worker / thread setting.
+
+Starts `serve.py patient` against a generated throwaway database once per
+setting and drives it with keep-alive clients for a fixed time. The request
+mix is the read traffic phones generate: availability, ticket lookups and
+health checks (bookings are rate limited per IP, see admission.py, and are
+measured by bench_booking_queue.py instead).
+
+    python benchmarks/bench_serve.py [seconds per setting] [clients]
+
+Servers that are not installed are skipped; the Flask development server is
+included as the baseline.
+"""
+import http.client
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import seed  # noqa: E402
+from serve import _installed  # noqa: E402
+
+SETTINGS = [
+    ("dev", None, None),
+    ("waitress", None, 4),
+    ("waitress", None, 8),
+    ("waitress", None, 16),
+    ("gunicorn", 1, 1),
+    ("gunicorn", 1, 8),
+    ("gunicorn", 2, 8),
+    ("gunicorn", 4, 4),
+    ("gunicorn", 4, 8),
+    ("gunicorn", 2 * (os.cpu_count() or 1) + 1, 1),  # the classic sync-worker sizing, for comparison
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(db_path, server, workers, threads, port):
+    argv = [sys.executable, os.path.join(ROOT, "serve.py"), "patient",
+            "--server", server, "--port", str(port)]
+    if workers:
+        argv += ["--workers", str(workers)]
+    if threads:
+        argv += ["--threads", str(threads)]
+    env = dict(os.environ, DENTAL_DB=db_path, WEB_PIDFILE="", WEB_ACCESS_LOG="")
+    proc = subprocess.Popen(argv, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{server} did not come up on port {port}")
+
+
+def drive(port, paths, seconds, clients):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client():
+        rnd = random.Random()
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        mine, failed = [], 0
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            try:
+                conn.request("GET", rnd.choice(paths))
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status >= 500:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+                continue
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    ts = [threading.Thread(target=client) for _ in range(clients)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    latencies.sort()
+    pct = lambda q: latencies[int(q * (len(latencies) - 1))] * 1000 if latencies else 0  # noqa: E731
+    return len(latencies) / seconds, pct(0.5), pct(0.95), sum(errors)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed.generate(db_path, rows=50_000, days=365, seed=1)
+        con = sqlite3.connect(db_path)
+        tickets = [r[0] for r in con.execute("SELECT ticket_number FROM appointments ORDER BY RANDOM() LIMIT 200")]
+        con.close()
+        # ~40% availability, ~40% ticket lookups, ~20% health checks
+        paths = (["/api/patient/availability"] * 40
+                 + [f"/api/patient/appointments?ticket={t}" for t in tickets[:40]]
+                 + ["/api/health"] * 20)
+
+        print(f"{'server':<10} {'workers':>7} {'threads':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for server, workers, threads in SETTINGS:
+            if server != "dev" and not _installed(server):
+                continue
+            if server == "gunicorn" and os.name == "nt":
+                continue
+            port = free_port()
+            proc = start(db_path, server, workers, threads, port)
+            try:
+                drive(port, paths, 1, clients)  # warm caches in every worker
+                rps, p50, p95, errors = drive(port, paths, seconds, clients)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=40)
+            print(f"{server:<10} {workers or '-':>7} {threads or '-':>7} {rps:9.0f} {p50:8.1f} {p95:8.1f} {errors:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Cold start: time from a fresh interpreter to the first served request.
+
+For each entry point (app_patient, app_staff, combined) this starts new
+Python processes and measures importing the module, create_app(), and a
+first GET /api/health through the test client, against a throwaway database.
+It then prints the slowest imports from `python -X importtime`.
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 600]
+
+Exits with status 1 when the median time to first response of any entry
+point is over the budget (STARTUP_BUDGET_MS, default 600 ms), so CI can hold
+worker restarts and scale-out to it.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from seed import SCHEMA  # noqa: E402
+
+TARGETS = ["app_patient", "app_staff", "combined"]
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import {module} as m
+t1 = time.perf_counter()
+app = m.create_app()
+t2 = time.perf_counter()
+status = app.test_client().get("/api/health").status_code
+t3 = time.perf_counter()
+print(json.dumps({{"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2, "status": status}}))
+"""
+
+
+def make_db(path):
+    import sqlite3
+
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    con.commit()
+    con.close()
+
+
+def run_once(module, env):
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - t0
+    phases = json.loads(out.stdout.strip().splitlines()[-1])
+    if phases.pop("status") != 200:
+        raise RuntimeError(f"{module}: /api/health did not answer 200")
+    phases["total"] = wall
+    return phases
+
+
+def import_profile(module, env, top=12):
+    """[(cumulative µs, self µs, name)] of the slowest imports, from -X importtime."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:  # the module itself and what it imports directly
+            rows.append((int(cum_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "600")))
+    args = parser.parse_args(argv)
+
+    over = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.db")
+        make_db(db_path)
+        env = dict(os.environ, DENTAL_DB=db_path)
+
+        print(f"{'entry point':<12} {'import':>8} {'create':>8} {'1st req':>8} {'total':>8}   (median of {args.runs}, ms)")
+        for module in TARGETS:
+            run_once(module, env)  # warm the OS file cache and __pycache__
+            runs = [run_once(module, env) for _ in range(args.runs)]
+            med = {k: statistics.median(r[k] for r in runs) * 1000 for k in runs[0]}
+            print(f"{module:<12} {med['import']:8.1f} {med['create_app']:8.1f} {med['first_request']:8.1f} {med['total']:8.1f}")
+            if med["total"] > args.budget_ms:
+                over.append((module, med["total"]))
+
+        for module in TARGETS:
+            print(f"\nslowest imports under {module} (cumulative / self, ms):")
+            for cum, own, name in import_profile(module, env):
+                print(f"  {cum / 1000:8.1f} {own / 1000:8.1f}  {name}")
+
+    if over:
+        for module, total in over:
+            print(f"\nOVER BUDGET: {module} took {total:.0f} ms to first response (budget {args.budget_ms:.0f} ms)")
+        return 1
+    print(f"\nAll entry points within the {args.budget_ms:.0f} ms startup budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
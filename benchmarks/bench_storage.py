@@ -0,0 +1,131 @@
+"""
+Query-layer cost: the same storage operations on SQLite and in memory.
+
+Loads `rows` appointments into each engine (storage.py), then times each
+operation the apps run per request. The gap between the two columns is what
+SQL, sqlite3 and the disk cost; the memory column is the floor for the
+Python around them.
+
+    python benchmarks/bench_storage.py [rows] [repeats]
+"""
+import datetime as dt
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import storage  # noqa: E402
+from seed import SCHEMA, WEEK  # noqa: E402
+from services import dict_factory  # noqa: E402
+
+START = dt.date(2025, 1, 1)
+DAYS = 365
+
+
+def rows(n, rng):
+    for i in range(n):
+        day = START + dt.timedelta(days=rng.randrange(DAYS))
+        yield {
+            "ticket_number": 100000 + i, "name": f"Bench {i}", "phone": f"010{i:08d}", "phone_text": f"010{i:08d}",
+            "national_id": f"2990101{i:07d}", "scheduled_date": day.isoformat(),
+            "status": "pending" if rng.random() < 0.2 else "completed",
+            "created_at": f"{day.isoformat()} {rng.randrange(8, 20):02d}:{rng.randrange(60):02d}:00",
+            "image_paths": [f"patient_{i}/images/a.jpg"] if rng.random() < 0.3 else [],
+        }
+
+
+def sqlite_engine(path, data):
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.close()
+
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = dict_factory
+        return conn
+    s = storage.SQLiteStorage(connect)
+    s.prepare()
+    conn = s._conn()
+    with conn:  # bulk load in one transaction; the timed operations go through the interface
+        conn.executemany(
+            "INSERT INTO appointments (ticket_number, name, phone, phone_text, national_id, scheduled_date, status, "
+            "created_at, image_paths) VALUES (:ticket_number, :name, :phone, :phone_text, :national_id, "
+            ":scheduled_date, :status, :created_at, :image_paths)",
+            (storage._encode(r) for r in data),
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_scheduled_date ON appointments(scheduled_date)")
+    return s
+
+
+def memory_engine(data):
+    s = storage.MemoryStorage()
+    for r in data:
+        s.insert_appointment(r)
+    return s
+
+
+def operations(n, rng):
+    def pick_nid():
+        return f"2990101{rng.randrange(n):07d}"
+
+    def pick_day():
+        return (START + dt.timedelta(days=rng.randrange(DAYS))).isoformat()
+
+    counter = [0]
+
+    def insert(s):
+        counter[0] += 1
+        s.insert_appointment({"ticket_number": 900000000 + counter[0], "name": "New", "phone": "01000000000",
+                              "phone_text": "01000000000",
+                              "national_id": f"3990101{counter[0]:07d}", "scheduled_date": pick_day()})
+
+    return [
+        ("get_appointment", lambda s: s.get_appointment(rng.randrange(1, n))),
+        ("by_national_id", lambda s: s.by_national_id(pick_nid())),
+        ("by_ticket", lambda s: s.by_ticket(100000 + rng.randrange(n))),
+        ("booked_on", lambda s: s.booked_on(pick_day())),
+        ("list first page", lambda s: s.list_appointments(limit=10)),
+        ("list by date", lambda s: s.list_appointments(scheduled_date=pick_day(), limit=10)),
+        ("capacity_on", lambda s: s.capacity_on(START + dt.timedelta(days=rng.randrange(DAYS)), 10)),
+        ("insert_appointment", insert),
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    data = list(rows(n, random.Random(42)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        engines = {"sqlite": sqlite_engine(os.path.join(tmp, "bench.db"), data)}
+        load_sqlite = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        engines["memory"] = memory_engine(data)
+        load_memory = time.perf_counter() - t0
+        for s in engines.values():
+            for day in WEEK:
+                s.set_weekday_capacity(day, 20)
+            s.add_override("2025-03-01", "2025-03-10", 0, "holiday")
+
+        print(f"{n} rows loaded: sqlite {load_sqlite:.2f}s (executemany), memory {load_memory:.2f}s (insert_appointment)")
+        print(f"{'operation':<20} {'sqlite µs':>10} {'memory µs':>10} {'ratio':>7}")
+        for name, _ in operations(n, random.Random(0)):
+            per_op = {}
+            for engine, s in engines.items():
+                op = dict(operations(n, random.Random(7)))[name]
+                t0 = time.perf_counter()
+                for _ in range(repeats):
+                    op(s)
+                per_op[engine] = (time.perf_counter() - t0) / repeats * 1e6
+            ratio = per_op["sqlite"] / per_op["memory"] if per_op["memory"] else float("inf")
+            print(f"{name:<20} {per_op['sqlite']:10.1f} {per_op['memory']:10.1f} {ratio:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Single-writer booking pipeline with group commit.
+
+Request threads hand validated bookings to one writer thread and wait on a
+Future. The writer drains whatever is queued (up to `max_batch`, waiting at
+most `max_wait_ms` for stragglers), runs every booking in one transaction and
+commits once, so a burst of bookings costs one write lock + fsync per batch
+instead of one per request. Bookings are applied in arrival order, so dates
+and per-day ticket sequences are allocated first come, first served.
+
+Each booking runs inside its own SAVEPOINT: a booking that raises is rolled
+back alone and its Future gets the exception; the rest of the batch commits.
+With `after_commit`, each booking also gets its own callback list (see
+services.AfterCommit), run once the batch has committed, or rolled back with
+its savepoint or the whole batch, so in-memory caches never count a booking
+that is not in the database.
+
+Enabled in app_patient.py with BOOKING_QUEUE=1.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import REGISTRY
+
+
+class BookingWriter:
+    def __init__(self, connect, handler, max_batch=64, max_wait_ms=2.0, after_commit=None):
+        """
+        connect: () -> sqlite3.Connection, called once by the writer thread
+        handler: (conn, *args) -> result, runs inside the batch transaction;
+                 (conn, *args, after) when `after_commit` is given
+        after_commit: () -> object with committed() and rolled_back()
+        """
+        self.connect = connect
+        self.handler = handler
+        self.after_commit = after_commit
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, *args):
+        """Queue one booking; returns a Future resolved with handler's result."""
+        if self._thread is None:
+            self.start()
+        fut = Future()
+        self._queue.put((fut, args))
+        return fut
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="booking-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ------------- writer thread -------------
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._apply(conn, batch)
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # finish this batch, stop on the next loop
+                break
+            batch.append(item)
+        return batch
+
+    def _apply(self, conn, batch):
+        results, applied = [], []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fut, args in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                after = self.after_commit() if self.after_commit is not None else None
+                conn.execute("SAVEPOINT booking")
+                try:
+                    result = self.handler(conn, *args, after) if after is not None else self.handler(conn, *args)
+                    conn.execute("RELEASE booking")
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO booking")
+                    conn.execute("RELEASE booking")
+                    if after is not None:
+                        after.rolled_back()
+                    results.append((fut, None, exc))
+                    continue
+                results.append((fut, result, None))
+                if after is not None:
+                    applied.append(after)
+            conn.commit()
+        except Exception as exc:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            for after in reversed(applied):
+                after.rolled_back()
+            for fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        for after in applied:
+            after.committed()
+        REGISTRY.observe("booking_batch_size", len(batch), buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+        for fut, result, exc in results:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
@@ -0,0 +1,191 @@
+"""
+In-process cache of the capacity configuration: weekday capacities
+(daily_capacity), date-specific overrides (capacity_overrides) and time-slot
+templates (slot_templates).
+
+Both are loaded once and compiled into a per-date calendar for the booking
+horizon, so for_date() is an array lookup and the booking path runs no
+capacity SQL. Staleness is bounded two ways:
+  - the staff app calls invalidate() right after changing capacity
+  - a background thread reads config_version (bumped by triggers on every
+    daily_capacity / capacity_overrides / slot_templates change) every
+    CAPACITY_REFRESH_SECONDS and reloads when it moved, so the patient process
+    picks up staff edits within that interval
+"""
+import datetime as dt
+import logging
+import os
+import threading
+import time
+from array import array
+
+import schema
+from slots import SlotTemplate
+
+MIGRATIONS = (
+    "2026-10-19_add_config_version.sql",
+    "2026-10-19_add_capacity_overrides.sql",
+    "2026-10-19_add_slot_templates.sql",
+)
+WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+CALENDAR_DAYS = 366
+UNSET = -1  # weekday missing from daily_capacity: callers apply their own default
+
+log = logging.getLogger(__name__)
+
+
+def _read_version(conn):
+    row = conn.execute(
+        "SELECT SUM(version) AS v FROM config_version WHERE name IN ('daily_capacity', 'capacity_overrides', 'slot_templates')"
+    ).fetchone()
+    return row["v"] or 0
+
+
+class CapacityCache:
+    def __init__(self, connect, refresh_seconds=None):
+        """connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn)."""
+        self.connect = connect
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None else float(os.getenv("CAPACITY_REFRESH_SECONDS", "5"))
+        )
+        self._lock = threading.Lock()
+        self._capacity = None
+        self._overrides = []  # (start date, end date, capacity, id, reason), oldest first
+        self._calendar = None  # (start date, array of capacities)
+        self._templates = {}  # day_name -> SlotTemplate
+        self._version = None
+        self._thread = None
+
+    @property
+    def version(self):
+        """config_version of the loaded configuration (None before the first load)."""
+        return self._version
+
+    def get(self) -> dict:
+        """{day_name: capacity} for the days configured in daily_capacity."""
+        capacity = self._capacity
+        if capacity is None:
+            capacity = self.reload()
+            self._start_refresher()
+        return capacity
+
+    def overrides(self):
+        self.get()
+        return [
+            {"id": oid, "start_date": s.isoformat(), "end_date": e.isoformat(), "capacity": c, "reason": reason}
+            for s, e, c, oid, reason in self._overrides
+        ]
+
+    def for_date(self, day: dt.date, default: int) -> int:
+        """Effective capacity for one date: newest override, else weekday capacity, else `default`."""
+        self.get()
+        calendar = self._calendar
+        if calendar is None or calendar[0] != dt.date.today():
+            calendar = self._compile()
+        start, caps = calendar
+        i = (day - start).days
+        value = caps[i] if 0 <= i < len(caps) else self._lookup(day)
+        return default if value == UNSET else value
+
+    def override_for(self, day: dt.date):
+        """The override that applies to `day`, if any."""
+        self.get()
+        for s, e, c, oid, reason in reversed(self._overrides):
+            if s <= day <= e:
+                return {"id": oid, "capacity": c, "reason": reason}
+        return None
+
+    def slot_template(self, day: dt.date):
+        """The SlotTemplate for `day`'s weekday, or None when that day is booked by date only."""
+        self.get()
+        return self._templates.get(WEEK[day.weekday()])
+
+    def slot_templates(self) -> dict:
+        self.get()
+        return dict(self._templates)
+
+    def reload(self) -> dict:
+        with self._lock:
+            conn = self.connect()
+            try:
+                for name in MIGRATIONS:
+                    schema.ensure(conn, name)
+                version = _read_version(conn)
+                rows = conn.execute("SELECT day_name, capacity FROM daily_capacity").fetchall()
+                override_rows = conn.execute(
+                    "SELECT id, start_date, end_date, capacity, reason FROM capacity_overrides ORDER BY id"
+                ).fetchall()
+                template_rows = conn.execute(
+                    "SELECT day_name, start_time, slot_minutes, slot_count, chairs FROM slot_templates"
+                ).fetchall()
+            finally:
+                conn.close()
+            overrides = []
+            for r in override_rows:
+                try:
+                    s, e = dt.date.fromisoformat(r["start_date"]), dt.date.fromisoformat(r["end_date"])
+                except (TypeError, ValueError):
+                    continue
+                overrides.append((s, e, int(r["capacity"]), r["id"], r["reason"]))
+            templates = {}
+            for r in template_rows:
+                try:
+                    templates[r["day_name"]] = SlotTemplate.from_row(r)
+                except (TypeError, ValueError):
+                    continue
+            self._capacity = {r["day_name"]: r["capacity"] for r in rows}
+            self._overrides = overrides
+            self._templates = templates
+            self._calendar = None
+            self._version = version
+            return self._capacity
+
+    def invalidate(self):
+        """Reload now (call after changing capacity in this process)."""
+        self.reload()
+
+    def _lookup(self, day):
+        for s, e, c, _, _ in reversed(self._overrides):
+            if s <= day <= e:
+                return c
+        cap = self._capacity.get(WEEK[day.weekday()])
+        return UNSET if cap is None else cap
+
+    def _compile(self):
+        start = dt.date.today()
+        weekly = [self._capacity.get(d) for d in WEEK]
+        caps = array("l", (
+            UNSET if weekly[(start + dt.timedelta(days=i)).weekday()] is None
+            else weekly[(start + dt.timedelta(days=i)).weekday()]
+            for i in range(CALENDAR_DAYS)
+        ))
+        end = start + dt.timedelta(days=CALENDAR_DAYS - 1)
+        for s, e, c, _, _ in self._overrides:  # oldest first, so newer overrides win
+            if e < start or s > end:
+                continue
+            for i in range((max(s, start) - start).days, (min(e, end) - start).days + 1):
+                caps[i] = c
+        calendar = (start, caps)
+        self._calendar = calendar
+        return calendar
+
+    def _start_refresher(self):
+        if self._thread is None and self.refresh_seconds > 0:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._refresh_loop, name="capacity-refresh", daemon=True)
+                    self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                conn = self.connect()
+                try:
+                    version = _read_version(conn)
+                finally:
+                    conn.close()
+                if version != self._version:
+                    self.reload()
+            except Exception as exc:  # keep serving the last good configuration
+                log.warning("capacity refresh failed: %s", exc)
@@ -0,0 +1,318 @@
+"""
+Resumable uploads for booking attachments (photos and voice notes).
+
+A phone on a weak network sends its files ahead of the booking, in small
+requests it can repeat:
+
+    POST /api/patient/uploads             {"kind": "image", "size": 5242880, "filename": "x.jpg", "national_id": ...}
+        -> 201 {"upload_id", "offset": 0, "chunk_size", "expires_at"}
+    PUT  /api/patient/uploads/<id>        Upload-Offset: 0, body = raw bytes of the next chunk
+        -> 200 {"offset": <bytes received>}   (409 + current offset if Upload-Offset is not it)
+    GET  /api/patient/uploads/<id>        -> {"offset", "size", "status"}  (where to resume after a drop)
+    POST /api/patient/uploads/<id>/complete  {"sha256": optional}
+        -> 200 {"upload_id", "status": "complete"}
+    POST /api/patient/book                {..., "image_upload_id": id, "voice_upload_id": id}
+
+Each request holds a worker only for one chunk. The file is created at its
+full size when the upload starts (preallocated, where the OS supports it).
+Chunks are written at their offsets. The received offset only moves forward
+through a compare-and-set in a small SQLite file (UPLOADS_DB, separate from
+the appointments database), so every worker process sees the same state and
+two copies of one chunk cannot both be counted.
+
+Booking claims a completed upload once, for the national ID that started it,
+and moves the file into uploads/patients/patient_<nid>/. The claim is settled
+once the booking answers 201; any other outcome (409, 500, an error) unclaims
+it, moving the file back, so the phone can book again with the same upload ID.
+
+Starting an upload is rate-limited (admission.Admission.uploads_from_env), and
+a national ID or client IP can hold at most UPLOAD_MAX_OPEN_PER_NID (4) or
+UPLOAD_MAX_OPEN_PER_IP (20) unclaimed uploads; past that, 429. Uploads not
+claimed within UPLOAD_EXPIRE_HOURS (24) of their last chunk are deleted,
+together with their temp files, by a thread that looks every
+UPLOAD_EXPIRE_EVERY_MINUTES (10).
+"""
+import datetime as dt
+import hashlib
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+import schema
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+KINDS = {
+    # kind: (folder under the patient's, file name prefix, default extension, size limit env, default MB)
+    "image": ("images", "img", ".jpg", "UPLOAD_MAX_IMAGE_MB", 20),
+    "voice": ("voices", "voice", ".webm", "UPLOAD_MAX_VOICE_MB", 20),
+}
+EXT_RE = re.compile(r"^\.[A-Za-z0-9]{1,8}$")
+COPY_BUFFER = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """Raised with the HTTP status the view should answer."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class UploadStore:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chunked_uploads (
+        id TEXT PRIMARY KEY,
+        national_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        ext TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        received INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'open',   -- open, complete, claimed
+        updated REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_chunked_uploads_updated ON chunked_uploads(updated);
+    CREATE INDEX IF NOT EXISTS idx_chunked_uploads_national_id ON chunked_uploads(national_id);
+    """
+
+    def __init__(self, db_path=None, tmp_dir=None, uploads_root=None):
+        self.db_path = db_path or os.getenv("UPLOADS_DB", os.path.join(HERE, "yarab", "uploads.db"))
+        self.tmp_dir = tmp_dir or os.getenv("UPLOAD_TMP_DIR", os.path.join(HERE, "yarab", "uploads_tmp"))
+        self.uploads_root = uploads_root or os.path.join(HERE, "yarab", "uploads")
+        self.chunk_size = int(os.getenv("UPLOAD_CHUNK_BYTES", str(512 * 1024)))
+        self.max_chunk = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(8 * 1024 * 1024)))
+        self.expire_seconds = float(os.getenv("UPLOAD_EXPIRE_HOURS", "24")) * 3600
+        self.expire_every_minutes = float(os.getenv("UPLOAD_EXPIRE_EVERY_MINUTES", "10"))
+        self.max_open_per_nid = int(os.getenv("UPLOAD_MAX_OPEN_PER_NID", "4"))
+        self.max_open_per_ip = int(os.getenv("UPLOAD_MAX_OPEN_PER_IP", "20"))
+        self._local = threading.local()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.tmp_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            schema.ensure_column(conn, "chunked_uploads", "ip", "TEXT NOT NULL DEFAULT ''")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunked_uploads_ip ON chunked_uploads(ip)")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _part(self, upload_id):
+        return os.path.join(self.tmp_dir, f"{upload_id}.part")
+
+    def _get(self, upload_id):
+        row = self._conn().execute("SELECT * FROM chunked_uploads WHERE id = ?", (upload_id,)).fetchone()
+        if row is None:
+            raise UploadError("Unknown or expired upload", 404)
+        return row
+
+    def _expires_at(self, updated):
+        return dt.datetime.fromtimestamp(updated + self.expire_seconds, dt.timezone.utc).isoformat()
+
+    # ------------- protocol -------------
+
+    def create(self, national_id, kind, size, filename="", ip=""):
+        if kind not in KINDS:
+            raise UploadError(f"kind must be one of {', '.join(KINDS)}")
+        _, _, default_ext, limit_env, limit_mb = KINDS[kind]
+        limit = int(float(os.getenv(limit_env, str(limit_mb))) * 1024 * 1024)
+        if not isinstance(size, int) or not 0 < size <= limit:
+            raise UploadError(f"size must be between 1 and {limit} bytes", 413 if isinstance(size, int) and size > 0 else 400)
+        ext = os.path.splitext(filename or "")[1]
+        ext = ext.lower() if EXT_RE.match(ext) else default_ext
+
+        # The row goes in first, and only while both owners are under their cap
+        # (one statement, so workers racing for the last place cannot both get it)
+        upload_id = secrets.token_urlsafe(16)
+        now = time.time()
+        conn = self._conn()
+        cur = conn.execute(
+            """
+            INSERT INTO chunked_uploads (id, national_id, ip, kind, ext, size, updated)
+            SELECT ?, ?, ?, ?, ?, ?, ?
+             WHERE (SELECT COUNT(*) FROM chunked_uploads WHERE national_id = ? AND status != 'claimed') < ?
+               AND (SELECT COUNT(*) FROM chunked_uploads WHERE ip = ? AND status != 'claimed') < ?
+            """,
+            (upload_id, national_id, ip, kind, ext, size, now,
+             national_id, self.max_open_per_nid, ip, self.max_open_per_ip),
+        )
+        if cur.rowcount != 1:
+            raise UploadError("Too many unfinished uploads. Finish or book with them first.", 429)
+
+        path = self._part(upload_id)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            try:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, size)  # reserve the blocks now: no ENOSPC halfway through
+                else:
+                    os.ftruncate(fd, size)
+            except OSError:
+                os.close(fd)
+                os.remove(path)
+                raise
+            os.close(fd)
+        except OSError:
+            conn.execute("DELETE FROM chunked_uploads WHERE id = ?", (upload_id,))
+            raise
+        return {"upload_id": upload_id, "offset": 0, "size": size, "chunk_size": self.chunk_size,
+                "expires_at": self._expires_at(now)}
+
+    def status(self, upload_id):
+        row = self._get(upload_id)
+        return {"upload_id": upload_id, "kind": row["kind"], "offset": row["received"], "size": row["size"],
+                "status": row["status"], "expires_at": self._expires_at(row["updated"])}
+
+    def write(self, upload_id, offset, length, stream):
+        """Write `length` bytes from `stream` at `offset`, which must be the bytes received so far."""
+        row = self._get(upload_id)
+        if row["status"] != "open":
+            raise UploadError("Upload is already complete", 409, offset=row["received"])
+        if offset != row["received"]:
+            raise UploadError("Upload-Offset does not match the bytes received", 409, offset=row["received"])
+        if length is None or length <= 0:
+            raise UploadError("Content-Length is required")
+        if length > self.max_chunk:
+            raise UploadError(f"Chunks are limited to {self.max_chunk} bytes", 413)
+        if offset + length > row["size"]:
+            raise UploadError("Chunk runs past the declared size", 413, offset=row["received"])
+
+        written = 0
+        with open(self._part(upload_id), "r+b") as fh:
+            fh.seek(offset)
+            while written < length:
+                block = stream.read(min(COPY_BUFFER, length - written))
+                if not block:
+                    break  # client went away: keep nothing of this chunk
+                fh.write(block)
+                written += len(block)
+        if written != length:
+            raise UploadError("Chunk ended early", 400, offset=row["received"])
+
+        # Move the offset only if nobody else did meanwhile (the same chunk sent twice)
+        cur = self._conn().execute(
+            "UPDATE chunked_uploads SET received = ?, updated = ? WHERE id = ? AND received = ? AND status = 'open'",
+            (offset + length, time.time(), upload_id, offset),
+        )
+        if cur.rowcount != 1:
+            raise UploadError("Upload-Offset does not match the bytes received", 409,
+                              offset=self._get(upload_id)["received"])
+        return {"upload_id": upload_id, "offset": offset + length, "size": row["size"]}
+
+    def complete(self, upload_id, sha256=None):
+        row = self._get(upload_id)
+        if row["status"] != "open":
+            return {"upload_id": upload_id, "status": row["status"]}
+        if row["received"] != row["size"]:
+            raise UploadError("Upload is not finished", 409, offset=row["received"])
+        if sha256:
+            h = hashlib.sha256()
+            with open(self._part(upload_id), "rb") as fh:
+                for block in iter(lambda: fh.read(1 << 20), b""):
+                    h.update(block)
+            if h.hexdigest() != sha256.lower():
+                raise UploadError("sha256 does not match the received file", 422)
+        self._conn().execute(
+            "UPDATE chunked_uploads SET status = 'complete', updated = ? WHERE id = ? AND status = 'open'",
+            (time.time(), upload_id),
+        )
+        return {"upload_id": upload_id, "status": "complete"}
+
+    def claim(self, upload_id, national_id, kind):
+        """
+        Move a completed upload into the patient's folder for a booking; returns
+        the stored path ("uploads/patients/..."). Each upload can be claimed once;
+        the booking then settles or unclaims it.
+        """
+        row = self._get(upload_id)
+        if row["national_id"] != national_id or row["kind"] != kind:
+            raise UploadError(f"{kind}_upload_id does not belong to this booking")
+        if row["status"] != "complete":
+            raise UploadError(f"{kind} upload is not complete", 409)
+        cur = self._conn().execute(
+            "UPDATE chunked_uploads SET status = 'claimed', updated = ? WHERE id = ? AND status = 'complete'",
+            (time.time(), upload_id),
+        )
+        if cur.rowcount != 1:
+            raise UploadError(f"{kind} upload was already used", 409)
+
+        folder_name, prefix, _, _, _ = KINDS[kind]
+        patient_folder = f"patient_{national_id}"
+        folder = os.path.join(self.uploads_root, "patients", patient_folder, folder_name)
+        os.makedirs(folder, exist_ok=True)
+        ts = dt.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        fname = f"{prefix}_{ts}_{upload_id[:8]}{row['ext']}"
+        dest = os.path.join(folder, fname)
+        os.replace(self._part(upload_id), dest)
+        os.utime(dest)  # the sweeper's grace period counts from the booking
+        return f"uploads/patients/{patient_folder}/{folder_name}/{fname}"
+
+    def settle(self, claimed):
+        """The booking committed: forget the claimed uploads [(upload_id, stored path)]."""
+        conn = self._conn()
+        for upload_id, _ in claimed:
+            conn.execute("DELETE FROM chunked_uploads WHERE id = ? AND status = 'claimed'", (upload_id,))
+
+    def unclaim(self, claimed):
+        """The booking did not happen: move the files back and make the uploads claimable again."""
+        conn = self._conn()
+        for upload_id, rel_path in claimed:
+            stored = os.path.join(self.uploads_root, *rel_path.split("/")[1:])  # "uploads/patients/..."
+            try:
+                os.replace(stored, self._part(upload_id))
+            except OSError:
+                log.exception("could not return upload %s", upload_id)
+                continue
+            conn.execute(
+                "UPDATE chunked_uploads SET status = 'complete', updated = ? WHERE id = ? AND status = 'claimed'",
+                (time.time(), upload_id),
+            )
+
+    # ------------- expiry -------------
+
+    def expire(self):
+        """Drop uploads idle for longer than UPLOAD_EXPIRE_HOURS; returns how many."""
+        now = time.time()
+        conn = self._conn()
+        stale = [r["id"] for r in conn.execute(
+            "SELECT id FROM chunked_uploads WHERE updated < ?", (now - self.expire_seconds,)
+        ).fetchall()]
+        for upload_id in stale:
+            cur = conn.execute("DELETE FROM chunked_uploads WHERE id = ? AND updated < ?",
+                               (upload_id, now - self.expire_seconds))
+            if cur.rowcount:
+                try:
+                    os.remove(self._part(upload_id))
+                except FileNotFoundError:
+                    pass
+        return len(stale)
+
+    def start(self):
+        """Expire every UPLOAD_EXPIRE_EVERY_MINUTES in a daemon thread (no-op when 0)."""
+        if self.expire_every_minutes <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="upload-expiry", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                expired = self.expire()
+                if expired:
+                    log.info("%d expired uploads deleted", expired)
+            except Exception:
+                log.exception("upload expiry failed")
+            time.sleep(self.expire_every_minutes * 60)
@@ -0,0 +1,71 @@
+"""
+Patient and staff apps in one process behind a single WSGI dispatcher.
+
+    python serve.py combined                  # both on :5000
+    gunicorn -c gunicorn.conf.py "combined:create_app()"
+
+Both apps already take their connection factory and caches from services.py,
+so in one process there is a single capacity cache, slot allocator,
+availability index and queue: a staff edit or capacity change is visible to
+the next patient request, and memory for the shared state is paid once.
+
+Requests are routed by path prefix (default) or by host:
+  - COMBINED_DISPATCH=prefix: the staff app under COMBINED_STAFF_PREFIX
+    (default /staff), the patient app everywhere else. Point the staff UI at
+    it with VITE_API_BASE=http://<host>:5000/staff.
+  - COMBINED_DISPATCH=host: requests whose Host is in COMBINED_STAFF_HOSTS
+    (comma-separated, port ignored) go to the staff app, the rest to patient.
+
+The staff session cookie is renamed (staff_session) so the two apps never
+overwrite each other's session on the same host.
+"""
+import os
+
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+import app_patient
+import app_staff
+
+
+class HostDispatcher:
+    """WSGI app choosing `staff` for the given host names and `patient` otherwise."""
+
+    def __init__(self, patient, staff, staff_hosts):
+        self.patient = patient
+        self.staff = staff
+        self.staff_hosts = {h.strip().lower() for h in staff_hosts if h.strip()}
+
+    def __call__(self, environ, start_response):
+        host = environ.get("HTTP_HOST") or environ.get("SERVER_NAME", "")
+        app = self.staff if host.rsplit(":", 1)[0].lower() in self.staff_hosts else self.patient
+        return app(environ, start_response)
+
+
+def create_app(config=None):
+    """
+    config keys (all optional, default from the environment):
+      DISPATCH: "prefix" or "host"; STAFF_PREFIX; STAFF_HOSTS (list of names);
+      PATIENT / STAFF: config mappings passed to each app's create_app
+    """
+    config = dict(config or {})
+    dispatch = config.get("DISPATCH", os.getenv("COMBINED_DISPATCH", "prefix")).lower()
+    patient = app_patient.create_app(config.get("PATIENT"))
+    staff = app_staff.create_app({"SESSION_COOKIE_NAME": "staff_session", **(config.get("STAFF") or {})})
+
+    if dispatch == "host":
+        hosts = config.get("STAFF_HOSTS") or os.getenv("COMBINED_STAFF_HOSTS", "").split(",")
+        wsgi = HostDispatcher(patient.wsgi_app, staff, hosts)
+    elif dispatch == "prefix":
+        prefix = "/" + config.get("STAFF_PREFIX", os.getenv("COMBINED_STAFF_PREFIX", "/staff")).strip("/")
+        wsgi = DispatcherMiddleware(patient.wsgi_app, {prefix: staff})
+    else:
+        raise ValueError(f"COMBINED_DISPATCH must be 'prefix' or 'host', not {dispatch!r}")
+
+    # The patient app stays the entry point (gunicorn/waitress call it);
+    # its wsgi_app is replaced by the dispatcher around both apps.
+    patient.wsgi_app = wsgi
+    return patient
+
+
+if __name__ == "__main__":
+    create_app().run(host="127.0.0.1", port=5000, threaded=True)
@@ -0,0 +1,192 @@
+"""
+Weekday demand forecast and capacity recommendations for the staff capacity screen.
+
+Inputs are small, pre-aggregated series, not appointment rows:
+  - bookings per scheduled_date for the last HISTORY_DAYS days, from
+    daily_rollups (see reports.py): a few hundred to a few thousand numbers
+  - the lead-time distribution (days between booking and visit) over the
+    last LEAD_WINDOW_DAYS, one GROUP BY on the scheduled_date index
+
+From those, per weekday:
+  - seasonality: mean bookings on that weekday / mean bookings per day
+  - forecast: exponentially weighted moving average of the recent same-weekday
+    values (newer weeks count more, so growth shows up quickly)
+  - recommended capacity: enough for RECOMMEND_QUANTILE of the recent
+    same-weekday demand, and never below the forecast
+and for the next OUTLOOK_DAYS dates, the expected final demand (bookings so
+far scaled up by the share that usually arrives later, or the weekday forecast
+if higher). Dates where that exceeds capacity are the expected overflow days.
+
+The result is cached until the appointments table or the capacity
+configuration changes (see Recommender).
+"""
+import datetime as dt
+import math
+import threading
+
+import reports
+
+WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+HISTORY_DAYS = 3 * 365
+RECENT_WEEKS = 12
+EWMA_ALPHA = 0.3
+RECOMMEND_QUANTILE = 0.85
+LEAD_WINDOW_DAYS = 56
+OUTLOOK_DAYS = 28
+
+
+def quantile(values, q):
+    """Linear-interpolated quantile of a non-empty list."""
+    s = sorted(values)
+    pos = (len(s) - 1) * q
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def ewma(values, alpha=EWMA_ALPHA):
+    level = values[0]
+    for v in values[1:]:
+        level = alpha * v + (1 - alpha) * level
+    return level
+
+
+def load_history(conn, first, last):
+    """Bookings per day for first..last as a list (index 0 = first; days without rows are 0)."""
+    series = [0] * ((last - first).days + 1)
+    rows = conn.execute(
+        "SELECT day, booked FROM daily_rollups WHERE day BETWEEN ? AND ?",
+        (first.isoformat(), last.isoformat()),
+    ).fetchall()
+    for r in rows:
+        try:
+            series[(dt.date.fromisoformat(r["day"]) - first).days] = r["booked"]
+        except (TypeError, ValueError):
+            continue
+    return series
+
+
+def load_lead_share(conn, today, window_days=LEAD_WINDOW_DAYS, max_lead=OUTLOOK_DAYS):
+    """
+    share[k] = fraction of a day's bookings that were already made k days
+    before it (1.0 at k=0), from visits in the last `window_days`.
+    """
+    rows = conn.execute(
+        """
+        SELECT CAST(julianday(scheduled_date) - julianday(date(created_at)) AS INTEGER) AS lead, COUNT(*) AS c
+          FROM appointments
+         WHERE scheduled_date BETWEEN ? AND ? AND created_at IS NOT NULL
+         GROUP BY lead
+        """,
+        ((today - dt.timedelta(days=window_days)).isoformat(), (today - dt.timedelta(days=1)).isoformat()),
+    ).fetchall()
+    counts = [0] * (max_lead + 1)
+    for r in rows:
+        lead = r["lead"]
+        if lead is not None and lead >= 0:
+            counts[min(lead, max_lead)] += r["c"]
+    total = sum(counts)
+    if not total:
+        return [1.0] * (max_lead + 1)
+    share, at_least = [], total
+    for c in counts:  # share[k] = P(lead >= k)
+        share.append(at_least / total)
+        at_least -= c
+    return share
+
+
+def weekday_stats(series, first):
+    """Per weekday: seasonality index, EWMA forecast and recommended capacity."""
+    by_weekday = [[] for _ in WEEK]
+    for i, booked in enumerate(series):
+        by_weekday[(first + dt.timedelta(days=i)).weekday()].append(booked)
+    overall = sum(series) / len(series) if series else 0
+    stats = []
+    for w, values in enumerate(by_weekday):
+        recent = values[-RECENT_WEEKS:]
+        if not recent:
+            stats.append({"day": WEEK[w], "seasonality": None, "forecast": 0, "recommended_capacity": 0})
+            continue
+        forecast = ewma(recent)
+        stats.append({
+            "day": WEEK[w],
+            "seasonality": round(sum(values) / len(values) / overall, 3) if overall else None,
+            "forecast": round(forecast, 1),
+            "recommended_capacity": math.ceil(max(quantile(recent, RECOMMEND_QUANTILE), forecast)),
+        })
+    return stats
+
+
+def recommend(conn, capacity_for, today=None):
+    """Everything GET /api/capacity/recommendations returns. capacity_for: (date) -> int"""
+    today = today or dt.date.today()
+    first = today - dt.timedelta(days=HISTORY_DAYS)
+    last = today - dt.timedelta(days=1)
+    series = load_history(conn, first, last)
+    nonzero = next((i for i, v in enumerate(series) if v), len(series))
+    series, first = series[nonzero:], first + dt.timedelta(days=nonzero)  # skip the time before the first booking
+
+    stats = weekday_stats(series, first)
+    share = load_lead_share(conn, today)
+    upcoming = load_history(conn, today, today + dt.timedelta(days=OUTLOOK_DAYS - 1))
+
+    overflow = []
+    for k, booked in enumerate(upcoming):
+        day = today + dt.timedelta(days=k)
+        expected = max(booked / share[k] if share[k] > 0 else booked, stats[day.weekday()]["forecast"])
+        capacity = capacity_for(day)
+        if expected > capacity:
+            overflow.append({
+                "date": day.isoformat(),
+                "day": WEEK[day.weekday()],
+                "capacity": capacity,
+                "booked": booked,
+                "expected": round(expected, 1),
+            })
+
+    return {
+        "history_from": first.isoformat() if series else None,
+        "history_days": len(series),
+        "weekdays": stats,
+        "overflow_days": overflow,
+    }
+
+
+class Recommender:
+    """Caches recommend() until appointments or the capacity configuration change."""
+
+    def __init__(self, connect, capacity_for, config_version):
+        """
+        connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn)
+        capacity_for: (datetime.date) -> int
+        config_version: () -> capacity configuration version (CapacityCache.version)
+        """
+        self.connect = connect
+        self.capacity_for = capacity_for
+        self.config_version = config_version
+        self._lock = threading.Lock()
+        self._cached = None  # (key, result)
+
+    def get(self):
+        reports.ensure_rollups(self.connect)
+        with self._lock:
+            conn = self.connect()
+            try:
+                key = self._key(conn)
+                if self._cached is not None and self._cached[0] == key:
+                    return self._cached[1]
+                result = recommend(conn, self.capacity_for)
+            finally:
+                conn.close()
+            self._cached = (key, result)
+            return result
+
+    def _key(self, conn):
+        # The last AUTOINCREMENT id moves on every booking; the rollup total
+        # catches deletes. Both are O(1)/O(days), not scans of appointments.
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'appointments'").fetchone()
+        booked = conn.execute(
+            "SELECT SUM(booked) AS b FROM daily_rollups WHERE day >= ?",
+            ((dt.date.today() - dt.timedelta(days=HISTORY_DAYS)).isoformat(),),
+        ).fetchone()
+        return dt.date.today(), seq["seq"] if seq else None, booked["b"], self.config_version()
@@ -0,0 +1,89 @@
+"""
+gunicorn settings for both apps (Linux/macOS).
+
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:5000 "app_patient:create_app()"
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:5001 "app_staff:create_app()"
+
+or `python serve.py both`, which does the same. Every value can be overridden
+with the environment variable named next to it.
+
+Sizing: the apps spend most of a request waiting on SQLite or on the network
+(uploads), and each worker process keeps its own caches and refresher threads.
+So a few processes with several threads each beat the classic 2*CPU+1
+single-threaded workers; with one SQLite writer, more processes mostly add
+lock waits. benchmarks/bench_serve.py measures this on the host.
+
+Background jobs: the staff app's backup and upload sweeper threads, and the
+patient app's upload expiry thread, must run in exactly one process. Threads
+do not survive a fork (one started in the preloading master would run there
+only), and every worker starting its own would multiply them. So create_app
+leaves them alone here (STAFF_JOBS=hook, PATIENT_JOBS=hook) and
+post_worker_init below starts each app's jobs in whichever worker holds
+yarab/run/staff-jobs.lock or yarab/run/patient-jobs.lock. The other workers
+wait for it, so a recycled worker's jobs move to another one.
+
+Reload: the app is preloaded in the master, so workers fork with every module
+already imported. `kill -HUP <master>` restarts workers gracefully with the
+same code; `python serve.py reload` swaps in new code without dropping
+connections (USR2, then a graceful stop of the old master).
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+# app module -> (environment variable, lock file) for its background jobs
+JOBS = {
+    "app_staff": ("STAFF_JOBS", os.path.join(HERE, "yarab", "run", "staff-jobs.lock")),
+    "app_patient": ("PATIENT_JOBS", os.path.join(HERE, "yarab", "run", "patient-jobs.lock")),
+}
+for _env, _ in JOBS.values():
+    os.environ.setdefault(_env, "hook")
+
+workers = int(os.getenv("WEB_WORKERS", str(min(multiprocessing.cpu_count(), 4))))  # WEB_WORKERS
+threads = int(os.getenv("WEB_THREADS", "8"))  # WEB_THREADS
+worker_class = "gthread"
+
+# Import the app once in the master. Caches, refresher threads and database
+# connections are created lazily, on the first request in each worker; the apps'
+# background jobs are started by post_worker_init, never in the master.
+preload_app = os.getenv("WEB_PRELOAD", "1").lower() in {"1", "true", "yes"}  # WEB_PRELOAD
+
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))  # WEB_TIMEOUT: slow uploads on phones
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))  # WEB_GRACEFUL_TIMEOUT
+keepalive = 5
+
+# Recycle workers now and then; the jitter keeps them from restarting together
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "5000"))  # WEB_MAX_REQUESTS
+max_requests_jitter = max_requests // 10
+
+pidfile = os.getenv("WEB_PIDFILE") or None  # set per service by serve.py
+accesslog = os.getenv("WEB_ACCESS_LOG") or None  # WEB_ACCESS_LOG ("-" for stdout)
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    for name, (env, lock) in JOBS.items():
+        app = sys.modules.get(name)
+        if app is None or os.environ.get(env) != "hook":
+            continue  # app not served here, or its jobs started elsewhere
+        threading.Thread(target=_lead_jobs, args=(app, lock, worker.log),
+                         name=f"{name}-jobs", daemon=True).start()
+
+
+def _lead_jobs(app, lock, log):
+    """Start the app's jobs once this worker holds `lock`; it is released when the worker exits."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(lock), exist_ok=True)
+    fd = os.open(lock, os.O_CREAT | os.O_RDWR, 0o644)
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            time.sleep(15)
+    log.info("Starting %s background jobs in worker %s", app.__name__, os.getpid())
+    app.start_background_jobs()
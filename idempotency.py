@@ -0,0 +1,228 @@
+"""
+Idempotency-Key support for the booking POSTs.
+
+    @app.route("/api/patient/book", methods=["POST"])
+    @IDEMPOTENCY.idempotent("patient-book")
+    def book_appointment(): ...
+
+A request without the header runs as before. With it, the first request claims
+the key (a row with status NULL), runs the view, and stores a 2xx response;
+any other outcome releases the key so the client can retry. A repeated key
+gets the stored response back with `Idempotent-Replayed: true` before the view
+runs, so no upload is saved and no capacity is checked. If the first attempt
+is still running, the repeat waits for it (an in-process Event, or polling the
+row when the first attempt is in the other app process) for up to
+`wait_seconds`, then answers 409.
+
+The claim also stores a hash of the request (method, path and body; for
+multipart forms the fields and file contents, since the boundary changes on
+every send). A key sent again with a different request gets 422 instead of
+the first request's response.
+
+A view that cannot tell the outcome yet (a queued booking past its timeout)
+calls defer() and answers 202. The key then stays claimed, and the finish
+function defer() returned stores the real response once it is known, or
+releases the key, from whatever thread learns it. Until then a repeat waits
+as above; afterwards it gets that response.
+
+Keys live in the idempotency_keys table for IDEMPOTENCY_TTL_HOURS (default 24).
+A claim older than STALE_SECONDS whose request never finished (the process
+died) is taken over by the next attempt.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, request
+
+import schema
+
+MIGRATION = "2026-10-19_add_idempotency_keys.sql"
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+STALE_SECONDS = 120
+PURGE_EVERY = 500  # claims between deletes of expired keys
+
+
+def fingerprint():
+    """sha256 of the current request: method, path and body (multipart: fields and file contents)."""
+    h = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    if request.mimetype == "multipart/form-data":
+        for name, value in sorted(request.form.items(multi=True)):
+            h.update(f"{name}={value}\n".encode())
+        for name, storage in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            h.update(f"{name}:{storage.filename}:".encode())
+            for block in iter(lambda: storage.stream.read(1 << 16), b""):
+                h.update(block)
+            storage.stream.seek(0)  # the view saves it
+            h.update(b"\n")
+    else:
+        h.update(request.get_data(cache=True))
+    return h.hexdigest()
+
+
+def defer():
+    """
+    In an idempotent view about to answer 202: keep the key claimed after this
+    request and return finish(status, body), which stores the final response
+    (status 2xx, body JSON text) or releases the key (anything else). None when
+    the request has no Idempotency-Key.
+    """
+    finish = g.get("idempotency_finish")
+    if finish is not None:
+        g.idempotency_deferred = True
+    return finish
+
+
+class IdempotencyStore:
+    def __init__(self, connect, ttl_hours=None, wait_seconds=10.0):
+        """connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn)"""
+        self.connect = connect
+        self.ttl = 3600 * (ttl_hours if ttl_hours is not None else float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._in_flight = {}  # (scope, key) -> Event set when this process finishes the request
+        self._claims = 0
+
+    def idempotent(self, scope):
+        """Decorator for a Flask view; `scope` keeps keys of different endpoints apart."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = request.headers.get(HEADER)
+                if not key:
+                    return fn(*args, **kwargs)
+                if len(key) > MAX_KEY_LENGTH:
+                    return jsonify({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+                return self._run(scope, key, fingerprint(), lambda: fn(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    # ------------- protocol -------------
+
+    def _run(self, scope, key, request_hash, view):
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            stored = self._lookup(scope, key)
+            if stored is None:
+                if self._claim(scope, key, request_hash):
+                    break
+                continue  # lost the race for the claim: look again
+            status, body, stored_hash = stored
+            if stored_hash is not None and stored_hash != request_hash:
+                return jsonify({"error": f"This {HEADER} was already used with a different request"}), 422
+            if status is not None:
+                return self._replay(status, body)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return jsonify({"error": "A request with this Idempotency-Key is still being processed"}), 409
+            event = self._in_flight.get((scope, key))
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(0.05, remaining))  # first attempt is in another process
+
+        event = threading.Event()
+        self._in_flight[(scope, key)] = event
+        store = self._get_current_object() if hasattr(self, "_get_current_object") else self  # usable off-request
+        g.idempotency_finish = lambda status, body: (
+            store._store(scope, key, status, body) if status and 200 <= status < 300 else store._release(scope, key)
+        )
+        try:
+            resp = current_app.make_response(view())
+            if resp.status_code == 202 and g.pop("idempotency_deferred", False):
+                pass  # the finish function settles the key
+            elif 200 <= resp.status_code < 300:
+                self._store(scope, key, resp.status_code, resp.get_data(as_text=True))
+            else:
+                self._release(scope, key)
+            return resp
+        except BaseException:
+            self._release(scope, key)
+            raise
+        finally:
+            self._in_flight.pop((scope, key), None)
+            event.set()
+
+    def _replay(self, status, body):
+        resp = Response(body, status=status, mimetype="application/json")
+        resp.headers["Idempotent-Replayed"] = "true"
+        return resp
+
+    # ------------- storage -------------
+
+    def _conn(self):
+        conn = self.connect()
+        schema.ensure(conn, MIGRATION)
+        schema.ensure_column(conn, "idempotency_keys", "request_hash", "TEXT")  # NULL on keys stored before it
+        return conn
+
+    def _lookup(self, scope, key):
+        conn = self._conn()
+        try:
+            row = conn.execute(
+                "SELECT status, body, request_hash, created_at FROM idempotency_keys WHERE scope = ? AND key = ?",
+                (scope, key),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row["created_at"] < now - self.ttl:
+                return None  # expired: _claim replaces it
+            if row["status"] is None and row["created_at"] < now - STALE_SECONDS:
+                return None  # abandoned claim: _claim takes it over
+            return row["status"], row["body"], row["request_hash"]
+        finally:
+            conn.close()
+
+    def _claim(self, scope, key, request_hash):
+        now = time.time()
+        conn = self._conn()
+        try:
+            try:
+                conn.execute(
+                    "INSERT INTO idempotency_keys (scope, key, status, body, request_hash, created_at) "
+                    "VALUES (?, ?, NULL, NULL, ?, ?)",
+                    (scope, key, request_hash, now),
+                )
+                claimed = True
+            except sqlite3.IntegrityError:
+                # Only an expired or abandoned row may be taken over
+                cur = conn.execute(
+                    """
+                    UPDATE idempotency_keys SET status = NULL, body = NULL, request_hash = ?, created_at = ?
+                     WHERE scope = ? AND key = ? AND (created_at < ? OR (status IS NULL AND created_at < ?))
+                    """,
+                    (request_hash, now, scope, key, now - self.ttl, now - STALE_SECONDS),
+                )
+                claimed = cur.rowcount == 1
+            with self._lock:
+                self._claims += 1
+                purge = self._claims % PURGE_EVERY == 0
+            if purge:
+                conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - self.ttl,))
+            conn.commit()
+            return claimed
+        finally:
+            conn.close()
+
+    def _store(self, scope, key, status, body):
+        conn = self._conn()
+        try:
+            conn.execute(
+                "UPDATE idempotency_keys SET status = ?, body = ? WHERE scope = ? AND key = ?", (status, body, scope, key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _release(self, scope, key):
+        conn = self._conn()
+        try:
+            conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND status IS NULL", (scope, key))
+            conn.commit()
+        finally:
+            conn.close()
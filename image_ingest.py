@@ -0,0 +1,258 @@
+"""
+Shrink booking photos after they are stored.
+
+Phones send full-resolution photos (often 5-12 MB PNG or HEIC) and every
+staff screen loads them. After a booking commits, each of its images is
+queued to a process pool. The request thread does not wait for it. A worker:
+  - decodes the image, turning it upright from its EXIF orientation,
+  - downsizes it so its longer side is at most IMAGE_MAX_DIM (1600) pixels,
+  - re-encodes it as IMAGE_FORMAT (webp, or jpeg) at IMAGE_QUALITY (80),
+    without EXIF, GPS or any other metadata.
+
+The new file is written next to the original (img_<ts>.webp). The
+appointment is then pointed at it, and the original is deleted. With
+IMAGE_KEEP_ORIGINALS=1 the original is moved to IMAGE_COLD_DIR instead
+(yarab/originals/<same path>), which can be a cheaper volume. Anything the
+worker cannot decode, or that comes out no smaller, is left as it was.
+
+Needs Pillow (in yarab/requirements.txt; add `pillow-heif` for HEIC). Without
+Pillow, or with IMAGE_INGEST=0, images are stored as uploaded; a missing
+Pillow is logged once when the app starts.
+
+    python image_ingest.py [--dry-run] [--db FILE ...]   # shrink images already stored
+
+/api/metrics reports images_ingested_total{result}, image_ingest_seconds and
+image_ingest_saved_bytes_total.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+from schema import ro_uri
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+BASE = os.path.join(HERE, "yarab")  # stored paths are relative to this ("uploads/patients/...")
+FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+log = logging.getLogger(__name__)
+
+
+def available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def shrink(src, max_dim, fmt, quality):
+    """
+    Runs in a pool worker. Writes the re-encoded copy of `src` next to it and
+    returns its path, or None when `src` is not an image Pillow can read.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        import pillow_heif
+        pillow_heif.register_heif_opener()
+    except ImportError:
+        pass
+
+    pil_format, ext = FORMATS[fmt]
+    try:
+        with Image.open(src) as img:
+            img.draft("RGB", (max_dim, max_dim))  # JPEG: decode at a reduced scale straight away
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+            if img.mode not in ("RGB", "RGBA") or (pil_format == "JPEG" and img.mode == "RGBA"):
+                rgba = img.convert("RGBA")
+                if pil_format == "JPEG":
+                    img = Image.new("RGB", rgba.size, (255, 255, 255))
+                    img.paste(rgba, mask=rgba.getchannel("A"))
+                else:
+                    img = rgba
+            # A new image carries no info/exif/icc, so nothing of the original's metadata is written
+            clean = Image.new(img.mode, img.size)
+            clean.paste(img)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    stem = os.path.splitext(src)[0]
+    dest = stem + ext if stem + ext != src else stem + "_s" + ext
+    tmp = dest + ".tmp"
+    save = {"quality": quality}
+    if pil_format == "JPEG":
+        save.update(optimize=True, progressive=True)
+    else:
+        save.update(method=4)
+    clean.save(tmp, pil_format, **save)
+    os.replace(tmp, dest)
+    return dest
+
+
+class ImageIngest:
+    def __init__(self, base=BASE, max_dim=None, fmt=None, quality=None, keep_originals=None, cold_dir=None,
+                 workers=None):
+        self.base = base
+        self.max_dim = max_dim or int(os.getenv("IMAGE_MAX_DIM", "1600"))
+        self.fmt = (fmt or os.getenv("IMAGE_FORMAT", "webp")).lower()
+        if self.fmt not in FORMATS:
+            raise ValueError(f"IMAGE_FORMAT must be one of {', '.join(FORMATS)}, not {self.fmt!r}")
+        self.quality = quality or int(os.getenv("IMAGE_QUALITY", "80"))
+        self.keep_originals = (
+            keep_originals if keep_originals is not None
+            else os.getenv("IMAGE_KEEP_ORIGINALS", "").lower() in {"1", "true", "yes"}
+        )
+        self.cold_dir = cold_dir or os.getenv("IMAGE_COLD_DIR", os.path.join(base, "originals"))
+        self.workers = workers or int(os.getenv("IMAGE_INGEST_WORKERS", "2"))
+        self.saved_bytes = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """An ImageIngest, or None when IMAGE_INGEST=0 or Pillow is missing."""
+        setting = os.getenv("IMAGE_INGEST", "auto").lower()
+        if setting in {"0", "false", "no", "off"}:
+            return None
+        if not available():
+            log.warning("Pillow is not installed (pip install Pillow); booking images are stored as uploaded")
+            return None
+        return cls()
+
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+                    # spawn: forking a threaded server process can copy a held lock into the child
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def submit(self, rel_path, connect, national_id):
+        """
+        Queue one stored image ("uploads/patients/..."); `connect` opens the
+        database of the appointment that refers to it. Returns the future.
+        """
+        src = os.path.join(self.base, *rel_path.split("/"))
+        t0 = time.perf_counter()
+        fut = self.pool().submit(shrink, src, self.max_dim, self.fmt, self.quality)
+        fut.add_done_callback(lambda f: self._finish(f, src, rel_path, connect, national_id, t0))
+        return fut
+
+    def _finish(self, fut, src, rel_path, connect, national_id, t0):
+        try:
+            dest = fut.result()
+        except Exception as exc:
+            REGISTRY.inc("images_ingested_total", (("result", "error"),))
+            log.warning("could not shrink %s: %s", rel_path, exc)
+            return
+        REGISTRY.observe("image_ingest_seconds", time.perf_counter() - t0)
+        if dest is None:
+            REGISTRY.inc("images_ingested_total", (("result", "skipped"),))
+            return
+        try:
+            self.replace(src, dest, rel_path, connect, national_id)
+        except Exception as exc:
+            REGISTRY.inc("images_ingested_total", (("result", "error"),))
+            log.warning("could not replace %s: %s", rel_path, exc)
+
+    def replace(self, src, dest, rel_path, connect, national_id):
+        """Point the appointment at the shrunken copy, then retire the original."""
+        before, after = os.path.getsize(src), os.path.getsize(dest)
+        if after >= before:  # already small (a compact JPEG, a tiny PNG): keep the original
+            os.remove(dest)
+            REGISTRY.inc("images_ingested_total", (("result", "larger"),))
+            return None
+        new_rel = os.path.relpath(dest, self.base).replace(os.sep, "/")
+        conn = connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "UPDATE appointments SET image_paths = replace(image_paths, ?, ?) "
+                    "WHERE national_id = ? AND instr(image_paths, ?) > 0",
+                    (rel_path, new_rel, national_id, rel_path),
+                )
+        finally:
+            conn.close()
+        if cur.rowcount == 0:  # appointment deleted or edited meanwhile: keep what it had
+            os.remove(dest)
+            REGISTRY.inc("images_ingested_total", (("result", "stale"),))
+            return None
+
+        if self.keep_originals:
+            cold = os.path.join(self.cold_dir, os.path.relpath(src, self.base))
+            os.makedirs(os.path.dirname(cold), exist_ok=True)
+            os.replace(src, cold)
+        else:
+            os.remove(src)
+        REGISTRY.inc("images_ingested_total", (("result", "ok"),))
+        self.saved_bytes += before - after
+        REGISTRY.inc("image_ingest_saved_bytes_total", value=before - after)
+        return new_rel
+
+
+def _connector(path):
+    import sqlite3
+
+    def connect():
+        return sqlite3.connect(path, timeout=30)
+    return connect
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Downsize and re-encode booking images already stored")
+    parser.add_argument("--dry-run", action="store_true", help="only count the images and their size")
+    parser.add_argument("--db", action="append", default=None,
+                        help="database to update (repeatable); default: every clinic's database")
+    args = parser.parse_args(argv)
+    if not args.dry_run and not available():
+        print("❌ Pillow is not installed (pip install Pillow)")
+        return 1
+
+    import sqlite3
+    from storage import decode_image_paths
+    if args.db:
+        paths = args.db
+    else:
+        import services  # DENTAL_DB and CLINICS
+        paths = [c.db_path for c in services.CLINICS.values()]
+
+    ingest = ImageIngest()
+    target_ext = FORMATS[ingest.fmt][1]
+    futures, total = [], 0
+    for path in paths:
+        conn = sqlite3.connect(ro_uri(path), uri=True, timeout=30)
+        try:
+            rows = conn.execute(
+                "SELECT national_id, image_paths FROM appointments WHERE image_paths IS NOT NULL AND image_paths != ''"
+            ).fetchall()
+        finally:
+            conn.close()
+        for national_id, image_paths in rows:
+            for rel in decode_image_paths(image_paths):
+                full = os.path.join(ingest.base, *rel.split("/"))
+                if rel.endswith(target_ext) or not os.path.isfile(full):
+                    continue  # already done, or gone
+                total += os.path.getsize(full)
+                if args.dry_run:
+                    futures.append(None)
+                else:
+                    futures.append(ingest.submit(rel, _connector(path), national_id))
+
+    print(f"{len(futures)} images to shrink, {total / 1e6:.1f} MB")
+    if args.dry_run or not futures:
+        return 0
+    t0 = time.perf_counter()
+    for fut in futures:
+        fut.exception()  # wait; failures are counted and printed by the callback
+    ingest.pool().shutdown(wait=True)  # callbacks have run once the pool is down
+    print(f"done in {time.perf_counter() - t0:.1f}s, {ingest.saved_bytes / 1e6:.1f} MB saved")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,147 @@
+"""
+Today's queue, precomputed for patients polling their position.
+
+One query over today's appointments (scheduled_date index) builds a dict
+ticket -> queue entry: how many pending tickets are ahead by per-day sequence
+(digits 9-11 of the ticket number), and an estimated wait from recent
+completion_hour throughput. A lookup is one dict access, so thousands of
+phones polling GET /api/patient/queue/<ticket> cost no SQL.
+
+The snapshot is rebuilt when the database changes (a booking, a status change
+in the staff app): a background thread (refresher.py) watches PRAGMA data_version every
+QUEUE_REFRESH_SECONDS.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+
+from refresher import DataVersionWatcher
+
+THROUGHPUT_DAYS = 7  # completion_hour history used for minutes per patient
+DEFAULT_MINUTES = float(os.getenv("QUEUE_DEFAULT_MINUTES", "15"))  # until there is history
+
+
+def day_sequence(ticket_number: int) -> int:
+    """Per-day sequence (001..999) from a YYYYMMDD SSS LLLL ticket number."""
+    return (int(ticket_number) // 10000) % 1000
+
+
+def _minutes(hhmm):
+    try:
+        hh, mm = str(hhmm).split(":")
+        return int(hh) * 60 + int(mm)
+    except ValueError:
+        return None
+
+
+def minutes_per_patient(completions_by_day) -> float:
+    """
+    Average minutes between consecutive completions, pooled over days:
+    {date: [completion minutes]} -> sum of (last - first) / sum of (count - 1).
+    """
+    span = intervals = 0
+    for minutes in completions_by_day.values():
+        if len(minutes) >= 2:
+            span += max(minutes) - min(minutes)
+            intervals += len(minutes) - 1
+    return span / intervals if intervals and span > 0 else DEFAULT_MINUTES
+
+
+def etag(entry) -> str:
+    """
+    ETag for a queue entry, taken from its content (as_of aside): every worker
+    returns the same tag until the ticket's position, status or wait changes.
+    """
+    body = json.dumps({k: v for k, v in entry.items() if k != "as_of"}, sort_keys=True).encode()
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class TodayQueue:
+    def __init__(self, connect, refresh_seconds=None):
+        """
+        connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn);
+        appointments.slot_time must exist (SlotAllocator.prepare)
+        """
+        self.connect = connect
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None else float(os.getenv("QUEUE_REFRESH_SECONDS", "2"))
+        )
+        self._lock = threading.Lock()
+        self._state = None  # (date, {ticket: entry}), swapped atomically
+        self._watcher = DataVersionWatcher("queue-refresh", connect, self._poll, self.refresh_seconds)
+
+    def _current(self):
+        state = self._state
+        if state is None or state[0] != dt.date.today():
+            self.rebuild()
+            self._watcher.start()
+            state = self._state
+        return state
+
+    def lookup(self, ticket: int):
+        """Queue entry for a ticket scheduled today, or None."""
+        return self._current()[1].get(ticket)
+
+    def invalidate(self):
+        """Forget the snapshot after a local write; the next lookup rebuilds it."""
+        with self._lock:
+            self._state = None
+
+    def rebuild(self):
+        today = dt.date.today()
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                """
+                SELECT id, ticket_number, COALESCE(status,'pending') AS status, slot_time
+                  FROM appointments WHERE scheduled_date = ?
+                """,
+                (today.isoformat(),),
+            ).fetchall()
+            history = conn.execute(
+                """
+                SELECT scheduled_date, completion_hour FROM appointments
+                 WHERE scheduled_date BETWEEN ? AND ? AND status = 'completed' AND completion_hour IS NOT NULL
+                """,
+                ((today - dt.timedelta(days=THROUGHPUT_DAYS)).isoformat(), today.isoformat()),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        completions = {}
+        for r in history:
+            m = _minutes(r["completion_hour"])
+            if m is not None:
+                completions.setdefault(r["scheduled_date"], []).append(m)
+        per_patient = minutes_per_patient(completions)
+        as_of = dt.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+        rows = [r for r in rows if r["ticket_number"] is not None]
+        rows.sort(key=lambda r: (day_sequence(r["ticket_number"]), r["id"]))
+        entries, ahead = {}, 0
+        for r in rows:
+            pending = r["status"] == "pending"
+            entries[int(r["ticket_number"])] = {
+                "ticket_number": str(r["ticket_number"]),
+                "date": today.isoformat(),
+                "status": r["status"],
+                "slot_time": r["slot_time"],
+                "position": ahead + 1 if pending else None,
+                "ahead": ahead if pending else 0,
+                "estimated_wait_minutes": round(ahead * per_patient) if pending else 0,
+                "minutes_per_patient": round(per_patient, 1),
+                "as_of": as_of,
+            }
+            if pending:
+                ahead += 1
+        with self._lock:
+            self._state = (today, entries)
+
+    # ------------- cross-process refresh -------------
+
+    def _poll(self, conn, changed):
+        state = self._state
+        if changed or state is None or state[0] != dt.date.today():
+            self.rebuild()
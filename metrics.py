@@ -0,0 +1,312 @@
+"""
+Request and SQL metrics shared by app_patient.py and app_staff.py.
+
+Each app calls `init_app(app, "<service>")` once and opens its connections with
+`connect(path)`. Everything is kept in-process and rendered at /api/metrics in
+the Prometheus text format. Request series carry an app="<service>" label, so
+the patient and staff apps stay apart when they share a process (combined.py).
+
+/api/metrics is served by the staff app. The public patient app serves it only
+when METRICS_TOKEN is set. With METRICS_TOKEN set, both require
+`Authorization: Bearer <token>`; without it, the staff app requires a staff
+login.
+
+The write lock is timed on its own: a transaction's first INSERT, UPDATE,
+DELETE or REPLACE is preceded by an explicit BEGIN IMMEDIATE (where the sqlite3
+module would have issued a plain BEGIN), and the time that BEGIN takes,
+busy-timeout retries included, is db_write_lock_wait_seconds.
+"""
+import hmac
+import os
+import sqlite3
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+from flask import Response, jsonify, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+BYTES_BUCKETS = (1024, 16384, 131072, 1048576, 4194304, 16777216, 67108864)
+
+HELP = {
+    "http_requests_total": ("counter", "Requests handled, by endpoint, method and status"),
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled"),
+    "http_request_sql_queries": ("histogram", "SQL statements executed per request"),
+    "http_request_sql_seconds": ("histogram", "Cumulative SQL time per request"),
+    "http_request_body_bytes": ("histogram", "Request body size (uploads) by endpoint"),
+    "db_connect_seconds": ("histogram", "Time to open a SQLite connection"),
+    "db_commit_seconds": ("histogram", "Time spent in COMMIT (write lock + fsync)"),
+    "db_write_lock_wait_seconds": ("histogram", "Time waiting for the write lock (BEGIN IMMEDIATE, busy retries included)"),
+    "db_locked_errors_total": ("counter", "Statements that failed with 'database is locked'"),
+    "booking_batch_size": ("histogram", "Bookings committed per group-commit transaction"),
+    "admission_rejected_total": ("counter", "Booking requests shed with 429, by reason"),
+    "admission_wait_seconds": ("histogram", "Time booking requests waited for a concurrency slot"),
+    "booking_active": ("gauge", "Booking requests currently running"),
+    "booking_queue_waiting": ("gauge", "Booking requests waiting for a concurrency slot"),
+    "reporting_reads_total": ("counter", "Staff report connections, by endpoint and source (live or snapshot)"),
+    "reporting_snapshot_seconds": ("histogram", "Time to copy a reporting snapshot with the backup API"),
+    "http_request_duration_during_job_seconds": ("histogram", "Request latency while a background job (backup) runs"),
+    "backup_duration_seconds": ("histogram", "Time to take one online backup"),
+    "backup_restarts_total": ("counter", "Backups restarted because the database was written mid-copy"),
+    "backup_failures_total": ("counter", "Backups that failed"),
+    "backup_last_success_timestamp": ("gauge", "Unix time of the last successful backup"),
+    "backup_last_bytes": ("gauge", "Size of the last backup file"),
+    "uploads_orphans_total": ("counter", "Uploaded files no appointment refers to, by action taken"),
+    "uploads_reclaimed_bytes_total": ("counter", "Bytes moved out of the uploads tree by the sweeper"),
+    "uploads_last_sweep_timestamp": ("gauge", "Unix time of the last upload sweep"),
+    "images_ingested_total": ("counter", "Booking images processed by the ingest pool, by result"),
+    "image_ingest_seconds": ("histogram", "Time from queueing an image to its re-encoded copy being written"),
+    "image_ingest_saved_bytes_total": ("counter", "Bytes saved by downsizing and re-encoding booking images"),
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Thread-safe counters, gauges and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def gauge_set(self, name, value, labels=()):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self, extra_labels=()):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(
+                ((k, (h.buckets, list(h.counts), h.total, h.count)) for k, h in self._histograms.items()),
+                key=lambda item: item[0],
+            )
+
+        lines, seen = [], set()
+
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, text = HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters + gauges:
+            header(name)
+            lines.append(f"{name}{_fmt_labels(extra_labels + labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            header(name)
+            running = 0
+            for bound, n in zip(buckets, counts):
+                running += n
+                lines.append(f"{name}_bucket{_fmt_labels(extra_labels + labels + (('le', repr(float(bound))),))} {running}")
+            lines.append(f"{name}_bucket{_fmt_labels(extra_labels + labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_fmt_labels(extra_labels + labels)} {total}")
+            lines.append(f"{name}_count{_fmt_labels(extra_labels + labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+# Per-request SQL tally: [query count, seconds]; None outside a request
+_local = threading.local()
+
+# Background jobs running in this process (name -> count), see background_job()
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+@contextmanager
+def background_job(name):
+    """Mark a job as running: requests finished meanwhile are also timed under its name."""
+    with _jobs_lock:
+        _jobs[name] = _jobs.get(name, 0) + 1
+    try:
+        yield
+    finally:
+        with _jobs_lock:
+            _jobs[name] -= 1
+            if not _jobs[name]:
+                del _jobs[name]
+
+
+# ------------- SQLITE INSTRUMENTATION -------------
+
+_WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+_LEGACY = getattr(sqlite3, "LEGACY_TRANSACTION_CONTROL", -1)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.Connection that reports statement count/time, write lock wait and commit time."""
+
+    def _begin_write(self, sql):
+        # Only where the module would open the transaction implicitly; autocommit
+        # connections and explicit transactions are left alone
+        if (self.in_transaction or self.isolation_level is None or getattr(self, "autocommit", _LEGACY) != _LEGACY
+                or not sql.lstrip()[:7].upper().startswith(_WRITES)):
+            return
+        mode = self.isolation_level.upper() if self.isolation_level.upper() in ("IMMEDIATE", "EXCLUSIVE") else "IMMEDIATE"
+        t0 = perf_counter()
+        try:
+            super().execute(f"BEGIN {mode}")
+        except sqlite3.OperationalError as exc:
+            if "locked" in str(exc):
+                REGISTRY.inc("db_locked_errors_total")
+            raise
+        finally:
+            REGISTRY.observe("db_write_lock_wait_seconds", perf_counter() - t0)
+
+    def execute(self, sql, parameters=()):
+        t0 = perf_counter()
+        try:
+            self._begin_write(sql)
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as exc:
+            if "locked" in str(exc):
+                REGISTRY.inc("db_locked_errors_total")
+            raise
+        finally:
+            _record_sql(perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = perf_counter()
+        try:
+            self._begin_write(sql)
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(perf_counter() - t0)
+
+    def commit(self):
+        t0 = perf_counter()
+        try:
+            return super().commit()
+        except sqlite3.OperationalError as exc:
+            if "locked" in str(exc):
+                REGISTRY.inc("db_locked_errors_total")
+            raise
+        finally:
+            REGISTRY.observe("db_commit_seconds", perf_counter() - t0)
+
+
+def _record_sql(elapsed):
+    tally = getattr(_local, "sql", None)
+    if tally is not None:
+        tally[0] += 1
+        tally[1] += elapsed
+
+
+def connect(path, factory=TimedConnection, **kwargs):
+    """sqlite3.connect with connection-open time recorded."""
+    t0 = perf_counter()
+    conn = sqlite3.connect(path, factory=factory, **kwargs)
+    REGISTRY.observe("db_connect_seconds", perf_counter() - t0)
+    return conn
+
+
+# ------------- FLASK HOOKS -------------
+
+def init_app(app, service, endpoint=False, guard=None):
+    """
+    Register timing hooks on `app`, and GET /api/metrics when `endpoint` is set or METRICS_TOKEN is.
+    guard: view decorator protecting /api/metrics when METRICS_TOKEN is not set (e.g. a login check).
+    """
+    app_label = (("app", service),)
+
+    @app.before_request
+    def _metrics_start():
+        _local.start = perf_counter()
+        _local.sql = [0, 0.0]
+        REGISTRY.gauge_add("http_requests_in_flight", 1, app_label)
+
+    @app.after_request
+    def _metrics_record(resp):
+        start = getattr(_local, "start", None)
+        if start is None:
+            return resp
+        elapsed = perf_counter() - start
+        rule = request.url_rule
+        labels = app_label + (("endpoint", rule.rule if rule is not None else "unmatched"),)
+        queries, sql_seconds = _local.sql
+        REGISTRY.inc("http_requests_total", labels + (("method", request.method), ("status", resp.status_code)))
+        REGISTRY.observe("http_request_duration_seconds", elapsed, labels)
+        for job in list(_jobs):
+            REGISTRY.observe("http_request_duration_during_job_seconds", elapsed, app_label + (("job", job),))
+        REGISTRY.observe("http_request_sql_queries", queries, labels, QUERY_COUNT_BUCKETS)
+        REGISTRY.observe("http_request_sql_seconds", sql_seconds, labels)
+        if request.content_length:
+            REGISTRY.observe("http_request_body_bytes", request.content_length, labels, BYTES_BUCKETS)
+        return resp
+
+    @app.teardown_request
+    def _metrics_finish(exc):
+        if getattr(_local, "start", None) is not None:
+            REGISTRY.gauge_add("http_requests_in_flight", -1, app_label)
+        _local.start = None
+        _local.sql = None
+
+    token = os.getenv("METRICS_TOKEN", "")
+    if not (endpoint or token):
+        return app
+
+    def metrics_endpoint():
+        if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return jsonify({"error": "Unauthorized"}), 401
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    if guard is not None and not token:
+        metrics_endpoint = guard(metrics_endpoint)
+    app.add_url_rule("/api/metrics", "metrics_endpoint", metrics_endpoint, methods=["GET"])
+    return app
@@ -0,0 +1,8 @@
+-- Requires appointments.slot_time (TEXT, HH:MM) and appointments.slot_chair
+-- (INTEGER, 1-based); slots.py adds them if missing:
+--   ALTER TABLE appointments ADD COLUMN slot_time TEXT;
+--   ALTER TABLE appointments ADD COLUMN slot_chair INTEGER;
+-- One patient per chair per slot: a booking that loses a race fails here.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_slot
+    ON appointments(scheduled_date, slot_time, slot_chair)
+    WHERE slot_time IS NOT NULL;
@@ -0,0 +1,21 @@
+-- Date-specific capacity (public holidays, doctor leave, extra sessions).
+-- An override applies to every date in start_date..end_date (inclusive) and
+-- replaces the weekday capacity from daily_capacity; the newest one wins.
+CREATE TABLE IF NOT EXISTS capacity_overrides (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    reason TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_capacity_overrides_end_date ON capacity_overrides(end_date);
+
+INSERT OR IGNORE INTO config_version (name, version) VALUES ('capacity_overrides', 0);
+
+CREATE TRIGGER IF NOT EXISTS capacity_overrides_version_ins AFTER INSERT ON capacity_overrides
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'capacity_overrides'; END;
+CREATE TRIGGER IF NOT EXISTS capacity_overrides_version_upd AFTER UPDATE ON capacity_overrides
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'capacity_overrides'; END;
+CREATE TRIGGER IF NOT EXISTS capacity_overrides_version_del AFTER DELETE ON capacity_overrides
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'capacity_overrides'; END;
@@ -0,0 +1,14 @@
+-- Version counter bumped on every daily_capacity change, so app processes can
+-- tell their cached capacity configuration is stale with one indexed read.
+CREATE TABLE IF NOT EXISTS config_version (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO config_version (name, version) VALUES ('daily_capacity', 0);
+
+CREATE TRIGGER IF NOT EXISTS daily_capacity_version_ins AFTER INSERT ON daily_capacity
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'daily_capacity'; END;
+CREATE TRIGGER IF NOT EXISTS daily_capacity_version_upd AFTER UPDATE ON daily_capacity
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'daily_capacity'; END;
+CREATE TRIGGER IF NOT EXISTS daily_capacity_version_del AFTER DELETE ON daily_capacity
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'daily_capacity'; END;
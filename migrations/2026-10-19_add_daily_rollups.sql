@@ -0,0 +1,79 @@
+-- Per-day appointment counts for /api/reports, kept current by triggers on
+-- appointments and rebuilt from scratch by `python reports.py backfill`.
+-- completion_minutes is the sum of completion_hour (as minutes after midnight)
+-- over the completed appointments that have one (completion_count of them).
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day TEXT PRIMARY KEY,
+    booked INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    pending INTEGER NOT NULL DEFAULT 0,
+    completion_minutes INTEGER NOT NULL DEFAULT 0,
+    completion_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- One row per rollup table once a full backfill has finished
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    backfilled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS appointments_rollup_ins AFTER INSERT ON appointments
+WHEN NEW.scheduled_date IS NOT NULL
+BEGIN
+    INSERT INTO daily_rollups (day, booked, completed, pending, completion_minutes, completion_count)
+    VALUES (
+        NEW.scheduled_date, 1,
+        NEW.status IS 'completed',
+        COALESCE(NEW.status, 'pending') = 'pending',
+        CASE WHEN NEW.status IS 'completed' AND NEW.completion_hour IS NOT NULL
+             THEN CAST(substr(NEW.completion_hour, 1, 2) AS INTEGER) * 60 + CAST(substr(NEW.completion_hour, 4, 2) AS INTEGER) ELSE 0 END,
+        NEW.status IS 'completed' AND NEW.completion_hour IS NOT NULL
+    )
+    ON CONFLICT(day) DO UPDATE SET
+        booked = booked + excluded.booked,
+        completed = completed + excluded.completed,
+        pending = pending + excluded.pending,
+        completion_minutes = completion_minutes + excluded.completion_minutes,
+        completion_count = completion_count + excluded.completion_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_rollup_del AFTER DELETE ON appointments
+WHEN OLD.scheduled_date IS NOT NULL
+BEGIN
+    UPDATE daily_rollups SET
+        booked = booked - 1,
+        completed = completed - (OLD.status IS 'completed'),
+        pending = pending - (COALESCE(OLD.status, 'pending') = 'pending'),
+        completion_minutes = completion_minutes - CASE WHEN OLD.status IS 'completed' AND OLD.completion_hour IS NOT NULL
+             THEN CAST(substr(OLD.completion_hour, 1, 2) AS INTEGER) * 60 + CAST(substr(OLD.completion_hour, 4, 2) AS INTEGER) ELSE 0 END,
+        completion_count = completion_count - (OLD.status IS 'completed' AND OLD.completion_hour IS NOT NULL)
+    WHERE day = OLD.scheduled_date;
+END;
+
+-- An update is a delete of the old row plus an insert of the new one
+CREATE TRIGGER IF NOT EXISTS appointments_rollup_upd AFTER UPDATE OF scheduled_date, status, completion_hour ON appointments
+BEGIN
+    UPDATE daily_rollups SET
+        booked = booked - 1,
+        completed = completed - (OLD.status IS 'completed'),
+        pending = pending - (COALESCE(OLD.status, 'pending') = 'pending'),
+        completion_minutes = completion_minutes - CASE WHEN OLD.status IS 'completed' AND OLD.completion_hour IS NOT NULL
+             THEN CAST(substr(OLD.completion_hour, 1, 2) AS INTEGER) * 60 + CAST(substr(OLD.completion_hour, 4, 2) AS INTEGER) ELSE 0 END,
+        completion_count = completion_count - (OLD.status IS 'completed' AND OLD.completion_hour IS NOT NULL)
+    WHERE day = OLD.scheduled_date;
+    INSERT INTO daily_rollups (day, booked, completed, pending, completion_minutes, completion_count)
+    SELECT
+        NEW.scheduled_date, 1,
+        NEW.status IS 'completed',
+        COALESCE(NEW.status, 'pending') = 'pending',
+        CASE WHEN NEW.status IS 'completed' AND NEW.completion_hour IS NOT NULL
+             THEN CAST(substr(NEW.completion_hour, 1, 2) AS INTEGER) * 60 + CAST(substr(NEW.completion_hour, 4, 2) AS INTEGER) ELSE 0 END,
+        NEW.status IS 'completed' AND NEW.completion_hour IS NOT NULL
+    WHERE NEW.scheduled_date IS NOT NULL
+    ON CONFLICT(day) DO UPDATE SET
+        booked = booked + excluded.booked,
+        completed = completed + excluded.completed,
+        pending = pending + excluded.pending,
+        completion_minutes = completion_minutes + excluded.completion_minutes,
+        completion_count = completion_count + excluded.completion_count;
+END;
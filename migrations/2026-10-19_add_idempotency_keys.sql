@@ -0,0 +1,11 @@
+-- Responses to POSTs sent with an Idempotency-Key header (see idempotency.py).
+-- status IS NULL while the first attempt is still running.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status INTEGER,
+    body TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys(created_at);
@@ -0,0 +1,3 @@
+-- Cross-clinic patient search looks up every appointment of a national ID
+-- in each branch's database.
+CREATE INDEX IF NOT EXISTS idx_appointments_national_id ON appointments(national_id);
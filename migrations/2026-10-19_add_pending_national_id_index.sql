@@ -0,0 +1,12 @@
+-- One pending appointment per patient, enforced by the INSERT itself.
+-- A NULL status has always meant pending, so it counts as one here too.
+-- No rows are changed: if a patient already has several pending
+-- appointments, CREATE INDEX fails and nothing below it runs. The apps log
+-- them and check each booking with a SELECT meanwhile. List them with
+-- `python pending_rule.py`, resolve them in the staff app, and the index is
+-- built a few minutes later.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_one_pending
+    ON appointments(national_id) WHERE COALESCE(status, 'pending') = 'pending';
+
+-- Replaced by the index above (it ignored NULL statuses)
+DROP INDEX IF EXISTS idx_appointments_pending_national_id;
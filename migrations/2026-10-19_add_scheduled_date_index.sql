@@ -0,0 +1,3 @@
+-- Per-date counts (capacity checks, ticket sequence, availability) look up
+-- appointments by scheduled_date.
+CREATE INDEX IF NOT EXISTS idx_appointments_scheduled_date ON appointments(scheduled_date);
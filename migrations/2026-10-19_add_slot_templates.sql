@@ -0,0 +1,19 @@
+-- Optional time slots per weekday: `slot_count` slots of `slot_minutes`
+-- starting at `start_time` (HH:MM), each seating `chairs` patients.
+-- Weekdays without a row are booked by date only, as before.
+CREATE TABLE IF NOT EXISTS slot_templates (
+    day_name TEXT PRIMARY KEY,
+    start_time TEXT NOT NULL,
+    slot_minutes INTEGER NOT NULL,
+    slot_count INTEGER NOT NULL,
+    chairs INTEGER NOT NULL DEFAULT 1
+);
+
+INSERT OR IGNORE INTO config_version (name, version) VALUES ('slot_templates', 0);
+
+CREATE TRIGGER IF NOT EXISTS slot_templates_version_ins AFTER INSERT ON slot_templates
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'slot_templates'; END;
+CREATE TRIGGER IF NOT EXISTS slot_templates_version_upd AFTER UPDATE ON slot_templates
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'slot_templates'; END;
+CREATE TRIGGER IF NOT EXISTS slot_templates_version_del AFTER DELETE ON slot_templates
+BEGIN UPDATE config_version SET version = version + 1 WHERE name = 'slot_templates'; END;
@@ -0,0 +1,173 @@
+"""
+One pending appointment per patient, shared by the patient and staff apps.
+
+The rule lives in the database: a partial unique index on
+appointments(national_id) WHERE COALESCE(status, 'pending') = 'pending'.
+Bookings just INSERT; a duplicate fails inside that same statement, and the
+409 is built from the conflicting row (one lookup on the same index). No
+check-then-insert race, and no scan over the patient's history.
+
+Only a pending appointment dated today or later blocks a new one, as before
+the index. The index cannot hold that date condition, so when a booking
+collides with a pending appointment whose date has passed, that appointment
+is closed as 'no_show' (close_stale) and the insert runs again, in the same
+transaction. The reports already count it as a no-show.
+
+Existing data is not rewritten to build the index. Where patients already
+have several pending appointments it cannot be built: PendingGuard logs them
+once, checks each booking's patient with a SELECT (check) instead and tries
+again RETRY_SECONDS later. List them with
+
+    python pending_rule.py [--db FILE ...]
+"""
+import argparse
+import datetime as dt
+import logging
+import sqlite3
+import threading
+import time
+
+import schema
+
+MIGRATION = "2026-10-19_add_pending_national_id_index.sql"
+RETRY_SECONDS = 300  # while duplicates keep the index from being built
+
+log = logging.getLogger(__name__)
+_retry_at = {}  # database file -> time.monotonic() of the next attempt to build the index
+
+
+def is_duplicate(exc: sqlite3.IntegrityError) -> bool:
+    """True if `exc` came from the one-pending-appointment index."""
+    return "appointments.national_id" in str(exc)
+
+
+def conflicting(conn, national_id, exclude_id=None):
+    """The patient's pending appointment (the row a duplicate insert collided with)."""
+    return conn.execute(
+        """
+        SELECT id, ticket_number, scheduled_date, status, name FROM appointments
+         WHERE national_id = ? AND COALESCE(status, 'pending') = 'pending' AND id IS NOT ?
+        """,
+        (national_id, exclude_id),
+    ).fetchone()
+
+
+def close_stale(conn, national_id) -> int:
+    """Mark the patient's pending appointments dated before today 'no_show', in the
+    caller's transaction; returns how many. A missing date counts as today."""
+    return conn.execute(
+        """
+        UPDATE appointments SET status = 'no_show'
+         WHERE national_id = ? AND COALESCE(status, 'pending') = 'pending'
+           AND scheduled_date < ?
+        """,
+        (national_id, dt.date.today().isoformat()),
+    ).rowcount
+
+
+def duplicates(conn):
+    """Pending appointments of every patient who has more than one, by patient then date."""
+    return conn.execute(
+        """
+        SELECT id, national_id, name, ticket_number, scheduled_date, status FROM appointments
+         WHERE COALESCE(status, 'pending') = 'pending'
+           AND national_id IN (
+               SELECT national_id FROM appointments
+                WHERE COALESCE(status, 'pending') = 'pending' AND national_id IS NOT NULL
+                GROUP BY national_id HAVING COUNT(*) > 1
+           )
+         ORDER BY national_id, scheduled_date, id
+        """
+    ).fetchall()
+
+
+def ensure_index(conn) -> bool:
+    """
+    Build the index (once per process). False while existing rows break the
+    rule: they are logged, and the next attempt waits RETRY_SECONDS.
+    Runs its own transaction: call outside one.
+    """
+    path = schema.db_file(conn)
+    if time.monotonic() < _retry_at.get(path, 0):
+        return False
+    try:
+        schema.ensure(conn, MIGRATION)
+    except sqlite3.IntegrityError:
+        rows = duplicates(conn)
+        _retry_at[path] = time.monotonic() + RETRY_SECONDS
+        log.warning(
+            "one-pending index not built on %s: %d patients have more than one pending appointment "
+            "(appointments %s); bookings are checked with a SELECT until they are resolved in the staff app "
+            "(list them with `python pending_rule.py`)",
+            path, len({r["national_id"] for r in rows}), ", ".join(str(r["id"]) for r in rows),
+        )
+        return False
+    _retry_at.pop(path, None)
+    return True
+
+
+class PendingGuard:
+    def __init__(self, connect):
+        """connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn)"""
+        self.connect = connect
+        self._lock = threading.Lock()
+        self.indexed = False
+
+    def prepare(self):
+        """Build the index if it is not there yet (see ensure_index); never raises for
+        existing duplicates. Uses its own connection: call outside a transaction."""
+        if self.indexed:
+            return
+        with self._lock:
+            if self.indexed:
+                return
+            conn = self.connect()
+            try:
+                self.indexed = ensure_index(conn)
+            finally:
+                conn.close()
+
+    def check(self, conn, national_id, exclude_id=None):
+        """
+        The patient's pending appointment a new one (or appointment `exclude_id`
+        set back to pending) would collide with, while the index is missing;
+        None once it is built, as the write itself checks then. Closes the
+        patient's stale ones first, in the caller's transaction.
+        """
+        if self.indexed:
+            return None
+        close_stale(conn, national_id)
+        return conflicting(conn, national_id, exclude_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List patients with more than one pending appointment")
+    parser.add_argument("--db", action="append", default=None,
+                        help="database to check (repeatable); default: every clinic's database")
+    args = parser.parse_args(argv)
+    if args.db:
+        paths = args.db
+    else:
+        import services  # DENTAL_DB and CLINICS
+        paths = [c.db_path for c in services.CLINICS.values()]
+
+    found = 0
+    for path in paths:
+        conn = sqlite3.connect(schema.ro_uri(path), uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = duplicates(conn)
+        finally:
+            conn.close()
+        for r in rows:
+            print(f"{path}\t{r['national_id']}\t{r['id']}\t{r['ticket_number']}\t{r['scheduled_date']}\t{r['name']}")
+        found += len(rows)
+    if found:
+        print(f"{found} pending appointments to resolve: complete or delete all but one per patient")
+        return 1
+    print("no patient has more than one pending appointment")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,248 @@
+"""
+Opt-in SQL profiler for the patient and staff apps.
+
+Connections are opened with `factory=ProfiledConnection` (see get_conn in each
+app). It is a pass-through unless profiling is on, either process-wide with
+SQL_PROFILE=1 or for the current thread inside `capture()`. When on, each
+statement is recorded with its normalized text, duration (execute + fetch),
+rows returned and EXPLAIN QUERY PLAN; statements slower than SQL_SLOW_MS go to
+the "slow_sql" logger (and SQL_SLOW_LOG, if set).
+
+executemany is recorded as one statement, with the rows it changed.
+
+In tests (see tests/test_query_budgets.py):
+
+    from query_profiler import assert_queries
+    assert_queries(app.test_client(), "GET", "/api/dashboard", max_queries=3)
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from metrics import TimedConnection
+
+PROFILE_ENABLED = os.getenv("SQL_PROFILE", "").lower() in {"1", "true", "yes"}
+SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100"))
+
+slow_log = logging.getLogger("slow_sql")
+if os.getenv("SQL_SLOW_LOG"):
+    _handler = logging.FileHandler(os.getenv("SQL_SLOW_LOG"))
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_log.addHandler(_handler)
+    slow_log.setLevel(logging.INFO)
+
+_local = threading.local()
+_plans = {}  # normalized sql -> list of EXPLAIN QUERY PLAN details
+_stats_lock = threading.Lock()
+_stats = {}  # normalized sql -> [calls, total seconds, max seconds, rows]
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)(?: AS \w+)?$")
+
+
+def normalize(sql):
+    """Collapse whitespace and replace literals so equal statements group together."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def full_scans(plan):
+    """Tables read with a full-table SCAN (no index) in an EXPLAIN QUERY PLAN."""
+    tables = []
+    for detail in plan:
+        m = _FULL_SCAN.match(detail)
+        if m:
+            tables.append(m.group(1))
+    return tables
+
+
+class Statement:
+    __slots__ = ("sql", "seconds", "rows", "plan", "logged")
+
+    def __init__(self, sql, seconds, plan):
+        self.sql = sql
+        self.seconds = seconds
+        self.rows = 0
+        self.plan = plan
+        self.logged = False
+
+    @property
+    def full_scans(self):
+        return full_scans(self.plan)
+
+    def as_dict(self):
+        return {"sql": self.sql, "ms": round(self.seconds * 1000, 3), "rows": self.rows, "plan": self.plan}
+
+    def __repr__(self):
+        return f"<{self.seconds * 1000:.2f}ms rows={self.rows} {self.sql!r} plan={self.plan}>"
+
+
+class _CountingCursor:
+    """Cursor proxy that adds fetch time and row counts to its Statement."""
+
+    def __init__(self, cursor, statement):
+        self._cursor = cursor
+        self._statement = statement
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def fetchone(self):
+        t0 = perf_counter()
+        row = self._cursor.fetchone()
+        self._add(perf_counter() - t0, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = perf_counter()
+        rows = self._cursor.fetchmany(size if size is not None else self._cursor.arraysize)
+        self._add(perf_counter() - t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = perf_counter()
+        rows = self._cursor.fetchall()
+        self._add(perf_counter() - t0, len(rows))
+        return rows
+
+    def _add(self, seconds, rows):
+        st = self._statement
+        st.seconds += seconds
+        st.rows += rows
+        _finish(st, seconds, rows, first=False)
+
+
+class ProfiledConnection(TimedConnection):
+    def execute(self, sql, parameters=()):
+        capture = getattr(_local, "capture", None)
+        if not (PROFILE_ENABLED or capture is not None):
+            return super().execute(sql, parameters)
+
+        t0 = perf_counter()
+        cursor = super().execute(sql, parameters)
+        elapsed = perf_counter() - t0
+
+        norm = normalize(sql)
+        st = Statement(norm, elapsed, self._plan(norm, sql, parameters))
+        if capture is not None:
+            capture.append(st)
+        _finish(st, elapsed, 0, first=True)
+        return _CountingCursor(cursor, st)
+
+    def executemany(self, sql, seq_of_parameters):
+        capture = getattr(_local, "capture", None)
+        if not (PROFILE_ENABLED or capture is not None):
+            return super().executemany(sql, seq_of_parameters)
+
+        params = list(seq_of_parameters)  # the plan needs one parameter set, then all of them run
+        t0 = perf_counter()
+        cursor = super().executemany(sql, params)
+        elapsed = perf_counter() - t0
+
+        norm = normalize(sql)
+        st = Statement(norm, elapsed, self._plan(norm, sql, params[0]) if params else [])
+        st.rows = max(cursor.rowcount, 0)
+        if capture is not None:
+            capture.append(st)
+        _finish(st, elapsed, st.rows, first=True)
+        return cursor
+
+    def _plan(self, norm, sql, parameters):
+        plan = _plans.get(norm)
+        if plan is None:
+            verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+            plan = []
+            if verb in {"SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE"}:
+                try:
+                    # Straight to sqlite3 so the EXPLAIN is not counted in /api/metrics
+                    rows = sqlite3.Connection.execute(self, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+                    plan = [r["detail"] if isinstance(r, dict) else r[3] for r in rows]
+                except sqlite3.Error:
+                    plan = ["<plan unavailable>"]
+            _plans[norm] = plan
+        return plan
+
+
+def _finish(st, seconds, rows, first):
+    with _stats_lock:
+        agg = _stats.get(st.sql)
+        if agg is None:
+            agg = _stats[st.sql] = [0, 0.0, 0.0, 0]
+        if first:
+            agg[0] += 1
+        agg[1] += seconds
+        agg[2] = max(agg[2], st.seconds)
+        agg[3] += rows
+    if not st.logged and st.seconds * 1000 >= SLOW_MS:
+        st.logged = True
+        slow_log.warning("slow query %s", json.dumps(st.as_dict()))
+
+
+def summary(limit=20):
+    """Aggregated statements ordered by total time (most expensive first)."""
+    with _stats_lock:
+        items = [
+            {"sql": sql, "calls": c, "total_ms": round(t * 1000, 3), "max_ms": round(m * 1000, 3),
+             "rows": r, "plan": _plans.get(sql, [])}
+            for sql, (c, t, m, r) in _stats.items()
+        ]
+    items.sort(key=lambda s: s["total_ms"], reverse=True)
+    return items[:limit]
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+    _plans.clear()
+
+
+# ------------- TEST HELPERS -------------
+
+@contextmanager
+def capture():
+    """Record every statement run on this thread inside the block."""
+    statements = []
+    previous = getattr(_local, "capture", None)
+    _local.capture = statements
+    try:
+        yield statements
+    finally:
+        _local.capture = previous
+
+
+def assert_queries(client, method, url, max_queries, allow_scans=(), **kwargs):
+    """
+    Issue one request through a Flask test client and assert that it ran at
+    most `max_queries` statements and no full-table scan (except on tables in
+    `allow_scans`). Returns the response.
+    """
+    with capture() as statements:
+        resp = client.open(url, method=method, **kwargs)
+    problems = []
+    if len(statements) > max_queries:
+        problems.append(f"{len(statements)} queries > {max_queries}")
+    for st in statements:
+        scanned = [t for t in st.full_scans if t not in allow_scans]
+        if scanned:
+            problems.append(f"full scan of {', '.join(scanned)}: {st.sql}")
+    if problems:
+        listing = "\n".join(f"  {st!r}" for st in statements)
+        raise AssertionError(f"{method} {url}: " + "; ".join(problems) + f"\nstatements:\n{listing}")
+    return resp
@@ -0,0 +1,63 @@
+"""
+Background refresh for the in-memory snapshots of the appointments database
+(availability.py, live_queue.py, reporting.py).
+
+PRAGMA data_version changes on a connection whenever another connection
+commits to the database, so one cheap PRAGMA per interval tells a process
+whether anyone else wrote. A DataVersionWatcher keeps that connection open in
+a daemon thread and calls poll(conn, changed) every `interval` seconds, the
+first time as soon as it starts. `conn` is the watching connection, for
+owners that read more than data_version from it. `changed` is True when
+data_version moved since the last poll that did not raise; the owner decides
+what to rebuild (it may also rebuild unchanged data, e.g. after midnight). A
+poll that raises is logged and retried on the next tick, and the owner keeps
+serving what it has.
+"""
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class DataVersionWatcher:
+    def __init__(self, name, connect, poll, interval):
+        """
+        name: thread name, also used in log messages
+        connect: () -> sqlite3.Connection on the watched database, opened once by the thread
+        poll: (conn, changed: bool) -> None
+        interval: seconds between polls; 0 or less never starts the thread
+        """
+        self.name = name
+        self.connect = connect
+        self.poll = poll
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread once; later calls do nothing."""
+        if self._thread is None and self.interval > 0:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        watch = self.connect()
+        last = watch.execute("PRAGMA data_version").fetchone()
+        changed = False
+        while True:
+            try:
+                self.poll(watch, changed)
+                changed = False
+            except Exception:  # keep serving the last good snapshot
+                log.exception("%s failed", self.name)
+            time.sleep(self.interval)
+            try:
+                current = watch.execute("PRAGMA data_version").fetchone()
+            except Exception:
+                log.exception("%s could not read data_version", self.name)
+                continue
+            if current != last:
+                last, changed = current, True
@@ -0,0 +1,161 @@
+"""
+Read-only connections for the heavy staff reads (dashboard, appointment lists,
+reports), so a long report never holds up a booking commit.
+
+    REPORTING = reporting.ReportingSource(DB_PATH, dict_factory, {"dashboard": 0, "reports": 300})
+    with REPORTING.connect("dashboard") as conn: ...
+
+Every connection is opened with a `mode=ro` URI and PRAGMA query_only. It reads
+one of two sources:
+  - live: the main database. On first use the database is switched to WAL
+    (a persistent setting), where readers never block writers or the reverse.
+  - snapshot: a copy made with the SQLite backup API under
+    REPORTING_SNAPSHOT_DIR, used when the endpoint's staleness allows it.
+
+Staleness is seconds per endpoint: 0 always reads live; N accepts a snapshot
+checked at most N seconds ago. Defaults can be overridden with
+REPORTING_STALENESS="dashboard=30,appointments=0,reports=300".
+
+A background thread (started only when some endpoint allows staleness) checks
+PRAGMA data_version every REPORTING_SNAPSHOT_SECONDS. If nothing changed it
+just marks the current snapshot as checked; otherwise it copies a new one.
+After a schema change the old snapshot is not used until it is replaced.
+"""
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+import query_profiler
+from metrics import REGISTRY
+from refresher import DataVersionWatcher
+from schema import ro_uri
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+KEEP_SNAPSHOTS = 2  # older files are deleted once no reader should still have them open
+
+log = logging.getLogger(__name__)
+
+
+def parse_staleness(text):
+    """"dashboard=30,reports=300" -> {"dashboard": 30.0, "reports": 300.0}"""
+    out = {}
+    for part in (text or "").split(","):
+        if "=" in part:
+            name, seconds = part.split("=", 1)
+            out[name.strip()] = float(seconds)
+    return out
+
+
+class ReportingSource:
+    def __init__(self, db_path, row_factory, staleness=None, snapshot_dir=None, refresh_seconds=None, subdir=None):
+        """
+        db_path: the main database file
+        row_factory: applied to every connection (the apps' dict_factory)
+        staleness: {endpoint: seconds}; REPORTING_STALENESS entries override it
+        subdir: keeps this database's snapshots apart when several share the snapshot directory
+        """
+        self.db_path = db_path
+        self.row_factory = row_factory
+        self.staleness = {**(staleness or {}), **parse_staleness(os.getenv("REPORTING_STALENESS"))}
+        self.snapshot_dir = snapshot_dir or os.getenv("REPORTING_SNAPSHOT_DIR", os.path.join(HERE, "yarab", "reporting"))
+        if subdir:
+            self.snapshot_dir = os.path.join(self.snapshot_dir, subdir)
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None else float(os.getenv("REPORTING_SNAPSHOT_SECONDS", "15"))
+        )
+        self._lock = threading.Lock()
+        self._snapshot = None  # (path, checked_at monotonic, schema_version)
+        self._schema_version = None  # main database's, as last seen by the refresher
+        self._wal_checked = False
+        self._wal_retry_at = 0.0
+        self._watcher = DataVersionWatcher(
+            "reporting-snapshot", lambda: sqlite3.connect(ro_uri(db_path), uri=True), self._poll, self.refresh_seconds
+        )
+
+    # ------------- connections -------------
+
+    def _open(self, path):
+        conn = metrics.connect(ro_uri(path), uri=True, factory=query_profiler.ProfiledConnection)
+        conn.row_factory = self.row_factory
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def connect(self, endpoint):
+        """Read-only connection for `endpoint`: a fresh-enough snapshot, else the live database."""
+        self._ensure_wal()
+        max_age = self.staleness.get(endpoint, 0)
+        if max_age > 0:
+            self._watcher.start()
+            snap = self._snapshot
+            if (snap is not None and time.monotonic() - snap[1] <= max_age
+                    and snap[2] == self._schema_version and os.path.exists(snap[0])):
+                REGISTRY.inc("reporting_reads_total", (("endpoint", endpoint), ("source", "snapshot")))
+                return self._open(snap[0])
+        REGISTRY.inc("reporting_reads_total", (("endpoint", endpoint), ("source", "live")))
+        return self._open(self.db_path)
+
+    def _ensure_wal(self):
+        if self._wal_checked or time.monotonic() < self._wal_retry_at:
+            return
+        with self._lock:
+            if self._wal_checked:
+                return
+            conn = sqlite3.connect(self.db_path, timeout=1)
+            try:
+                mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                if mode != "wal":
+                    mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+                if mode != "wal":
+                    log.warning("could not switch %s to WAL (%s); live reports may delay writers", self.db_path, mode)
+                self._wal_checked = True
+            except sqlite3.OperationalError as exc:  # another connection holds a lock: try again in a minute
+                log.info("WAL switch of %s deferred: %s", self.db_path, exc)
+                self._wal_retry_at = time.monotonic() + 60
+            finally:
+                conn.close()
+
+    # ------------- snapshots -------------
+
+    def refresh(self):
+        """Copy the main database into a new snapshot file and start serving it."""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = os.path.join(self.snapshot_dir, f"reporting-{time.time_ns()}.db")
+        t0 = time.perf_counter()
+        src = sqlite3.connect(ro_uri(self.db_path), uri=True)
+        dst = sqlite3.connect(path)
+        try:
+            # WAL: one read transaction for the whole copy, which writers do not wait for
+            src.backup(dst)
+            version = src.execute("PRAGMA schema_version").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        REGISTRY.observe("reporting_snapshot_seconds", time.perf_counter() - t0)
+        with self._lock:
+            self._snapshot = (path, time.monotonic(), version)
+            self._schema_version = version
+        self._prune()
+        return path
+
+    def _prune(self):
+        files = sorted(glob.glob(os.path.join(self.snapshot_dir, "reporting-*.db")))
+        for old in files[:-KEEP_SNAPSHOTS]:
+            # The copy keeps the source's WAL flag, so readers leave -wal/-shm files next to it
+            for path in (old + "-wal", old + "-shm", old):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # still open somewhere (Windows): removed on a later refresh
+
+    def _poll(self, conn, changed):
+        self._schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        snap = self._snapshot
+        if snap is None or changed or snap[2] != self._schema_version:
+            self.refresh()
+        else:
+            # Nothing committed since the copy: it is as good as a new one
+            self._snapshot = (snap[0], time.monotonic(), snap[2])
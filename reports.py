@@ -0,0 +1,174 @@
+"""
+Historical appointment reports served from the daily_rollups table.
+
+daily_rollups holds one row per scheduled_date (booked, completed, pending,
+completion-hour sum/count). Triggers on appointments keep it current on every
+insert, update and delete, and backfill() rebuilds it from appointments in
+batches of days, each in its own short transaction so bookings keep flowing.
+Weekly and monthly figures are summed from the daily rows, so a two-year
+monthly chart reads at most ~730 rows instead of scanning appointments.
+
+    python reports.py backfill [--db yarab/dental_appointments.db] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+"""
+import argparse
+import datetime as dt
+import sqlite3
+import threading
+
+import schema
+
+MIGRATION = "2026-10-19_add_daily_rollups.sql"
+GRANULARITIES = {
+    "day": "day",
+    "week": "date(day, 'weekday 0', '-6 days')",  # Monday of the ISO week
+    "month": "substr(day, 1, 7) || '-01'",
+}
+
+_backfill_lock = threading.Lock()
+_checked = set()  # database files known to have a populated daily_rollups
+
+
+def backfill(conn, first=None, last=None, batch_days=31, progress=None):
+    """
+    Recompute daily_rollups for scheduled dates first..last (default: every
+    date in appointments, and the table is marked as backfilled). `conn` must
+    be in autocommit mode (isolation_level=None). Returns the number of days written.
+    """
+    full = first is None and last is None
+    if first is None or last is None:
+        row = conn.execute(
+            "SELECT MIN(scheduled_date) AS lo, MAX(scheduled_date) AS hi FROM appointments WHERE scheduled_date IS NOT NULL"
+        ).fetchone()
+        lo, hi = (row["lo"], row["hi"]) if isinstance(row, dict) else row
+        if lo is None:
+            _mark_backfilled(conn)
+            return 0
+        first = first or dt.date.fromisoformat(lo)
+        last = last or dt.date.fromisoformat(hi)
+
+    written = 0
+    start = first
+    while start <= last:
+        end = min(start + dt.timedelta(days=batch_days - 1), last)
+        # One batch = one write transaction: triggers cannot interleave with it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM daily_rollups WHERE day BETWEEN ? AND ?", (start.isoformat(), end.isoformat()))
+            cur = conn.execute(
+                """
+                INSERT INTO daily_rollups (day, booked, completed, pending, completion_minutes, completion_count)
+                SELECT scheduled_date,
+                       COUNT(*),
+                       SUM(status IS 'completed'),
+                       SUM(COALESCE(status, 'pending') = 'pending'),
+                       SUM(CASE WHEN status IS 'completed' AND completion_hour IS NOT NULL
+                                THEN CAST(substr(completion_hour, 1, 2) AS INTEGER) * 60
+                                     + CAST(substr(completion_hour, 4, 2) AS INTEGER) ELSE 0 END),
+                       SUM(status IS 'completed' AND completion_hour IS NOT NULL)
+                  FROM appointments
+                 WHERE scheduled_date BETWEEN ? AND ?
+                 GROUP BY scheduled_date
+                """,
+                (start.isoformat(), end.isoformat()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        written += max(cur.rowcount, 0)
+        if progress:
+            progress(start, end)
+        start = end + dt.timedelta(days=1)
+    if full:
+        _mark_backfilled(conn)
+    return written
+
+
+def _mark_backfilled(conn):
+    conn.execute("INSERT OR REPLACE INTO rollup_state (name) VALUES ('daily_rollups')")
+
+
+def ensure_rollups(connect):
+    """Create daily_rollups and its triggers; backfill it once, the first time."""
+    conn = connect()
+    try:
+        schema.ensure(conn, MIGRATION)
+        path = schema.db_file(conn)
+        if path in _checked:
+            return
+        with _backfill_lock:
+            if path in _checked:
+                return
+            done = conn.execute("SELECT 1 FROM rollup_state WHERE name = 'daily_rollups'").fetchone()
+            if done is None:
+                conn.isolation_level = None  # backfill manages its own transactions
+                backfill(conn)
+            _checked.add(path)
+    finally:
+        conn.close()
+
+
+def query(conn, granularity, first, last, today=None):
+    """
+    [{period, booked, completed, pending, no_show, avg_completion_hour}] for
+    first..last. Appointments on days before `today` that were not completed
+    count as no-shows; no status is changed for that.
+    """
+    period = GRANULARITIES[granularity]
+    today = (today or dt.date.today()).isoformat()
+    rows = conn.execute(
+        f"""
+        SELECT {period} AS period,
+               SUM(booked) AS booked,
+               SUM(completed) AS completed,
+               SUM(CASE WHEN day >= ? THEN pending ELSE 0 END) AS pending,
+               SUM(CASE WHEN day < ? THEN booked - completed ELSE 0 END) AS no_show,
+               SUM(completion_minutes) AS completion_minutes,
+               SUM(completion_count) AS completion_count
+          FROM daily_rollups
+         WHERE day BETWEEN ? AND ?
+         GROUP BY period
+         ORDER BY period
+        """,
+        (today, today, first.isoformat(), last.isoformat()),
+    ).fetchall()
+    out = []
+    for r in rows:
+        avg = None
+        if r["completion_count"]:
+            minutes = round(r["completion_minutes"] / r["completion_count"])
+            avg = f"{minutes // 60:02d}:{minutes % 60:02d}"
+        out.append({
+            "period": r["period"],
+            "booked": r["booked"],
+            "completed": r["completed"],
+            "pending": r["pending"],
+            "no_show": r["no_show"],
+            "avg_completion_hour": avg,
+        })
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain reporting rollups")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_backfill = sub.add_parser("backfill", help="rebuild daily_rollups from appointments")
+    p_backfill.add_argument("--db", default="yarab/dental_appointments.db")
+    p_backfill.add_argument("--from", dest="first", type=dt.date.fromisoformat, default=None)
+    p_backfill.add_argument("--to", dest="last", type=dt.date.fromisoformat, default=None)
+    p_backfill.add_argument("--batch-days", type=int, default=31)
+
+    args = parser.parse_args(argv)
+    con = sqlite3.connect(args.db, isolation_level=None, timeout=30)
+    con.row_factory = sqlite3.Row
+    try:
+        schema.ensure(con, MIGRATION)
+        days = backfill(con, args.first, args.last, args.batch_days,
+                        progress=lambda s, e: print(f"  {s} .. {e}"))
+    finally:
+        con.close()
+    print(f"✅ Rebuilt {days} days of rollups in {args.db}")
+
+
+if __name__ == "__main__":
+    main()
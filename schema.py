@@ -0,0 +1,52 @@
+"""
+Apply the idempotent migrations under migrations/ that newer features depend on.
+
+The original migrations are run by hand with the sqlite3 CLI; the ones listed
+here only use CREATE ... IF NOT EXISTS / INSERT OR IGNORE, so each app process
+can apply them on first use and an operator can still run them manually.
+"""
+import os
+import threading
+
+MIGRATIONS_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "migrations")
+
+_lock = threading.Lock()
+_applied = set()  # (database file, migration name)
+
+
+def ro_uri(path):
+    """URI opening the database at `path` read-only (sqlite3.connect(..., uri=True))."""
+    return "file:" + os.path.abspath(path).replace("\\", "/").replace("?", "%3f").replace("#", "%23") + "?mode=ro"
+
+
+def db_file(conn):
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row["file"] if isinstance(row, dict) else row[2]
+
+
+def ensure(conn, name):
+    """Run migrations/<name> once per process for the database behind `conn`."""
+    key = (db_file(conn), name)
+    if key in _applied:
+        return
+    with _lock:
+        if key in _applied:
+            return
+        with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as fh:
+            conn.executescript(fh.read())
+        _applied.add(key)
+
+
+def ensure_column(conn, table, column, decl):
+    """ALTER TABLE `table` ADD COLUMN `column` `decl` unless the column already exists."""
+    key = (db_file(conn), f"{table}.{column}")
+    if key in _applied:
+        return
+    with _lock:
+        if key in _applied:
+            return
+        columns = {r["name"] if isinstance(r, dict) else r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+            conn.commit()
+        _applied.add(key)
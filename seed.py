@@ -1,261 +1,625 @@
-def reset_and_seed(db_path="yarab/dental_appointments.db", days=7, per_day_cap=20,
-                   pct_completed=0.85, pct_pending_same=0.10, pct_pending_overflow=0.05):
-    """
-    Safe reseed:
-      - Deletes all rows
-      - Fills last `days` with at most `per_day_cap` each
-      - Ensures ~85% completed, ~10% pending-same-day, ~5% pending-overflow (adjustable)
-      - Overflow is queued and consumed by the next day without exceeding capacity
-      - Ticket sequence is per scheduled_date
-    """
-    if not os.path.exists(db_path):
-        raise SystemExit(f"DB not found: {db_path}")
-
-    con = sqlite3.connect(db_path)
-    con.row_factory = sqlite3.Row
-
-    # Clear existing data in a single transaction
-    with con:
-        con.execute("DELETE FROM appointments")
-
-    # Columns
-    cols = {r[1] for r in con.execute("PRAGMA table_info(appointments)")}
-    has_phone = "phone" in cols
-    has_phone_text = "phone_text" in cols
-    has_nat = "national_id" in cols
-    has_imgs = "image_paths" in cols
-    has_voice = "voice_note_path" in cols
-    has_comp_hour = "completion_hour" in cols
-    has_ticket = "ticket_number" in cols
-    has_created = "created_at" in cols
-    has_sched = "scheduled_date" in cols
-    has_status = "status" in cols
-    has_sym = "symptoms" in cols
-
-    today = datetime.now(CAIRO).date()
-    start_day = today - timedelta(days=days-1)
-
-    # Build the date buckets
-    dates = [start_day + timedelta(days=i) for i in range(days)]
-    date_strs = [d.isoformat() for d in dates]
-
-    # Per-day ticket sequence (based on scheduled_date)
-    seq_per_day = {ds: 0 for ds in date_strs}
-
-    # Plan: local mix per day (rounded), respecting capacity
-    day_plans = []
-    for _ in date_strs:
-        c = int(round(per_day_cap * pct_completed))
-        p_same = int(round(per_day_cap * pct_pending_same))
-        p_over = per_day_cap - c - p_same
-        if p_over < 0:  # guard against bad percentages
-            p_over = 0
-            # re-normalize
-            rest = per_day_cap - c
-            p_same = max(0, rest)
-        day_plans.append({"completed": c, "pending_same": p_same, "pending_over": p_over})
-
-    # Overflow queue: how many pending need to be scheduled on the *next* day
-    overflow_next = 0
-
-    all_rows = []
-
-    for idx, ds in enumerate(date_strs):
-        plan = day_plans[idx].copy()
-        cap_left = per_day_cap
-
-        # First consume *yesterday’s* overflow into *today* as pending.
-        take_from_overflow = min(overflow_next, cap_left)
-        overflow_next -= take_from_overflow
-        cap_left -= take_from_overflow
-
-        # Prepare records for this portion (pending set to today ds)
-        for _ in range(take_from_overflow):
-            seq_per_day[ds] += 1
-            name = rand_name()
-            phone = rand_phone()
-            symptoms = random.choice(SYMPTOMS)
-            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
-                hours=random.randint(8, 18), minutes=random.randint(0, 59)
-            )
-            created_at = iso_ts(created_dt)
-            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
-
-            row = {}
-            if has_ticket:      row["ticket_number"]   = ticket
-            row["name"] = name
-            if has_phone:       row["phone"]           = phone
-            if has_phone_text:  row["phone_text"]      = phone
-            if has_sched:       row["scheduled_date"]  = ds
-            if has_status:      row["status"]          = "pending"
-            if has_sym:         row["symptoms"]        = symptoms
-            if has_imgs:        row["image_paths"]     = json.dumps([])
-            if has_voice:       row["voice_note_path"] = None
-            if has_comp_hour:   row["completion_hour"] = None
-            if has_created:     row["created_at"]      = created_at
-            if has_nat:         row["national_id"]     = None
-            all_rows.append(row)
-
-        if cap_left == 0:
-            # today is full just from overflow; push today's local plan entirely to tomorrow
-            overflow_next += plan["completed"] + plan["pending_same"] + plan["pending_over"]
-            continue
-
-        # Now schedule *today's local* plan, respecting cap_left
-        # 1) completed today
-        n_completed = min(plan["completed"], cap_left)
-        cap_left -= n_completed
-        for _ in range(n_completed):
-            seq_per_day[ds] += 1
-            name = rand_name()
-            phone = rand_phone()
-            symptoms = random.choice(SYMPTOMS)
-            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
-                hours=random.randint(8, 18), minutes=random.randint(0, 59)
-            )
-            created_at = iso_ts(created_dt)
-            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
-            # completion hour for completed
-            ch = None
-            if has_comp_hour:
-                hh = random.randint(9, 17)
-                mm = random.choice([0, 15, 30, 45])
-                ch = f"{hh:02d}:{mm:02d}"
-
-            row = {}
-            if has_ticket:      row["ticket_number"]   = ticket
-            row["name"] = name
-            if has_phone:       row["phone"]           = phone
-            if has_phone_text:  row["phone_text"]      = phone
-            if has_sched:       row["scheduled_date"]  = ds
-            if has_status:      row["status"]          = "completed"
-            if has_sym:         row["symptoms"]        = symptoms
-            if has_imgs:        row["image_paths"]     = json.dumps([])
-            if has_voice:       row["voice_note_path"] = None
-            if has_comp_hour:   row["completion_hour"] = ch
-            if has_created:     row["created_at"]      = created_at
-            if has_nat:         row["national_id"]     = None
-            all_rows.append(row)
-
-        if cap_left == 0:
-            # still full
-            overflow_next += plan["pending_same"] + plan["pending_over"]
-            continue
-
-        # 2) pending that *stay today*
-        n_pend_same = min(plan["pending_same"], cap_left)
-        cap_left -= n_pend_same
-        for _ in range(n_pend_same):
-            seq_per_day[ds] += 1
-            name = rand_name()
-            phone = rand_phone()
-            symptoms = random.choice(SYMPTOMS)
-            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
-                hours=random.randint(8, 18), minutes=random.randint(0, 59)
-            )
-            created_at = iso_ts(created_dt)
-            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
-
-            row = {}
-            if has_ticket:      row["ticket_number"]   = ticket
-            row["name"] = name
-            if has_phone:       row["phone"]           = phone
-            if has_phone_text:  row["phone_text"]      = phone
-            if has_sched:       row["scheduled_date"]  = ds
-            if has_status:      row["status"]          = "pending"
-            if has_sym:         row["symptoms"]        = symptoms
-            if has_imgs:        row["image_paths"]     = json.dumps([])
-            if has_voice:       row["voice_note_path"] = None
-            if has_comp_hour:   row["completion_hour"] = None
-            if has_created:     row["created_at"]      = created_at
-            if has_nat:         row["national_id"]     = None
-            all_rows.append(row)
-
-        if cap_left == 0:
-            overflow_next += plan["pending_over"]
-            continue
-
-        # 3) pending that *should overflow to tomorrow*
-        n_pend_overflow = plan["pending_over"]
-        # Use remaining cap for some of these if available (they can still be scheduled today as pending)
-        # The remainder will be pushed to tomorrow.
-        schedule_today = min(n_pend_overflow, cap_left)
-        push_tomorrow  = n_pend_overflow - schedule_today
-
-        # Schedule today's slice
-        for _ in range(schedule_today):
-            seq_per_day[ds] += 1
-            name = rand_name()
-            phone = rand_phone()
-            symptoms = random.choice(SYMPTOMS)
-            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
-                hours=random.randint(8, 18), minutes=random.randint(0, 59)
-            )
-            created_at = iso_ts(created_dt)
-            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
-
-            row = {}
-            if has_ticket:      row["ticket_number"]   = ticket
-            row["name"] = name
-            if has_phone:       row["phone"]           = phone
-            if has_phone_text:  row["phone_text"]      = phone
-            if has_sched:       row["scheduled_date"]  = ds
-            if has_status:      row["status"]          = "pending"
-            if has_sym:         row["symptoms"]        = symptoms
-            if has_imgs:        row["image_paths"]     = json.dumps([])
-            if has_voice:       row["voice_note_path"] = None
-            if has_comp_hour:   row["completion_hour"] = None
-            if has_created:     row["created_at"]      = created_at
-            if has_nat:         row["national_id"]     = None
-            all_rows.append(row)
-
-        overflow_next += push_tomorrow
-
-    # If overflow remains after the last day: assign to the last day if capacity left; otherwise, drop it (or optionally extend horizon)
-    if overflow_next > 0:
-        last = date_strs[-1]
-        # Count how many already scheduled on last day
-        last_count = sum(1 for r in all_rows if r.get("scheduled_date") == last)
-        cap_left = max(0, per_day_cap - last_count)
-        add = min(cap_left, overflow_next)
-        for _ in range(add):
-            seq_per_day[last] += 1
-            name = rand_name()
-            phone = rand_phone()
-            symptoms = random.choice(SYMPTOMS)
-            created_dt = datetime.combine(dates[-1], datetime.min.time()) + timedelta(
-                hours=random.randint(8, 18), minutes=random.randint(0, 59)
-            )
-            created_at = iso_ts(created_dt)
-            ticket = make_ticket(last, seq_per_day[last]) if has_ticket else None
-
-            row = {}
-            if has_ticket:      row["ticket_number"]   = ticket
-            row["name"] = name
-            if has_phone:       row["phone"]           = phone
-            if has_phone_text:  row["phone_text"]      = phone
-            if has_sched:       row["scheduled_date"]  = last
-            if has_status:      row["status"]          = "pending"
-            if has_sym:         row["symptoms"]        = symptoms
-            if has_imgs:        row["image_paths"]     = json.dumps([])
-            if has_voice:       row["voice_note_path"] = None
-            if has_comp_hour:   row["completion_hour"] = None
-            if has_created:     row["created_at"]      = created_at
-            if has_nat:         row["national_id"]     = None
-            all_rows.append(row)
-        overflow_next -= add
-        # If still >0, we simply ignore extra to avoid breaking capacity (or add an 8th day if you prefer)
-
-    if not all_rows:
-        print("⚠️ Nothing to insert.")
-        return
-
-    cols_used = sorted(all_rows[0].keys())
-    placeholders = ", ".join(["?"] * len(cols_used))
-    col_list = ", ".join(cols_used)
-    sql = f"INSERT INTO appointments ({col_list}) VALUES ({placeholders})"
-
-    with con:
-        con.executemany(sql, [[r.get(c) for c in cols_used] for r in all_rows])
-
-    print(f"✅ Inserted {len(all_rows)} rows into appointments ({db_path}). (Overflow left unassigned: {overflow_next})")
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo  # py3.9+
+except ImportError:
+    from backports.zoneinfo import ZoneInfo  # if needed: pip install backports.zoneinfo
+
+CAIRO = ZoneInfo("Africa/Cairo")
+
+FIRST_NAMES = [
+    "Ahmed", "Mohamed", "Mahmoud", "Omar", "Youssef", "Mostafa", "Khaled", "Karim", "Hassan", "Ali",
+    "Amr", "Tarek", "Ibrahim", "Hany", "Sherif", "Fatma", "Aya", "Mariam", "Nour", "Salma",
+    "Hana", "Yasmin", "Rana", "Dina", "Sara", "Mona", "Heba", "Rahma", "Esraa", "Nada",
+]
+LAST_NAMES = [
+    "Hassan", "Mahmoud", "Ali", "Ibrahim", "Abdelrahman", "Saleh", "Farouk", "Mansour", "Nasser", "Fathy",
+    "Gamal", "Samir", "Adel", "Fawzy", "Zaki", "Shawky", "Kamel", "Helmy", "Soliman", "Ragab",
+]
+SYMPTOMS = [
+    "Toothache", "Sensitivity to cold", "Bleeding gums", "Broken filling", "Swelling in the jaw",
+    "Wisdom tooth pain", "Routine checkup", "Cleaning and scaling", "Loose tooth", "Bad breath",
+    "Cracked tooth", "Orthodontic follow-up", "Root canal follow-up", "Crown replacement",
+]
+PHONE_PREFIXES = ["010", "011", "012", "015"]
+# Egyptian governorate codes used in digits 8-9 of the national ID
+GOVERNORATES = ["01", "02", "03", "04", "11", "12", "13", "14", "15", "16", "17", "18", "19",
+                "21", "22", "23", "24", "25", "26", "27", "28", "29", "31", "32", "33", "34", "35", "88"]
+
+def rand_name():
+    return f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
+
+def rand_phone():
+    return f"{random.choice(PHONE_PREFIXES)}{random.randint(0, 10**8 - 1):08d}"
+
+def iso_ts(d):
+    return d.strftime("%Y-%m-%d %H:%M:%S")
+
+def make_ticket(scheduled_date: str, seq: int, national_id_last4: int | None = None) -> int:
+    # Same layout as the apps: YYYYMMDD + per-day seq (001..999) + last4 of national ID
+    last4 = random.randint(0, 9999) if national_id_last4 is None else national_id_last4
+    return int(f"{scheduled_date.replace('-', '')}{seq:03d}{last4:04d}")
+
+def reset_and_seed(db_path="yarab/dental_appointments.db", days=7, per_day_cap=20,
+                   pct_completed=0.85, pct_pending_same=0.10, pct_pending_overflow=0.05):
+    """
+    Safe reseed:
+      - Deletes all rows
+      - Fills last `days` with at most `per_day_cap` each
+      - Ensures ~85% completed, ~10% pending-same-day, ~5% pending-overflow (adjustable)
+      - Overflow is queued and consumed by the next day without exceeding capacity
+      - Ticket sequence is per scheduled_date
+    """
+    if not os.path.exists(db_path):
+        raise SystemExit(f"DB not found: {db_path}")
+
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+
+    # Clear existing data in a single transaction
+    with con:
+        con.execute("DELETE FROM appointments")
+
+    # Columns
+    cols = {r[1] for r in con.execute("PRAGMA table_info(appointments)")}
+    has_phone = "phone" in cols
+    has_phone_text = "phone_text" in cols
+    has_nat = "national_id" in cols
+    has_imgs = "image_paths" in cols
+    has_voice = "voice_note_path" in cols
+    has_comp_hour = "completion_hour" in cols
+    has_ticket = "ticket_number" in cols
+    has_created = "created_at" in cols
+    has_sched = "scheduled_date" in cols
+    has_status = "status" in cols
+    has_sym = "symptoms" in cols
+
+    today = datetime.now(CAIRO).date()
+    start_day = today - timedelta(days=days-1)
+
+    # Build the date buckets
+    dates = [start_day + timedelta(days=i) for i in range(days)]
+    date_strs = [d.isoformat() for d in dates]
+
+    # Per-day ticket sequence (based on scheduled_date)
+    seq_per_day = {ds: 0 for ds in date_strs}
+
+    # Plan: local mix per day (rounded), respecting capacity
+    day_plans = []
+    for _ in date_strs:
+        c = int(round(per_day_cap * pct_completed))
+        p_same = int(round(per_day_cap * pct_pending_same))
+        p_over = per_day_cap - c - p_same
+        if p_over < 0:  # guard against bad percentages
+            p_over = 0
+            # re-normalize
+            rest = per_day_cap - c
+            p_same = max(0, rest)
+        day_plans.append({"completed": c, "pending_same": p_same, "pending_over": p_over})
+
+    # Overflow queue: how many pending need to be scheduled on the *next* day
+    overflow_next = 0
+
+    all_rows = []
+
+    for idx, ds in enumerate(date_strs):
+        plan = day_plans[idx].copy()
+        cap_left = per_day_cap
+
+        # First consume *yesterday’s* overflow into *today* as pending.
+        take_from_overflow = min(overflow_next, cap_left)
+        overflow_next -= take_from_overflow
+        cap_left -= take_from_overflow
+
+        # Prepare records for this portion (pending set to today ds)
+        for _ in range(take_from_overflow):
+            seq_per_day[ds] += 1
+            name = rand_name()
+            phone = rand_phone()
+            symptoms = random.choice(SYMPTOMS)
+            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
+                hours=random.randint(8, 18), minutes=random.randint(0, 59)
+            )
+            created_at = iso_ts(created_dt)
+            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
+
+            row = {}
+            if has_ticket:      row["ticket_number"]   = ticket
+            row["name"] = name
+            if has_phone:       row["phone"]           = phone
+            if has_phone_text:  row["phone_text"]      = phone
+            if has_sched:       row["scheduled_date"]  = ds
+            if has_status:      row["status"]          = "pending"
+            if has_sym:         row["symptoms"]        = symptoms
+            if has_imgs:        row["image_paths"]     = json.dumps([])
+            if has_voice:       row["voice_note_path"] = None
+            if has_comp_hour:   row["completion_hour"] = None
+            if has_created:     row["created_at"]      = created_at
+            if has_nat:         row["national_id"]     = None
+            all_rows.append(row)
+
+        if cap_left == 0:
+            # today is full just from overflow; push today's local plan entirely to tomorrow
+            overflow_next += plan["completed"] + plan["pending_same"] + plan["pending_over"]
+            continue
+
+        # Now schedule *today's local* plan, respecting cap_left
+        # 1) completed today
+        n_completed = min(plan["completed"], cap_left)
+        cap_left -= n_completed
+        for _ in range(n_completed):
+            seq_per_day[ds] += 1
+            name = rand_name()
+            phone = rand_phone()
+            symptoms = random.choice(SYMPTOMS)
+            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
+                hours=random.randint(8, 18), minutes=random.randint(0, 59)
+            )
+            created_at = iso_ts(created_dt)
+            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
+            # completion hour for completed
+            ch = None
+            if has_comp_hour:
+                hh = random.randint(9, 17)
+                mm = random.choice([0, 15, 30, 45])
+                ch = f"{hh:02d}:{mm:02d}"
+
+            row = {}
+            if has_ticket:      row["ticket_number"]   = ticket
+            row["name"] = name
+            if has_phone:       row["phone"]           = phone
+            if has_phone_text:  row["phone_text"]      = phone
+            if has_sched:       row["scheduled_date"]  = ds
+            if has_status:      row["status"]          = "completed"
+            if has_sym:         row["symptoms"]        = symptoms
+            if has_imgs:        row["image_paths"]     = json.dumps([])
+            if has_voice:       row["voice_note_path"] = None
+            if has_comp_hour:   row["completion_hour"] = ch
+            if has_created:     row["created_at"]      = created_at
+            if has_nat:         row["national_id"]     = None
+            all_rows.append(row)
+
+        if cap_left == 0:
+            # still full
+            overflow_next += plan["pending_same"] + plan["pending_over"]
+            continue
+
+        # 2) pending that *stay today*
+        n_pend_same = min(plan["pending_same"], cap_left)
+        cap_left -= n_pend_same
+        for _ in range(n_pend_same):
+            seq_per_day[ds] += 1
+            name = rand_name()
+            phone = rand_phone()
+            symptoms = random.choice(SYMPTOMS)
+            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
+                hours=random.randint(8, 18), minutes=random.randint(0, 59)
+            )
+            created_at = iso_ts(created_dt)
+            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
+
+            row = {}
+            if has_ticket:      row["ticket_number"]   = ticket
+            row["name"] = name
+            if has_phone:       row["phone"]           = phone
+            if has_phone_text:  row["phone_text"]      = phone
+            if has_sched:       row["scheduled_date"]  = ds
+            if has_status:      row["status"]          = "pending"
+            if has_sym:         row["symptoms"]        = symptoms
+            if has_imgs:        row["image_paths"]     = json.dumps([])
+            if has_voice:       row["voice_note_path"] = None
+            if has_comp_hour:   row["completion_hour"] = None
+            if has_created:     row["created_at"]      = created_at
+            if has_nat:         row["national_id"]     = None
+            all_rows.append(row)
+
+        if cap_left == 0:
+            overflow_next += plan["pending_over"]
+            continue
+
+        # 3) pending that *should overflow to tomorrow*
+        n_pend_overflow = plan["pending_over"]
+        # Use remaining cap for some of these if available (they can still be scheduled today as pending)
+        # The remainder will be pushed to tomorrow.
+        schedule_today = min(n_pend_overflow, cap_left)
+        push_tomorrow  = n_pend_overflow - schedule_today
+
+        # Schedule today's slice
+        for _ in range(schedule_today):
+            seq_per_day[ds] += 1
+            name = rand_name()
+            phone = rand_phone()
+            symptoms = random.choice(SYMPTOMS)
+            created_dt = datetime.combine(dates[idx], datetime.min.time()) + timedelta(
+                hours=random.randint(8, 18), minutes=random.randint(0, 59)
+            )
+            created_at = iso_ts(created_dt)
+            ticket = make_ticket(ds, seq_per_day[ds]) if has_ticket else None
+
+            row = {}
+            if has_ticket:      row["ticket_number"]   = ticket
+            row["name"] = name
+            if has_phone:       row["phone"]           = phone
+            if has_phone_text:  row["phone_text"]      = phone
+            if has_sched:       row["scheduled_date"]  = ds
+            if has_status:      row["status"]          = "pending"
+            if has_sym:         row["symptoms"]        = symptoms
+            if has_imgs:        row["image_paths"]     = json.dumps([])
+            if has_voice:       row["voice_note_path"] = None
+            if has_comp_hour:   row["completion_hour"] = None
+            if has_created:     row["created_at"]      = created_at
+            if has_nat:         row["national_id"]     = None
+            all_rows.append(row)
+
+        overflow_next += push_tomorrow
+
+    # If overflow remains after the last day: assign to the last day if capacity left; otherwise, drop it (or optionally extend horizon)
+    if overflow_next > 0:
+        last = date_strs[-1]
+        # Count how many already scheduled on last day
+        last_count = sum(1 for r in all_rows if r.get("scheduled_date") == last)
+        cap_left = max(0, per_day_cap - last_count)
+        add = min(cap_left, overflow_next)
+        for _ in range(add):
+            seq_per_day[last] += 1
+            name = rand_name()
+            phone = rand_phone()
+            symptoms = random.choice(SYMPTOMS)
+            created_dt = datetime.combine(dates[-1], datetime.min.time()) + timedelta(
+                hours=random.randint(8, 18), minutes=random.randint(0, 59)
+            )
+            created_at = iso_ts(created_dt)
+            ticket = make_ticket(last, seq_per_day[last]) if has_ticket else None
+
+            row = {}
+            if has_ticket:      row["ticket_number"]   = ticket
+            row["name"] = name
+            if has_phone:       row["phone"]           = phone
+            if has_phone_text:  row["phone_text"]      = phone
+            if has_sched:       row["scheduled_date"]  = last
+            if has_status:      row["status"]          = "pending"
+            if has_sym:         row["symptoms"]        = symptoms
+            if has_imgs:        row["image_paths"]     = json.dumps([])
+            if has_voice:       row["voice_note_path"] = None
+            if has_comp_hour:   row["completion_hour"] = None
+            if has_created:     row["created_at"]      = created_at
+            if has_nat:         row["national_id"]     = None
+            all_rows.append(row)
+        overflow_next -= add
+        # If still >0, we simply ignore extra to avoid breaking capacity (or add an 8th day if you prefer)
+
+    if not all_rows:
+        print("⚠️ Nothing to insert.")
+        return
+
+    cols_used = sorted(all_rows[0].keys())
+    placeholders = ", ".join(["?"] * len(cols_used))
+    col_list = ", ".join(cols_used)
+    sql = f"INSERT INTO appointments ({col_list}) VALUES ({placeholders})"
+
+    with con:
+        con.executemany(sql, [[r.get(c) for c in cols_used] for r in all_rows])
+
+    print(f"✅ Inserted {len(all_rows)} rows into appointments ({db_path}). (Overflow left unassigned: {overflow_next})")
+
+
+# ------------- BULK GENERATOR (benchmarks / capacity planning) -------------
+
+# Same shape as yarab/dental_appointments.db, used when generating into a new file
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_number INTEGER UNIQUE,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    symptoms TEXT,
+    image_paths TEXT,
+    voice_note_path TEXT,
+    status TEXT DEFAULT 'pending',
+    scheduled_date TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completion_hour TEXT,
+    national_id TEXT,
+    phone_text TEXT,
+    slot_time TEXT,
+    slot_chair INTEGER
+);
+CREATE TABLE IF NOT EXISTS daily_capacity (
+    day_name TEXT PRIMARY KEY,
+    capacity INTEGER DEFAULT 0
+);
+"""
+
+WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# Relative demand per weekday (Friday is the weekend, Saturday catches up)
+WEEKDAY_WEIGHTS = [1.0, 1.0, 0.95, 0.9, 0.3, 1.15, 1.05]
+# Days between booking and visit; most patients book for the same or next day
+LEAD_DAYS = [0, 1, 2, 3, 5, 7, 14]
+LEAD_WEIGHTS = [40, 25, 12, 8, 7, 5, 3]
+
+GEN_COLUMNS = ("ticket_number", "name", "phone", "phone_text", "national_id", "symptoms", "image_paths",
+               "voice_note_path", "status", "scheduled_date", "completion_hour", "created_at")
+
+
+def split_rows(rows, start_day, days, skew=0.0):
+    """Spread `rows` over `days` dates by weekday demand and a growth skew.
+
+    skew=0 keeps volume flat; skew>0 makes later dates busier ((i+1) ** skew),
+    which is what a growing clinic looks like. Largest-remainder rounding keeps
+    the total exact.
+    """
+    weights = [WEEKDAY_WEIGHTS[(start_day + timedelta(days=i)).weekday()] * (i + 1) ** skew for i in range(days)]
+    total = sum(weights)
+    exact = [rows * w / total for w in weights]
+    counts = [int(x) for x in exact]
+    short = rows - sum(counts)
+    for i in sorted(range(days), key=lambda i: exact[i] - counts[i], reverse=True)[:short]:
+        counts[i] += 1
+    return counts
+
+
+# Value pools are built once so per-row work is a lookup, not a format call
+_BIRTH_POOL = []
+_TIME_POOL = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(8 * 3600, 23 * 3600)]
+_HHMM_POOL = [f"{m // 60:02d}:{m % 60:02d}" for m in range(1440)]
+
+
+def national_ids(n, rnd):
+    """Egyptian format: century + YYMMDD + governorate + 4-digit serial + check digit."""
+    if not _BIRTH_POOL:
+        d, last = datetime(1945, 1, 1), datetime(2015, 12, 31)
+        while d <= last:
+            _BIRTH_POOL.append(f"{2 if d.year < 2000 else 3}{d:%y%m%d}")
+            d += timedelta(days=1)
+    return [
+        f"{b}{g}{s:05d}"
+        for b, g, s in zip(rnd.choices(_BIRTH_POOL, k=n), rnd.choices(GOVERNORATES, k=n), rnd.choices(range(100000), k=n))
+    ]
+
+
+def day_columns(day, n, first_seq, today, rnd, completed_pct, attachments_pct):
+    """Build all columns for one scheduled_date in bulk (one list per column)."""
+    ds = day.isoformat()
+    nids = national_ids(n, rnd)
+    ymd = int(ds.replace("-", "")) * 10**7
+    tickets = [ymd + seq * 10**4 + int(nid[-4:]) for seq, nid in zip(range(first_seq, first_seq + n), nids)]
+    names = [f"{a} {b}" for a, b in zip(rnd.choices(FIRST_NAMES, k=n), rnd.choices(LAST_NAMES, k=n))]
+    phones = [f"{p}{x:08d}" for p, x in zip(rnd.choices(PHONE_PREFIXES, k=n), rnd.choices(range(10**8), k=n))]
+    draws = [rnd.random() for _ in range(2 * n)]
+
+    # Past days: mostly completed, the rest cancelled or no-shows (nothing is left
+    # pending in the past). Today: the morning part of the queue is done. Future days: all pending.
+    if day < today:
+        statuses = [
+            "completed" if r < completed_pct else "cancelled" if r < (1 + completed_pct) / 2 else "no_show"
+            for r in draws[:n]
+        ]
+    elif day == today:
+        done = int(n * completed_pct * rnd.random())
+        statuses = ["completed"] * done + ["pending"] * (n - done)
+    else:
+        statuses = ["pending"] * n
+
+    # Clinic opens at 09:00 and works through the queue in ticket order
+    step = max(5, min(30, 540 // max(n, 1)))
+    hours = [
+        _HHMM_POOL[min(540 + i * step + j, 1439)] if st == "completed" else None
+        for i, st, j in zip(range(n), statuses, rnd.choices(range(-5, 10), k=n))
+    ]
+
+    lead_dates = [(day - timedelta(days=lead)).isoformat() for lead in LEAD_DAYS]
+    created = [f"{d} {t}" for d, t in zip(rnd.choices(lead_dates, weights=LEAD_WEIGHTS, k=n), rnd.choices(_TIME_POOL, k=n))]
+
+    stamp = ds.replace("-", "")
+    images = [f'["uploads/patients/patient_{nid}/images/img_{stamp}080000.jpg"]' if r < attachments_pct else "[]"
+              for nid, r in zip(nids, draws[n:])]
+    voices = [f"uploads/patients/patient_{nid}/voices/voice_{stamp}080000.webm" if r < attachments_pct / 2 else None
+              for nid, r in zip(nids, draws[n:])]
+
+    return {
+        "ticket_number": tickets,
+        "name": names,
+        "phone": phones,
+        "phone_text": phones,
+        "national_id": nids,
+        "symptoms": rnd.choices(SYMPTOMS, k=n),
+        "image_paths": images,
+        "voice_note_path": voices,
+        "status": statuses,
+        "scheduled_date": [ds] * n,
+        "completion_hour": hours,
+        "created_at": created,
+    }
+
+
+def chunk_rows(chunk, cols, today, completed_pct, attachments_pct, seed_key):
+    """Rows (tuples in `cols` order) for a list of (day, n, first_seq); runs in a worker process."""
+    rnd = random.Random(seed_key)
+    out = []
+    for day, n, first_seq in chunk:
+        columns = day_columns(day, n, first_seq, today, rnd, completed_pct, attachments_pct)
+        out.extend(zip(*(columns[c] for c in cols)))
+    return out
+
+
+def unique_pending(batch, cols, taken, rnd):
+    """
+    Give each pending row a national ID no other pending row has (one pending
+    appointment per patient). `taken` holds the pending IDs seen so far and is
+    updated; a clash keeps the last 4 digits, which the ticket number uses.
+    Returns the rows, with new tuples only where an ID changed.
+    """
+    i_status, i_nid = cols.index("status"), cols.index("national_id")
+    out = batch
+    for k, row in enumerate(batch):
+        if row[i_status] != "pending":
+            continue
+        nid = row[i_nid]
+        while nid in taken:
+            nid = national_ids(1, rnd)[0][:-4] + nid[-4:]
+        taken.add(nid)
+        if nid != row[i_nid]:
+            if out is batch:
+                out = list(batch)
+            out[k] = row[:i_nid] + (nid,) + row[i_nid + 1:]
+    return out
+
+
+def generate(db_path, rows=100_000, days=365, end=None, skew=0.0, completed_pct=0.85,
+             attachments_pct=0.15, seed=None, append=False, batch_size=50_000, workers=None):
+    """
+    Bulk-generate `rows` appointments spread over `days` dates ending at `end` (default: today).
+      - Creates the schema when `db_path` is a new file
+      - Replaces existing appointments unless `append` is set (then per-day sequences continue)
+      - Past dates are `completed_pct` completed, the rest cancelled or no_show; pending rows
+        (today and later) get distinct national IDs
+      - Worker processes build batches while this process inserts them
+      - Loads in one transaction with relaxed PRAGMAs and rebuilds secondary indexes afterwards
+    """
+    seed = random.randrange(2**32) if seed is None else seed
+    workers = workers or os.cpu_count() or 1
+    today = datetime.now(CAIRO).date()
+    end_day = end or today
+    start_day = end_day - timedelta(days=days - 1)
+
+    con = sqlite3.connect(db_path, isolation_level=None)
+    con.executescript(SCHEMA)
+    table_cols = {r[1] for r in con.execute("PRAGMA table_info(appointments)")}
+    cols = [c for c in GEN_COLUMNS if c in table_cols]
+    sql = f"INSERT INTO appointments ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))})"
+
+    used, taken = {}, set()
+    if append:
+        taken = {r[0] for r in con.execute("SELECT national_id FROM appointments WHERE status = 'pending'")}
+        used = dict(con.execute(
+            "SELECT scheduled_date, COUNT(*) FROM appointments WHERE scheduled_date BETWEEN ? AND ? GROUP BY scheduled_date",
+            (start_day.isoformat(), end_day.isoformat()),
+        ).fetchall())
+
+    counts = split_rows(rows, start_day, days, skew)
+    for i, n in enumerate(counts):
+        ds = (start_day + timedelta(days=i)).isoformat()
+        if used.get(ds, 0) + n > 999:
+            raise SystemExit(f"{ds} would get {used.get(ds, 0) + n} appointments but the ticket sequence "
+                             f"is 3 digits (max 999/day); increase --days or lower --skew")
+
+    # Group days into batches of roughly `batch_size` rows; each batch has its own RNG stream
+    chunks, chunk, size = [], [], 0
+    for i, n in enumerate(counts):
+        if n:
+            day = start_day + timedelta(days=i)
+            chunk.append((day, n, used.get(day.isoformat(), 0) + 1))
+            size += n
+        if size >= batch_size:
+            chunks.append(chunk)
+            chunk, size = [], 0
+    if chunk:
+        chunks.append(chunk)
+    jobs = [(c, cols, today, completed_pct, attachments_pct, f"{seed}:{i}") for i, c in enumerate(chunks)]
+
+    # Secondary indexes are dropped during the load and rebuilt once at the end
+    indexes = con.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='appointments' AND sql IS NOT NULL"
+    ).fetchall()
+    journal_mode = con.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode != "wal":
+        con.execute("PRAGMA journal_mode=MEMORY")
+    con.execute("PRAGMA synchronous=OFF")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA cache_size=-262144")
+
+    t0 = time.perf_counter()
+    inserted = 0
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if not append:
+            con.execute("DELETE FROM appointments")
+        for name, _ in indexes:
+            con.execute(f'DROP INDEX "{name}"')
+
+        if workers > 1 and len(jobs) > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            batches = pool.map(chunk_rows, *zip(*jobs))
+        else:
+            pool = None
+            batches = (chunk_rows(*job) for job in jobs)
+        try:
+            dedupe = "status" in cols and "national_id" in cols
+            rnd = random.Random(f"{seed}:pending")
+            for batch in batches:
+                if dedupe:
+                    batch = unique_pending(batch, cols, taken, rnd)
+                con.executemany(sql, batch)
+                inserted += len(batch)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        for _, index_sql in indexes:
+            con.execute(index_sql)
+
+        # A new database gets a capacity table that fits the generated volume
+        if not con.execute("SELECT 1 FROM daily_capacity LIMIT 1").fetchone():
+            peak = [0] * 7
+            for i, n in enumerate(counts):
+                wd = (start_day + timedelta(days=i)).weekday()
+                peak[wd] = max(peak[wd], n)
+            con.executemany("INSERT INTO daily_capacity (day_name, capacity) VALUES (?, ?)", zip(WEEK, peak))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.execute("PRAGMA synchronous=FULL")
+        if journal_mode != "wal":
+            con.execute(f"PRAGMA journal_mode={journal_mode}")
+
+    con.execute("ANALYZE appointments")
+    con.close()
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Generated {inserted} appointments over {days} days ({start_day} → {end_day}) "
+          f"in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):,.0f} rows/s) into {db_path}")
+    return inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed or bulk-generate appointments")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_reset = sub.add_parser("reset", help="replace appointments with a small realistic week")
+    p_reset.add_argument("--db", default="yarab/dental_appointments.db")
+    p_reset.add_argument("--days", type=int, default=7)
+    p_reset.add_argument("--per-day-cap", type=int, default=20)
+
+    p_gen = sub.add_parser("generate", help="bulk-generate production-like volumes")
+    p_gen.add_argument("--db", required=True, help="target SQLite file (created if missing)")
+    p_gen.add_argument("--rows", type=int, default=100_000)
+    p_gen.add_argument("--days", type=int, default=365, help="date span ending at --end")
+    p_gen.add_argument("--end", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(), default=None,
+                       help="last scheduled_date (YYYY-MM-DD), default today")
+    p_gen.add_argument("--skew", type=float, default=0.0, help="0 = flat, >0 = later dates busier")
+    p_gen.add_argument("--completed", type=float, default=0.85, help="share of past appointments completed (the rest cancelled or no-show), "
+                            "and at most of today's")
+    p_gen.add_argument("--attachments", type=float, default=0.15, help="share of rows with an image path")
+    p_gen.add_argument("--seed", type=int, default=None)
+    p_gen.add_argument("--append", action="store_true", help="keep existing rows")
+    p_gen.add_argument("--workers", type=int, default=None, help="generator processes (default: CPU count)")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "reset":
+        reset_and_seed(args.db, days=args.days, per_day_cap=args.per_day_cap)
+    else:
+        generate(args.db, rows=args.rows, days=args.days, end=args.end, skew=args.skew,
+                 completed_pct=args.completed, attachments_pct=args.attachments, seed=args.seed,
+                 append=args.append, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Run the patient and/or staff app on a production WSGI server.
+
+    python serve.py both                      # patient on :5000, staff on :5001
+    python serve.py combined                  # both apps in one process on :5000 (see combined.py)
+    python serve.py patient --workers 4 --threads 8
+    python serve.py staff --server waitress --port 5001
+    python serve.py reload both               # new code, no dropped connections (gunicorn)
+
+--server auto (the default) picks gunicorn where it runs (not Windows), then
+waitress, and falls back to Flask's development server with a warning.
+
+  - gunicorn: settings in gunicorn.conf.py (gthread workers, app preloaded in
+    the master, graceful timeouts); --workers/--threads override them. The
+    master's pid is kept in yarab/run/<service>.pid for `reload`.
+  - waitress: one process with --threads threads (Windows, or anywhere
+    gunicorn is not installed).
+
+With `both`, each service runs in its own child process; Ctrl+C / SIGTERM stop
+both, and SIGHUP is passed on (gunicorn restarts its workers gracefully).
+"""
+import argparse
+import importlib
+import importlib.util
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RUN_DIR = os.path.join(HERE, "yarab", "run")
+SERVICES = {
+    "patient": ("app_patient", 5000),
+    "staff": ("app_staff", 5001),
+    "combined": ("combined", 5000),
+}
+BOTH = ("patient", "staff")
+SERVERS = ["auto", "gunicorn", "waitress", "dev"]
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def pick_server(name):
+    if name != "auto":
+        return name
+    if os.name != "nt" and _installed("gunicorn"):
+        return "gunicorn"
+    if _installed("waitress"):
+        return "waitress"
+    return "dev"
+
+
+def pidfile(service):
+    return os.path.join(RUN_DIR, f"{service}.pid")
+
+
+def _read_pid(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+# ------------- one service -------------
+
+def run_gunicorn(service, host, port, workers, threads):
+    module, _ = SERVICES[service]
+    os.makedirs(RUN_DIR, exist_ok=True)
+    # The console script, not `python -m gunicorn`: on USR2 gunicorn re-executes its
+    # argv, and running gunicorn/__main__.py directly shadows the stdlib `http` package
+    script = shutil.which("gunicorn", path=os.path.dirname(sys.executable)) or shutil.which("gunicorn")
+    argv = [
+        script,
+        "--config", os.path.join(HERE, "gunicorn.conf.py"),
+        "--chdir", HERE,
+        "--bind", f"{host}:{port}",
+        "--pid", pidfile(service),
+        "--name", f"dental-{service}",
+    ]
+    if workers:
+        argv += ["--workers", str(workers)]
+    if threads:
+        argv += ["--threads", str(threads)]
+    argv.append(f"{module}:create_app()")
+    # Replace this process, so the pid (and USR2 re-exec) belong to gunicorn itself
+    os.execv(script, argv)
+
+
+def run_waitress(service, host, port, threads):
+    import waitress
+
+    module, _ = SERVICES[service]
+    app = importlib.import_module(module).create_app()
+    threads = threads or int(os.getenv("WEB_THREADS", "8"))
+    print(f"[{service}] waitress on http://{host}:{port} ({threads} threads)")
+    waitress.serve(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        channel_timeout=int(os.getenv("WEB_TIMEOUT", "60")),
+        ident=f"dental-{service}",
+    )
+
+
+def run_dev(service, host, port):
+    module, _ = SERVICES[service]
+    app = importlib.import_module(module).create_app()
+    print(f"[{service}] WARNING: neither gunicorn nor waitress is installed; "
+          "using the Flask development server (pip install gunicorn, or waitress on Windows)")
+    app.run(host=host, port=port, threaded=True)
+
+
+def run_one(service, server, host, port, workers, threads):
+    if server == "gunicorn":
+        run_gunicorn(service, host, port, workers, threads)
+    elif server == "waitress":
+        run_waitress(service, host, port, threads)
+    else:
+        run_dev(service, host, port)
+
+
+# ------------- both services -------------
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def run_both(args):
+    children = {}
+    for service in BOTH:
+        default_port = SERVICES[service][1]
+        port = args.patient_port if service == "patient" else args.staff_port
+        argv = [sys.executable, os.path.abspath(__file__), service,
+                "--server", args.server, "--host", args.host, "--port", str(port or default_port)]
+        if args.workers:
+            argv += ["--workers", str(args.workers)]
+        if args.threads:
+            argv += ["--threads", str(args.threads)]
+        if args.server == "gunicorn":
+            stale = _read_pid(pidfile(service))
+            if stale is not None and not _alive(stale):
+                os.remove(pidfile(service))
+        children[service] = subprocess.Popen(argv, cwd=HERE)
+
+    def master(service):
+        # `reload` replaces the gunicorn master we started: follow the pidfile
+        if args.server == "gunicorn":
+            path = pidfile(service)
+            pid = _read_pid(path) or _read_pid(path + ".2")
+            if pid is not None:
+                return pid
+        return children[service].pid
+
+    def running():
+        for child in children.values():
+            child.poll()  # reap, so an exited child does not look alive
+        return [pid for pid in map(master, BOTH) if _alive(pid)]
+
+    def forward(signum, frame):
+        for pid in running():
+            os.kill(pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, forward)
+    try:
+        # If either service exits, stop the other one too
+        while len(running()) == len(BOTH):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    forward(signal.SIGTERM, None)
+    deadline = time.monotonic() + 40
+    while running() and time.monotonic() < deadline:
+        time.sleep(0.2)
+    for pid in running():
+        os.kill(pid, signal.SIGKILL)
+    return max(child.returncode or 0 for child in children.values())
+
+
+# ------------- reload -------------
+
+def reload(service, timeout=30.0):
+    """Zero-downtime code reload of a gunicorn master: USR2 starts a new master
+    with new workers; once it is up, the old master stops gracefully."""
+    path = pidfile(service)
+    old = _read_pid(path)
+    if old is None:
+        print(f"[{service}] not running under gunicorn (no {path})")
+        return False
+    os.kill(old, signal.SIGUSR2)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # The new master writes <pidfile>.2 (older gunicorn: <pidfile>, after moving ours to .oldbin)
+        new = _read_pid(path + ".2") or _read_pid(path)
+        if new is not None and new != old:
+            time.sleep(2)  # let the new workers boot before the old ones drain
+            try:
+                os.kill(old, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            print(f"[{service}] reloaded: master {old} -> {new}")
+            return True
+        time.sleep(0.2)
+    print(f"[{service}] new master did not start within {timeout:.0f}s; old master {old} left running")
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dental appointment apps")
+    parser.add_argument("service", choices=[*SERVICES, "both", "reload"])
+    parser.add_argument("target", nargs="?", choices=[*SERVICES, "both"], default="both",
+                        help="with reload: which service to reload")
+    parser.add_argument("--server", choices=SERVERS, default=os.getenv("WEB_SERVER", "auto"))
+    parser.add_argument("--host", default=os.getenv("WEB_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=None, help="single service only")
+    parser.add_argument("--patient-port", type=int, default=None)
+    parser.add_argument("--staff-port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=None, help="threads per worker")
+    args = parser.parse_args(argv)
+
+    if args.service == "reload":
+        targets = BOTH if args.target == "both" else [args.target]
+        return 0 if all([reload(s) for s in targets]) else 1
+
+    args.server = pick_server(args.server)
+    if args.service == "both":
+        return run_both(args)
+    port = args.port or SERVICES[args.service][1]
+    run_one(args.service, args.server, args.host, port, args.workers, args.threads)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
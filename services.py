@@ -0,0 +1,233 @@
+"""
+Database access and in-memory caches shared by the patient and staff apps.
+
+Both apps import their connection factory and caches from here, so when they
+run in one process (see combined.py) there is one of each: a capacity change
+or a staff edit updates the same objects the patient endpoints read, with no
+polling delay. Run as two processes, each gets its own copy, kept in sync
+through PRAGMA data_version / config_version as before.
+
+Each clinic (branch) has its own database file and its own set of these
+objects (a Clinic). CLINICS="giza=yarab/clinics/giza.db,maadi=/data/maadi.db"
+adds branches next to the default one (DEFAULT_CLINIC, "main", on DENTAL_DB).
+Routes under /clinics/<clinic_id>/ select a branch for the request (see
+clinic_routes); everything else uses the default. The module-level names
+(get_conn, CAPACITY, AVAILABILITY, ...) always refer to the current
+request's clinic, so views need not know which branch they serve.
+"""
+import contextvars
+import datetime as dt
+import os
+import sqlite3
+import threading
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+def _find_dotenv():
+    """The nearest .env in this directory or a parent (where load_dotenv() would look)."""
+    d = HERE
+    while True:
+        path = os.path.join(d, ".env")
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(d)
+        if parent == d:
+            return None
+        d = parent
+
+# Load environment variables (python-dotenv is only imported when there is a file to read)
+_dotenv = _find_dotenv()
+if _dotenv:
+    from dotenv import load_dotenv
+    load_dotenv(_dotenv)
+
+# After .env is loaded: some of these read settings at import time
+import availability  # noqa: E402
+import capacity_cache  # noqa: E402
+import idempotency  # noqa: E402
+import live_queue  # noqa: E402
+import metrics  # noqa: E402
+import pending_rule  # noqa: E402
+import query_profiler  # noqa: E402
+import slots  # noqa: E402
+
+from flask import abort, jsonify, make_response  # noqa: E402
+from werkzeug.local import LocalProxy  # noqa: E402
+
+DB_PATH = os.getenv("DENTAL_DB", os.path.join(HERE, 'yarab', 'dental_appointments.db'))
+DEFAULT_CLINIC = os.getenv("DEFAULT_CLINIC", "main")
+
+class AfterCommit:
+    """
+    In-memory cache updates that belong to one write: on_commit callbacks run
+    once its transaction has committed, on_rollback ones undo reservations
+    made before it (a seat) if it is rolled back instead.
+    """
+
+    def __init__(self):
+        self._commit = []
+        self._rollback = []
+
+    def on_commit(self, fn):
+        self._commit.append(fn)
+
+    def on_rollback(self, fn):
+        self._rollback.append(fn)
+
+    def committed(self):
+        for fn in self._commit:
+            fn()
+        self._commit, self._rollback = [], []
+
+    def rolled_back(self):
+        for fn in reversed(self._rollback):
+            fn()
+        self._commit, self._rollback = [], []
+
+
+# Database setup
+def dict_factory(cursor, row):
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+class Clinic:
+    """One branch: its database file and the caches built on it."""
+
+    def __init__(self, clinic_id, db_path):
+        self.id = clinic_id
+        self.db_path = db_path
+        if not os.path.exists(db_path):
+            _create_schema(db_path)
+
+        # Weekday capacities are served from memory (see capacity_cache.py)
+        self.capacity = capacity_cache.CapacityCache(self.get_conn)
+        # Seats within a day for weekdays with a slot template (see slots.py)
+        self.slots = slots.SlotAllocator(self.get_conn, self.capacity.slot_template)
+        # Remaining slots per date for the next year, kept in memory (see availability.py)
+        self.availability = availability.AvailabilityIndex(self.get_conn, self.capacity_for)
+        # Today's queue positions, kept in memory for polling phones (see live_queue.py)
+        self.today_queue = live_queue.TodayQueue(self.get_conn)
+        # One pending appointment per patient, enforced by a partial unique index (see pending_rule.py)
+        self.pending = pending_rule.PendingGuard(self.get_conn)
+        # Retried POSTs with the same Idempotency-Key get the first response back (see idempotency.py)
+        self.idempotency = idempotency.IdempotencyStore(self.get_conn)
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def get_conn(self):
+        conn = metrics.connect(self.db_path, factory=query_profiler.ProfiledConnection)
+        conn.row_factory = dict_factory
+        return conn
+
+    def capacity_for(self, day: dt.date) -> int:
+        # Default capacity is 10; days with time slots never take more than their seats
+        return self.slots.capacity(day, self.capacity.for_date(day, 10))
+
+    def appointments_changed(self):
+        self.availability.invalidate()
+        self.today_queue.invalidate()
+
+    def state(self, name, factory):
+        """The app-specific object `name` for this clinic, built by factory(clinic) on first use."""
+        obj = self._state.get(name)
+        if obj is None:
+            with self._lock:
+                obj = self._state.get(name)
+                if obj is None:
+                    obj = self._state[name] = factory(self)
+        return obj
+
+    def bind(self, fn):
+        """fn wrapped to run as this clinic's code, for threads that outlive the request."""
+        def bound(*args, **kwargs):
+            token = _current.set(self)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+        return bound
+
+
+def _create_schema(path):
+    """A new branch starts with the base tables; later ones are added on first use (schema.py)."""
+    from seed import SCHEMA
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _load_clinics():
+    clinics = {DEFAULT_CLINIC: Clinic(DEFAULT_CLINIC, DB_PATH)}
+    for part in os.getenv("CLINICS", "").split(","):
+        if "=" in part:
+            clinic_id, path = (x.strip() for x in part.split("=", 1))
+            if not os.path.isabs(path):
+                path = os.path.join(HERE, path)
+            clinics[clinic_id] = Clinic(clinic_id, path)
+    return clinics
+
+
+CLINICS = _load_clinics()
+DEFAULT = CLINICS[DEFAULT_CLINIC]
+_current = contextvars.ContextVar("clinic", default=None)
+
+
+def current():
+    """The clinic of the current request (or bound thread); the default one otherwise."""
+    return _current.get() or DEFAULT
+
+
+def clinic_routes(bp):
+    """
+    Let `bp` be registered a second time under /clinics/<clinic_id>: requests
+    there run against that clinic, unknown ids get a 404.
+    """
+    @bp.url_value_preprocessor
+    def _select_clinic(endpoint, values):
+        clinic_id = values.pop("clinic_id", None) if values else None
+        if clinic_id is None:
+            _current.set(DEFAULT)
+        elif clinic_id in CLINICS:
+            _current.set(CLINICS[clinic_id])
+        else:
+            abort(make_response(jsonify({"error": f"Unknown clinic: {clinic_id}"}), 404))
+
+    @bp.teardown_request
+    def _reset_clinic(exc):
+        _current.set(None)
+
+
+def get_conn():
+    return current().get_conn()
+
+def capacity_for(day: dt.date) -> int:
+    return current().capacity_for(day)
+
+CAPACITY = LocalProxy(lambda: current().capacity)
+SLOTS = LocalProxy(lambda: current().slots)
+AVAILABILITY = LocalProxy(lambda: current().availability)
+TODAY_QUEUE = LocalProxy(lambda: current().today_queue)
+PENDING = LocalProxy(lambda: current().pending)
+IDEMPOTENCY = LocalProxy(lambda: current().idempotency)
+
+
+def per_clinic(name, factory):
+    """A proxy to an app's own per-clinic object (see Clinic.state)."""
+    return LocalProxy(lambda: current().state(name, factory))
+
+
+def idempotent(scope):
+    """IDEMPOTENCY.idempotent(scope), resolving the clinic's store at request time
+    (the bound method would fix the clinic when the decorator runs, at import)."""
+    return idempotency.IdempotencyStore.idempotent(IDEMPOTENCY, scope)
+
+
+def appointments_changed():
+    """Call after committing a write to appointments outside the booking path.
+    Drops the in-memory snapshots built in this process; the next read rebuilds them."""
+    current().appointments_changed()
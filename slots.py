@@ -0,0 +1,192 @@
+"""
+Time slots within a day.
+
+A weekday with a row in slot_templates is split into `slot_count` slots of
+`slot_minutes` from `start_time`, each seating `chairs` patients. Every booking
+on such a day gets a concrete seat (slot_time, slot_chair) and the day's
+capacity is capped at slot_count * chairs. Weekdays without a template are
+booked by date only, as before.
+
+Occupancy is one int bitmap per date: bit `slot * chairs + chair` is set when
+that seat is taken, so the first free seat (earliest time, lowest chair) is
+the lowest clear bit. A date's bitmap is built from the database on first use
+(one indexed query), updated in place as seats are handed out, and rebuilt
+after SLOT_REFRESH_SECONDS so cancellations made by the other app show up.
+The partial unique index on (scheduled_date, slot_time, slot_chair) is the
+source of truth: an insert that loses a race with another process fails, and
+book() rebuilds that date and tries the next seat. On a slot day with every
+seat taken, book() raises SlotsFull rather than booking without a seat.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import schema
+
+MIGRATION = "2026-10-19_add_appointment_slots.sql"
+
+
+class SlotsFull(Exception):
+    def __init__(self, day):
+        super().__init__(f"Every slot on {day.isoformat()} is taken")
+        self.day = day
+
+
+class SlotTemplate(NamedTuple):
+    start_minute: int  # minutes after midnight
+    slot_minutes: int
+    slot_count: int
+    chairs: int
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a slot_templates row; ValueError if it is malformed."""
+        hh, mm = str(row["start_time"]).split(":")
+        template = cls(int(hh) * 60 + int(mm), int(row["slot_minutes"]), int(row["slot_count"]), int(row["chairs"] or 1))
+        if (
+            not 0 <= template.start_minute < 24 * 60
+            or template.slot_minutes <= 0 or template.slot_count <= 0 or template.chairs <= 0
+            or template.start_minute + template.slot_count * template.slot_minutes > 24 * 60
+        ):
+            raise ValueError(f"invalid slot template: {dict(row)}")
+        return template
+
+    @property
+    def positions(self) -> int:
+        return self.slot_count * self.chairs
+
+    def time_of(self, slot: int) -> str:
+        minute = self.start_minute + slot * self.slot_minutes
+        return f"{minute // 60:02d}:{minute % 60:02d}"
+
+    def slot_of(self, hhmm):
+        """Slot index for an HH:MM start time, or None if it is not on this template's grid."""
+        try:
+            hh, mm = str(hhmm).split(":")
+            offset = int(hh) * 60 + int(mm) - self.start_minute
+        except ValueError:
+            return None
+        slot, rest = divmod(offset, self.slot_minutes)
+        return slot if rest == 0 and 0 <= slot < self.slot_count else None
+
+    def as_dict(self) -> dict:
+        return {
+            "start_time": self.time_of(0),
+            "end_time": self.time_of(self.slot_count),
+            "slot_minutes": self.slot_minutes,
+            "slot_count": self.slot_count,
+            "chairs": self.chairs,
+        }
+
+
+class SlotAllocator:
+    def __init__(self, connect, template_for, refresh_seconds=None):
+        """
+        connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn)
+        template_for: (datetime.date) -> SlotTemplate | None
+        """
+        self.connect = connect
+        self.template_for = template_for
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None else float(os.getenv("SLOT_REFRESH_SECONDS", "30"))
+        )
+        self._lock = threading.Lock()
+        self._days = {}  # date -> (template, loaded at, occupancy bitmap)
+        self._prepared = False
+
+    def prepare(self):
+        """Add the slot columns and index if missing. Uses its own connection: call outside a transaction."""
+        if self._prepared:
+            return
+        conn = self.connect()
+        try:
+            schema.ensure_column(conn, "appointments", "slot_time", "TEXT")
+            schema.ensure_column(conn, "appointments", "slot_chair", "INTEGER")
+            schema.ensure(conn, MIGRATION)
+        finally:
+            conn.close()
+        self._prepared = True
+
+    def capacity(self, day, capacity: int) -> int:
+        """`capacity` capped at the number of seats on `day` (unchanged on days without slots)."""
+        template = self.template_for(day)
+        return capacity if template is None else min(capacity, template.positions)
+
+    def allocate(self, conn, day):
+        """
+        Reserve the first free seat on `day` and return (slot_time, slot_chair),
+        or (None, None) when the day has no template or every seat is taken.
+        `conn` is the booking's connection, so its uncommitted inserts count.
+        """
+        template = self.template_for(day)
+        if template is None:
+            return None, None
+        with self._lock:
+            loaded_at, bits = self._bitmap(conn, day, template)
+            free = ~bits & ((1 << template.positions) - 1)
+            if not free:
+                return None, None
+            pos = (free & -free).bit_length() - 1
+            self._days[day] = (template, loaded_at, bits | (1 << pos))
+        slot, chair = divmod(pos, template.chairs)
+        return template.time_of(slot), chair + 1
+
+    def book(self, conn, day, insert, attempts=3):
+        """
+        Call insert(slot_time, slot_chair) with the first free seat on `day` and
+        return (insert's result, slot_time, slot_chair). If another process took
+        the seat first, rebuild the date and try again; if insert raises anything
+        else, the seat is given back and the error propagates. SlotsFull when
+        `day` has slots and none is free; days without slots get (None, None).
+        """
+        for attempt in range(attempts):
+            slot_time, slot_chair = self.allocate(conn, day)
+            if slot_time is None and self.template_for(day) is not None:
+                raise SlotsFull(day)
+            try:
+                return insert(slot_time, slot_chair), slot_time, slot_chair
+            except Exception as exc:
+                taken = isinstance(exc, sqlite3.IntegrityError) and "appointments.slot_time" in str(exc)
+                if slot_time is None or not taken:
+                    self.release(day, slot_time, slot_chair)  # failed for another reason: the seat is still free
+                    raise
+                if attempt == attempts - 1:
+                    raise
+                self.forget(day)
+
+    def release(self, day, slot_time, slot_chair):
+        """Free a seat after a local cancellation."""
+        with self._lock:
+            entry = self._days.get(day)
+            if entry is None or not slot_chair:
+                return
+            template, loaded_at, bits = entry
+            slot = template.slot_of(slot_time)
+            if slot is not None and 1 <= slot_chair <= template.chairs:
+                self._days[day] = (template, loaded_at, bits & ~(1 << (slot * template.chairs + slot_chair - 1)))
+
+    def forget(self, day):
+        """Drop the cached bitmap for `day`; the next allocation reads it from the database."""
+        with self._lock:
+            self._days.pop(day, None)
+
+    def _bitmap(self, conn, day, template):
+        entry = self._days.get(day)
+        now = time.monotonic()
+        if entry is not None and entry[0] == template and now - entry[1] < self.refresh_seconds:
+            return entry[1], entry[2]
+        bits = 0
+        rows = conn.execute(
+            "SELECT slot_time, slot_chair FROM appointments WHERE scheduled_date=? AND slot_time IS NOT NULL",
+            (day.isoformat(),),
+        ).fetchall()
+        for r in rows:
+            slot, chair = template.slot_of(r["slot_time"]), r["slot_chair"]
+            if slot is not None and chair and 1 <= chair <= template.chairs:
+                bits |= 1 << (slot * template.chairs + chair - 1)
+        if len(self._days) > 1000:  # past dates pile up in long-running processes
+            self._days.clear()
+        self._days[day] = (template, now, bits)
+        return now, bits
@@ -3,10 +3,10 @@ echo Starting Dental Appointment System...
 echo.
 
 echo Starting Patient App (Port 5000)...
-start "Patient App" cmd /k "cd /d %~dp0 && python app_patient.py"
+start "Patient App" cmd /k "cd /d %~dp0 && python serve.py patient"
 
 echo Starting Staff App (Port 5001)...
-start "Staff App" cmd /k "cd /d %~dp0 && python app_staff.py"
+start "Staff App" cmd /k "cd /d %~dp0 && python serve.py staff"
 
 echo Starting Frontend Development Servers...
 start "Frontend Dev" cmd /k "cd /d %~dp0 && npm run dev"
@@ -2,10 +2,10 @@ Write-Host "Starting Dental Appointment System..." -ForegroundColor Green
 Write-Host ""
 
 Write-Host "Starting Patient App (Port 5000)..." -ForegroundColor Cyan
-Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd '$PSScriptRoot'; python app_patient.py" -WindowStyle Normal
+Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd '$PSScriptRoot'; python serve.py patient" -WindowStyle Normal
 
 Write-Host "Starting Staff App (Port 5001)..." -ForegroundColor Magenta
-Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd '$PSScriptRoot'; python app_staff.py" -WindowStyle Normal
+Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd '$PSScriptRoot'; python serve.py staff" -WindowStyle Normal
 
 Write-Host "Starting Frontend Development Servers..." -ForegroundColor Yellow
 Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd '$PSScriptRoot'; npm run dev" -WindowStyle Normal
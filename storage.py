@@ -0,0 +1,570 @@
+"""
+Storage interface for appointments, capacity and attachments, with two engines.
+
+    SQLiteStorage(get_conn)   the existing tables, the same SQL the apps run
+    MemoryStorage()           dicts and sorted lists, no disk and no SQL
+
+Both follow the same rules, and storage_contract.check() verifies them against
+any engine:
+  - name and phone are required (ValueError otherwise);
+  - ticket_number is unique;
+  - a patient (national_id) has at most one 'pending' appointment, and an
+    insert or update that breaks this raises PendingConflict with the
+    existing row, unless that row's date has passed: it becomes 'no_show';
+  - booked_on(date) counts every appointment scheduled that day;
+  - lists come newest first (created_at, then id);
+  - a date's capacity is the newest override covering it, otherwise the
+    weekday capacity, otherwise the caller's default.
+
+The staff app's appointment create/update/delete views use SQLiteStorage.
+The memory engine is for benchmarks and fast tests: it shows how much of a
+request is query-layer overhead (benchmarks/bench_storage.py). Rows are plain
+dicts with the appointments columns. image_paths is a list, not JSON text.
+"""
+import datetime as dt
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+
+import capacity_cache
+import pending_rule
+import schema
+
+WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+COLUMNS = ("ticket_number", "name", "phone", "phone_text", "national_id", "symptoms", "image_paths",
+           "voice_note_path", "status", "scheduled_date", "completion_hour", "slot_time", "slot_chair", "created_at")
+REQUIRED = ("name", "phone")  # NOT NULL in the appointments table
+
+
+class Conflict(Exception):
+    pass
+
+
+class DuplicateTicket(Conflict):
+    pass
+
+
+class PendingConflict(Conflict):
+    def __init__(self, existing):
+        super().__init__(f"patient already has pending appointment {existing['id']}")
+        self.existing = existing
+
+
+def _require(fields):
+    missing = [c for c in REQUIRED if fields.get(c) is None]
+    if missing:
+        raise ValueError(f"appointment needs {', '.join(missing)}")
+
+
+def _now():
+    return dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # CURRENT_TIMESTAMP's format
+
+
+class Storage(ABC):
+    """The operations both apps need. Dates are ISO strings, as stored."""
+
+    def prepare(self):
+        """Create whatever the engine needs; safe to call more than once."""
+
+    # ------------- appointments -------------
+
+    @abstractmethod
+    def insert_appointment(self, fields: dict) -> dict:
+        """Store a new appointment; returns it with `id` (and `created_at` if not given)."""
+
+    @abstractmethod
+    def get_appointment(self, appointment_id):
+        ...
+
+    @abstractmethod
+    def update_appointment(self, appointment_id, fields: dict):
+        """Change some columns; returns the updated row, None if there is no such id."""
+
+    @abstractmethod
+    def append_symptoms(self, appointment_id, text):
+        """Add `text` to the end of its symptoms in one write (no read-modify-write);
+        returns the updated row, None if there is no such id."""
+
+    @abstractmethod
+    def delete_appointment(self, appointment_id):
+        """Remove it; returns the deleted row (callers clean up its files), None if absent."""
+
+    @abstractmethod
+    def by_ticket(self, ticket_number):
+        ...
+
+    @abstractmethod
+    def by_phone(self, phone_text):
+        ...
+
+    @abstractmethod
+    def by_national_id(self, national_id):
+        ...
+
+    @abstractmethod
+    def booked_on(self, scheduled_date) -> int:
+        ...
+
+    @abstractmethod
+    def list_appointments(self, status=None, scheduled_date=None, offset=0, limit=50):
+        """(rows, total) newest first; status None/'pending' also matches rows without one."""
+
+    @abstractmethod
+    def status_counts(self) -> dict:
+        ...
+
+    # ------------- capacity -------------
+
+    @abstractmethod
+    def weekday_capacity(self) -> dict:
+        ...
+
+    @abstractmethod
+    def set_weekday_capacity(self, day_name, capacity):
+        ...
+
+    @abstractmethod
+    def add_override(self, start_date, end_date, capacity, reason=None) -> int:
+        ...
+
+    @abstractmethod
+    def overrides(self):
+        """[{id, start_date, end_date, capacity, reason}] by start date."""
+
+    @abstractmethod
+    def delete_override(self, override_id) -> bool:
+        ...
+
+    @abstractmethod
+    def capacity_on(self, day: dt.date, default: int) -> int:
+        ...
+
+    # ------------- attachments -------------
+
+    def set_attachments(self, appointment_id, images, voice=None):
+        return self.update_appointment(appointment_id, {"image_paths": list(images), "voice_note_path": voice})
+
+    def attachments(self, appointment_id):
+        """{"images": [...], "voice": path or None}, None if there is no such appointment."""
+        row = self.get_appointment(appointment_id)
+        if row is None:
+            return None
+        return {"images": list(row["image_paths"]), "voice": row["voice_note_path"]}
+
+    def patient_attachments(self, national_id, first=None, last=None):
+        """[{appointment_id, scheduled_date, kind, path}] for scheduled dates first..last, oldest first."""
+        out = []
+        rows = sorted(self.by_national_id(national_id), key=lambda r: (r["scheduled_date"] or "", r["id"]))
+        for row in rows:
+            day = row["scheduled_date"]
+            if (first and (day or "") < first) or (last and (day or "") > last):
+                continue
+            for path in row["image_paths"]:
+                out.append({"appointment_id": row["id"], "scheduled_date": day, "kind": "image", "path": path})
+            if row["voice_note_path"]:
+                out.append({"appointment_id": row["id"], "scheduled_date": day, "kind": "voice",
+                            "path": row["voice_note_path"]})
+        return out
+
+
+# ------------- SQLITE -------------
+
+def decode_image_paths(text):
+    """The image_paths column as a list: staff writes a JSON list, patient bookings a single path."""
+    if not text:
+        return []
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return [text]
+    return value if isinstance(value, list) else [text]
+
+
+def _decode(row):
+    if row is None:
+        return None
+    row = dict(row)
+    row["image_paths"] = decode_image_paths(row.get("image_paths"))
+    return row
+
+
+def _encode(fields):
+    fields = dict(fields)
+    if "image_paths" in fields:
+        fields["image_paths"] = json.dumps(list(fields["image_paths"] or []))
+    return fields
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, connect):
+        """connect: () -> sqlite3.Connection returning dict rows (the apps' get_conn).
+        Each thread keeps one connection."""
+        self.connect = connect
+        self._local = threading.local()
+        self._bound = None
+
+    @classmethod
+    def on(cls, conn):
+        """
+        An engine on the caller's connection, inside the caller's transaction:
+        writes are not committed, the caller commits or rolls back (e.g. with a
+        seat handed out by slots.book on the same connection).
+        """
+        engine = cls(lambda: conn)
+        engine._bound = conn
+        return engine
+
+    def _conn(self):
+        if self._bound is not None:
+            return self._bound
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    def prepare(self):
+        conn = self._conn()
+        for name in capacity_cache.MIGRATIONS + ("2026-10-19_add_national_id_index.sql",):
+            schema.ensure(conn, name)
+        pending_rule.ensure_index(conn)  # logs and carries on while existing duplicates block it
+
+    def _write(self, sql, args, national_id=None):
+        conn = self._conn()
+        if self._bound is not None:
+            return self._execute(conn, sql, args, national_id)  # the caller's transaction
+        with conn:
+            return self._execute(conn, sql, args, national_id)
+
+    @staticmethod
+    def _execute(conn, sql, args, national_id):
+        try:
+            return conn.execute(sql, args)
+        except sqlite3.IntegrityError as exc:
+            if pending_rule.is_duplicate(exc):
+                # A pending appointment whose date has passed no longer counts (see pending_rule.py)
+                if pending_rule.close_stale(conn, national_id):
+                    return SQLiteStorage._execute(conn, sql, args, national_id)
+                raise PendingConflict(_decode(pending_rule.conflicting(conn, national_id)))
+            if "ticket_number" in str(exc):
+                raise DuplicateTicket(str(exc))
+            raise
+
+    # ------------- appointments -------------
+
+    def insert_appointment(self, fields):
+        _require(fields)
+        fields = _encode({k: v for k, v in fields.items() if k in COLUMNS})
+        names = list(fields)
+        cur = self._write(
+            f"INSERT INTO appointments ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            [fields[n] for n in names], fields.get("national_id"),
+        )
+        return self.get_appointment(cur.lastrowid)
+
+    def get_appointment(self, appointment_id):
+        return _decode(self._conn().execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,)).fetchone())
+
+    def update_appointment(self, appointment_id, fields):
+        fields = _encode({k: v for k, v in fields.items() if k in COLUMNS})
+        if fields:
+            national_id = fields.get("national_id")
+            if national_id is None:
+                row = self._conn().execute("SELECT national_id FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+                national_id = row and row["national_id"]
+            self._write(
+                f"UPDATE appointments SET {', '.join(f'{n} = ?' for n in fields)} WHERE id = ?",
+                [*fields.values(), appointment_id], national_id,
+            )
+        return self.get_appointment(appointment_id)
+
+    def append_symptoms(self, appointment_id, text):
+        self._write("UPDATE appointments SET symptoms = COALESCE(symptoms, '') || ? WHERE id = ?", (text, appointment_id))
+        return self.get_appointment(appointment_id)
+
+    def delete_appointment(self, appointment_id):
+        row = self.get_appointment(appointment_id)
+        if row is not None:
+            self._write("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+        return row
+
+    def _select(self, where, args):
+        rows = self._conn().execute(f"SELECT * FROM appointments WHERE {where} ORDER BY created_at DESC, id DESC", args)
+        return [_decode(r) for r in rows.fetchall()]
+
+    def by_ticket(self, ticket_number):
+        return self._select("ticket_number = ?", (ticket_number,))
+
+    def by_phone(self, phone_text):
+        return self._select("phone_text = ?", (phone_text,))
+
+    def by_national_id(self, national_id):
+        return self._select("national_id = ?", (national_id,))
+
+    def booked_on(self, scheduled_date):
+        return self._conn().execute(
+            "SELECT COUNT(*) AS c FROM appointments WHERE scheduled_date = ?", (scheduled_date,)
+        ).fetchone()["c"]
+
+    def list_appointments(self, status=None, scheduled_date=None, offset=0, limit=50):
+        where, args = [], []
+        if status:
+            where.append("COALESCE(status, 'pending') = ?")
+            args.append(status)
+        if scheduled_date:
+            where.append("scheduled_date = ?")
+            args.append(scheduled_date)
+        where_sql = (" WHERE " + " AND ".join(where)) if where else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) AS c FROM appointments{where_sql}", args).fetchone()["c"]
+        rows = conn.execute(
+            f"SELECT * FROM appointments{where_sql} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            [*args, limit, offset],
+        ).fetchall()
+        return [_decode(r) for r in rows], total
+
+    def status_counts(self):
+        rows = self._conn().execute(
+            "SELECT COALESCE(status, 'pending') AS s, COUNT(*) AS c FROM appointments GROUP BY 1"
+        ).fetchall()
+        return {r["s"]: r["c"] for r in rows}
+
+    # ------------- capacity -------------
+
+    def weekday_capacity(self):
+        rows = self._conn().execute("SELECT day_name, capacity FROM daily_capacity").fetchall()
+        return {r["day_name"]: r["capacity"] for r in rows}
+
+    def set_weekday_capacity(self, day_name, capacity):
+        self._write(
+            "INSERT INTO daily_capacity (day_name, capacity) VALUES (?, ?) "
+            "ON CONFLICT(day_name) DO UPDATE SET capacity = excluded.capacity",
+            (day_name, capacity),
+        )
+
+    def add_override(self, start_date, end_date, capacity, reason=None):
+        return self._write(
+            "INSERT INTO capacity_overrides (start_date, end_date, capacity, reason) VALUES (?, ?, ?, ?)",
+            (start_date, end_date, capacity, reason),
+        ).lastrowid
+
+    def overrides(self):
+        rows = self._conn().execute(
+            "SELECT id, start_date, end_date, capacity, reason FROM capacity_overrides ORDER BY start_date, id"
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def delete_override(self, override_id):
+        return self._write("DELETE FROM capacity_overrides WHERE id = ?", (override_id,)).rowcount > 0
+
+    def capacity_on(self, day, default):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT capacity FROM capacity_overrides WHERE start_date <= ? AND end_date >= ? ORDER BY id DESC LIMIT 1",
+            (day.isoformat(), day.isoformat()),
+        ).fetchone()
+        if row is None:
+            row = conn.execute("SELECT capacity FROM daily_capacity WHERE day_name = ?", (WEEK[day.weekday()],)).fetchone()
+        return row["capacity"] if row is not None else default
+
+
+# ------------- IN MEMORY -------------
+
+class MemoryStorage(Storage):
+    """Indexed dicts; appointments also kept in a sorted (created_at, id) list for paging."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._next_id = 1
+        self._by_ticket = {}
+        self._by_phone = {}
+        self._by_nid = {}
+        self._by_date = {}
+        self._by_status = {}
+        self._pending = {}  # national_id -> id of its pending appointment
+        self._order = []  # sorted (created_at, id)
+        self._weekdays = {}
+        self._overrides = {}
+        self._next_override = 1
+
+    @staticmethod
+    def _status(row):
+        return row.get("status") or "pending"
+
+    def _index(self, row, add):
+        rid = row["id"]
+        for index, key in ((self._by_phone, row.get("phone_text")), (self._by_nid, row.get("national_id")),
+                           (self._by_date, row.get("scheduled_date")), (self._by_status, self._status(row))):
+            if key is None:
+                continue
+            if add:
+                index.setdefault(key, set()).add(rid)
+            else:
+                ids = index[key]
+                ids.discard(rid)
+                if not ids:
+                    del index[key]
+        if row.get("ticket_number") is not None:
+            if add:
+                self._by_ticket[row["ticket_number"]] = rid
+            else:
+                self._by_ticket.pop(row["ticket_number"], None)
+        if self._status(row) == "pending" and row.get("national_id") is not None:
+            if add:
+                self._pending[row["national_id"]] = rid
+            else:
+                self._pending.pop(row["national_id"], None)
+
+    def _check(self, row, rid=None):
+        ticket = row.get("ticket_number")
+        if ticket is not None and self._by_ticket.get(ticket, rid) != rid:
+            raise DuplicateTicket(f"ticket_number {ticket} is taken")
+        nid = row.get("national_id")
+        if self._status(row) == "pending" and nid is not None and self._pending.get(nid, rid) != rid:
+            existing = self._rows[self._pending[nid]]
+            if (existing.get("scheduled_date") or "9999") >= dt.date.today().isoformat():
+                raise PendingConflict(self._copy(existing))
+            self._index(existing, False)  # its date has passed: closed, as in pending_rule.close_stale
+            existing["status"] = "no_show"
+            self._index(existing, True)
+
+    @staticmethod
+    def _copy(row):
+        row = dict(row)
+        row["image_paths"] = list(row["image_paths"])
+        return row
+
+    # ------------- appointments -------------
+
+    def insert_appointment(self, fields):
+        _require(fields)
+        row = {c: None for c in COLUMNS}
+        row.update({k: v for k, v in fields.items() if k in COLUMNS})
+        row["image_paths"] = list(row["image_paths"] or [])
+        row["status"] = row["status"] if "status" in fields else "pending"  # the column default
+        row["created_at"] = row["created_at"] or _now()
+        with self._lock:
+            self._check(row)
+            row["id"] = self._next_id
+            self._next_id += 1
+            self._rows[row["id"]] = row
+            self._index(row, True)
+            insort(self._order, (row["created_at"], row["id"]))
+            return self._copy(row)
+
+    def get_appointment(self, appointment_id):
+        with self._lock:
+            row = self._rows.get(appointment_id)
+            return self._copy(row) if row is not None else None
+
+    def update_appointment(self, appointment_id, fields):
+        with self._lock:
+            old = self._rows.get(appointment_id)
+            if old is None:
+                return None
+            new = {**old, **{k: v for k, v in fields.items() if k in COLUMNS}}
+            new["image_paths"] = list(new["image_paths"] or [])
+            self._check(new, appointment_id)
+            self._index(old, False)
+            self._index(new, True)
+            if new["created_at"] != old["created_at"]:
+                del self._order[bisect_left(self._order, (old["created_at"], appointment_id))]
+                insort(self._order, (new["created_at"], appointment_id))
+            self._rows[appointment_id] = new
+            return self._copy(new)
+
+    def append_symptoms(self, appointment_id, text):
+        with self._lock:
+            row = self._rows.get(appointment_id)
+            if row is None:
+                return None
+            row["symptoms"] = (row["symptoms"] or "") + text  # not indexed
+            return self._copy(row)
+
+    def delete_appointment(self, appointment_id):
+        with self._lock:
+            row = self._rows.pop(appointment_id, None)
+            if row is None:
+                return None
+            self._index(row, False)
+            del self._order[bisect_left(self._order, (row["created_at"], appointment_id))]
+            return self._copy(row)
+
+    def _newest_first(self, ids, offset=0, limit=None):
+        rows = [self._rows[i] for i in ids]
+        rows.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        end = None if limit is None else offset + limit
+        return [self._copy(r) for r in rows[offset:end]]  # copy only the page
+
+    def by_ticket(self, ticket_number):
+        with self._lock:
+            rid = self._by_ticket.get(ticket_number)
+            return [self._copy(self._rows[rid])] if rid is not None else []
+
+    def by_phone(self, phone_text):
+        with self._lock:
+            return self._newest_first(self._by_phone.get(phone_text, ()))
+
+    def by_national_id(self, national_id):
+        with self._lock:
+            return self._newest_first(self._by_nid.get(national_id, ()))
+
+    def booked_on(self, scheduled_date):
+        with self._lock:
+            return len(self._by_date.get(scheduled_date, ()))
+
+    def list_appointments(self, status=None, scheduled_date=None, offset=0, limit=50):
+        with self._lock:
+            if status or scheduled_date:
+                sets = []
+                if status:
+                    sets.append(self._by_status.get(status, set()))
+                if scheduled_date:
+                    sets.append(self._by_date.get(scheduled_date, set()))
+                ids = set.intersection(*sets)
+                return self._newest_first(ids, offset, limit), len(ids)
+            # Unfiltered: walk the sorted list from the newest end
+            total = len(self._order)
+            lo, hi = max(total - offset - limit, 0), max(total - offset, 0)
+            return [self._copy(self._rows[rid]) for _, rid in reversed(self._order[lo:hi])], total
+
+    def status_counts(self):
+        with self._lock:
+            return {s: len(ids) for s, ids in self._by_status.items()}
+
+    # ------------- capacity -------------
+
+    def weekday_capacity(self):
+        with self._lock:
+            return dict(self._weekdays)
+
+    def set_weekday_capacity(self, day_name, capacity):
+        with self._lock:
+            self._weekdays[day_name] = capacity
+
+    def add_override(self, start_date, end_date, capacity, reason=None):
+        with self._lock:
+            oid = self._next_override
+            self._next_override += 1
+            self._overrides[oid] = {"id": oid, "start_date": start_date, "end_date": end_date,
+                                    "capacity": capacity, "reason": reason}
+            return oid
+
+    def overrides(self):
+        with self._lock:
+            return [dict(o) for o in sorted(self._overrides.values(), key=lambda o: (o["start_date"], o["id"]))]
+
+    def delete_override(self, override_id):
+        with self._lock:
+            return self._overrides.pop(override_id, None) is not None
+
+    def capacity_on(self, day, default):
+        iso = day.isoformat()
+        with self._lock:
+            for oid in sorted(self._overrides, reverse=True):  # newest wins
+                o = self._overrides[oid]
+                if o["start_date"] <= iso <= o["end_date"]:
+                    return o["capacity"]
+            return self._weekdays.get(WEEK[day.weekday()], default)
@@ -0,0 +1,252 @@
+"""
+The behaviour every storage engine (storage.py) must share, as runnable checks.
+
+    python storage_contract.py                # both engines
+    python storage_contract.py memory         # one of them
+
+check(make_storage) runs every check_* function below against a fresh, empty
+engine from make_storage() and returns [(check name, error)] for the ones
+that failed. A new engine is done when this list is empty.
+"""
+import datetime as dt
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import traceback
+
+import storage
+
+NID_A = "29901011234567"
+NID_B = "29901011234568"
+FUTURE = "2099-01-01"  # never in the past, unlike the fixed dates below
+
+
+def expect(cond, message):
+    if not cond:
+        raise AssertionError(message)
+
+
+def expect_raises(exc_type, fn, *args):
+    try:
+        fn(*args)
+    except exc_type as exc:
+        return exc
+    raise AssertionError(f"{fn.__name__} did not raise {exc_type.__name__}")
+
+
+def appt(ticket, nid=NID_A, **fields):
+    return {"ticket_number": ticket, "name": "Patient", "phone": "01234567890", "phone_text": "01234567890",
+            "national_id": nid, "scheduled_date": "2026-10-19", "symptoms": "pain", **fields}
+
+
+# ------------- appointments -------------
+
+def check_insert_and_get(s):
+    row = s.insert_appointment(appt(1001, image_paths=["a.jpg"]))
+    expect(row["id"] is not None and row["created_at"], "insert returns id and created_at")
+    expect(row["status"] == "pending", "status defaults to pending")
+    got = s.get_appointment(row["id"])
+    expect(got["ticket_number"] == 1001 and got["image_paths"] == ["a.jpg"], "get returns what was inserted")
+    expect(s.get_appointment(row["id"] + 1000) is None, "unknown id gives None")
+
+
+def check_required_fields(s):
+    fields = appt(1001)
+    del fields["phone"]
+    expect_raises(ValueError, s.insert_appointment, fields)
+    expect(s.list_appointments()[1] == 0, "nothing stored")
+
+
+def check_ticket_unique(s):
+    s.insert_appointment(appt(1001, status="completed"))
+    expect_raises(storage.DuplicateTicket, s.insert_appointment, appt(1001, NID_B))
+
+
+def check_one_pending_per_patient(s):
+    first = s.insert_appointment(appt(1001, scheduled_date=FUTURE))
+    exc = expect_raises(storage.PendingConflict, s.insert_appointment, appt(1002, scheduled_date=FUTURE))
+    expect(exc.existing["id"] == first["id"], "conflict carries the pending appointment")
+    s.insert_appointment(appt(1003, status="completed"))  # history is fine
+    s.insert_appointment(appt(1004, NID_B))  # other patients too
+    s.update_appointment(first["id"], {"status": "completed"})
+    second = s.insert_appointment(appt(1005, scheduled_date=FUTURE))
+    expect(second["status"] == "pending", "a new pending one is allowed once the first is done")
+    expect_raises(storage.PendingConflict, s.update_appointment, first["id"], {"status": "pending"})
+    expect_raises(storage.PendingConflict, s.update_appointment, first["id"], {"status": None})  # no status is pending
+
+
+def check_past_pending_is_closed(s):
+    old = s.insert_appointment(appt(1001, scheduled_date="2020-01-01"))
+    new = s.insert_appointment(appt(1002, scheduled_date=FUTURE))
+    expect(new["status"] == "pending", "a pending appointment whose date has passed does not block")
+    expect(s.get_appointment(old["id"])["status"] == "no_show", "it is closed as a no-show")
+    expect(s.status_counts() == {"no_show": 1, "pending": 1}, "status counts follow")
+
+
+def check_update_and_delete(s):
+    row = s.insert_appointment(appt(1001))
+    updated = s.update_appointment(row["id"], {"status": "completed", "completion_hour": "10:30"})
+    expect(updated["status"] == "completed" and updated["completion_hour"] == "10:30", "update applies")
+    expect(s.update_appointment(row["id"] + 1000, {"status": "completed"}) is None, "update of unknown id")
+    gone = s.delete_appointment(row["id"])
+    expect(gone["id"] == row["id"], "delete returns the row")
+    expect(s.get_appointment(row["id"]) is None and s.delete_appointment(row["id"]) is None, "deleted")
+    expect(s.by_ticket(1001) == [] and s.booked_on("2026-10-19") == 0, "indexes forget deleted rows")
+
+
+def check_append_symptoms(s):
+    row = s.insert_appointment(appt(1001))
+    s.update_appointment(row["id"], {"symptoms": "swelling"})
+    updated = s.append_symptoms(row["id"], "\nProcedures: filling")
+    expect(updated["symptoms"] == "swelling\nProcedures: filling", "appends to the stored symptoms")
+    bare = s.insert_appointment(appt(1002, NID_B, symptoms=None))
+    expect(s.append_symptoms(bare["id"], "x")["symptoms"] == "x", "no symptoms counts as empty")
+    expect(s.append_symptoms(row["id"] + 1000, "x") is None, "append to unknown id")
+
+
+def check_lookups(s):
+    s.insert_appointment(appt(1001, created_at="2026-10-01 09:00:00", status="completed"))
+    s.insert_appointment(appt(1002, created_at="2026-10-02 09:00:00"))
+    s.insert_appointment(appt(1003, NID_B, phone_text="01000000000", created_at="2026-10-03 09:00:00"))
+    expect([r["ticket_number"] for r in s.by_ticket(1002)] == [1002], "by ticket")
+    expect([r["ticket_number"] for r in s.by_phone("01234567890")] == [1002, 1001], "by phone, newest first")
+    expect([r["ticket_number"] for r in s.by_national_id(NID_A)] == [1002, 1001], "by national id, newest first")
+    expect(s.by_national_id("00000000000000") == [], "no match")
+
+
+def check_booked_on(s):
+    for i in range(3):
+        s.insert_appointment(appt(1000 + i, f"2990101000000{i}", scheduled_date="2026-10-20"))
+    s.insert_appointment(appt(2000, scheduled_date="2026-10-21", status="cancelled"))
+    expect(s.booked_on("2026-10-20") == 3, "counts the day's appointments")
+    expect(s.booked_on("2026-10-21") == 1, "counts every status")
+    expect(s.booked_on("2026-10-22") == 0, "empty day")
+
+
+def check_listing(s):
+    for i in range(25):
+        s.insert_appointment(appt(1000 + i, f"299010100000{i:02d}", created_at=f"2026-10-01 09:{i:02d}:00",
+                                  status="completed" if i % 5 == 0 else "pending",
+                                  scheduled_date="2026-10-20" if i < 10 else "2026-10-21"))
+    rows, total = s.list_appointments(limit=10)
+    expect(total == 25 and [r["ticket_number"] for r in rows] == list(range(1024, 1014, -1)), "first page")
+    rows, total = s.list_appointments(offset=20, limit=10)
+    expect([r["ticket_number"] for r in rows] == [1004, 1003, 1002, 1001, 1000], "last page")
+    rows, total = s.list_appointments(status="completed")
+    expect(total == 5 and [r["ticket_number"] for r in rows] == [1020, 1015, 1010, 1005, 1000], "by status")
+    rows, total = s.list_appointments(status="pending", scheduled_date="2026-10-20", limit=3)
+    expect(total == 8 and [r["ticket_number"] for r in rows] == [1009, 1008, 1007], "by status and date")
+    expect(s.status_counts() == {"completed": 5, "pending": 20}, "status counts")
+
+
+def check_same_created_at_orders_by_id(s):
+    a = s.insert_appointment(appt(1001, created_at="2026-10-01 09:00:00"))
+    b = s.insert_appointment(appt(1002, NID_B, created_at="2026-10-01 09:00:00"))
+    rows, _ = s.list_appointments()
+    expect([r["id"] for r in rows] == [b["id"], a["id"]], "ties broken by id, newest first")
+
+
+# ------------- capacity -------------
+
+def check_weekday_capacity(s):
+    expect(s.capacity_on(dt.date(2026, 10, 19), 10) == 10, "default without configuration")
+    s.set_weekday_capacity("Monday", 12)
+    s.set_weekday_capacity("Monday", 14)
+    expect(s.weekday_capacity().get("Monday") == 14, "set replaces")
+    expect(s.capacity_on(dt.date(2026, 10, 19), 10) == 14, "Monday uses the weekday value")
+    expect(s.capacity_on(dt.date(2026, 10, 20), 10) == 10, "Tuesday falls back to the default")
+
+
+def check_overrides(s):
+    s.set_weekday_capacity("Monday", 14)
+    first = s.add_override("2026-10-19", "2026-10-25", 0, "holiday")
+    second = s.add_override("2026-10-19", "2026-10-19", 5, "half day")
+    expect(s.capacity_on(dt.date(2026, 10, 19), 10) == 5, "newest override wins")
+    expect(s.capacity_on(dt.date(2026, 10, 21), 10) == 0, "override covers the whole range")
+    expect(s.capacity_on(dt.date(2026, 10, 26), 10) == 14, "outside the range")
+    expect([o["id"] for o in s.overrides()] == [first, second], "listed by start date")
+    expect(s.delete_override(second) and not s.delete_override(second), "delete once")
+    expect(s.capacity_on(dt.date(2026, 10, 19), 10) == 0, "older override applies again")
+
+
+# ------------- attachments -------------
+
+def check_attachments(s):
+    a = s.insert_appointment(appt(1001, scheduled_date="2026-10-01", status="completed",
+                                  image_paths=["p/1.jpg"], voice_note_path="p/1.webm"))
+    b = s.insert_appointment(appt(1002, scheduled_date="2026-10-10"))
+    s.set_attachments(b["id"], ["p/2.jpg", "p/3.jpg"])
+    expect(s.attachments(b["id"]) == {"images": ["p/2.jpg", "p/3.jpg"], "voice": None}, "set and read back")
+    expect(s.attachments(b["id"] + 1000) is None, "unknown appointment")
+    paths = [x["path"] for x in s.patient_attachments(NID_A)]
+    expect(paths == ["p/1.jpg", "p/1.webm", "p/2.jpg", "p/3.jpg"], "all of a patient's files, oldest first")
+    later = s.patient_attachments(NID_A, first="2026-10-05")
+    expect([x["appointment_id"] for x in later] == [b["id"], b["id"]], "date filter")
+    row = s.get_appointment(a["id"])
+    row["image_paths"].append("mutated")
+    expect(s.attachments(a["id"])["images"] == ["p/1.jpg"], "returned rows are copies")
+
+
+CHECKS = [fn for name, fn in sorted(globals().items()) if name.startswith("check_")]
+
+
+def check(make_storage):
+    """Run every check on a fresh engine; returns [(name, error text)] of failures."""
+    failures = []
+    for fn in CHECKS:
+        s = make_storage()
+        s.prepare()
+        try:
+            fn(s)
+        except Exception:
+            failures.append((fn.__name__, traceback.format_exc(limit=2)))
+    return failures
+
+
+# ------------- engines -------------
+
+def memory_engine():
+    return storage.MemoryStorage()
+
+
+def sqlite_engine(directory):
+    """Factory of SQLiteStorage engines, each on a new file under `directory`."""
+    from seed import SCHEMA
+
+    counter = [0]
+
+    def make():
+        counter[0] += 1
+        path = os.path.join(directory, f"contract-{counter[0]}.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        def connect():
+            conn = sqlite3.connect(path)
+            conn.row_factory = lambda cur, row: {c[0]: row[i] for i, c in enumerate(cur.description)}
+            return conn
+        return storage.SQLiteStorage(connect)
+    return make
+
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or ["sqlite", "memory"]
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engines = {"sqlite": sqlite_engine(tmp), "memory": memory_engine}
+        for name in names:
+            t0 = time.perf_counter()
+            failures = check(engines[name])
+            elapsed = (time.perf_counter() - t0) * 1000
+            print(f"{name:<7} {len(CHECKS) - len(failures)}/{len(CHECKS)} checks passed in {elapsed:.0f} ms")
+            for check_name, error in failures:
+                print(f"  FAIL {check_name}\n{error}")
+            failed += len(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
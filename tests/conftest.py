@@ -0,0 +1,33 @@
+"""
+Tests run against a generated database in a temporary directory.
+
+The apps bind their database, upload store and rate limits from the
+environment when they are imported, so it is set here, before any test
+module imports them.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="dental-tests-")
+DB_PATH = os.path.join(TMP, "appointments.db")
+os.environ.update({
+    "DENTAL_DB": DB_PATH,
+    "UPLOADS_DB": os.path.join(TMP, "uploads.db"),
+    "UPLOAD_TMP_DIR": os.path.join(TMP, "uploads_tmp"),
+    "BACKUP_DIR": os.path.join(TMP, "backups"),
+    "IMAGE_INGEST": "0",
+    "BOOK_BURST": "1000",
+    "BOOK_NID_BURST": "1000",
+    "UPLOAD_BURST": "1000",
+    "UPLOAD_NID_BURST": "1000",
+})
+os.environ.pop("CLINICS", None)
+os.environ.pop("METRICS_TOKEN", None)
+
+import seed  # noqa: E402
+
+seed.generate(DB_PATH, rows=3000, days=60, seed=7, workers=1)
@@ -0,0 +1,42 @@
+"""
+The group-commit writer applies in-memory cache updates only for bookings
+that committed.
+"""
+import datetime as dt
+import os
+import sqlite3
+
+import pytest
+
+import app_patient
+import services
+from booking_queue import BookingWriter
+
+
+@pytest.fixture
+def clinic():
+    clinic = services.Clinic("queue-test", os.environ["DENTAL_DB"])
+    clinic.bind(lambda: clinic.availability.remaining(dt.date.today()))()
+    return clinic
+
+
+def booked_counts(clinic):
+    first = dt.date.today()
+    return [d["booked"] for d in clinic.availability.days(first, first + dt.timedelta(days=30))]
+
+
+def test_rolled_back_batch_leaves_caches_alone(clinic):
+    before = booked_counts(clinic)
+
+    def failing(conn, payload, phone, after):
+        app_patient.insert_booking(conn, payload, phone, after)
+        raise sqlite3.OperationalError("disk I/O error")  # after the INSERT, before the commit
+
+    writer = BookingWriter(clinic.get_conn, clinic.bind(failing), after_commit=services.AfterCommit)
+    try:
+        fut = writer.submit({"name": "Queue Test", "national_id": "29903030000001", "symptoms": None}, "01234567890")
+        with pytest.raises(sqlite3.OperationalError):
+            fut.result(timeout=10)
+    finally:
+        writer.stop()
+    assert booked_counts(clinic) == before
@@ -0,0 +1,48 @@
+"""
+A booking keeps its uploads only if it answers 201, and a patient cannot hold
+more than UPLOAD_MAX_OPEN_PER_NID unfinished uploads.
+"""
+import pytest
+
+import app_patient
+
+NID = "29906060000001"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_patient.UPLOADS, "uploads_root", str(tmp_path / "uploads"))
+    return app_patient.create_app().test_client()
+
+
+def upload(client, nid, data=b"voice"):
+    resp = client.post("/api/patient/uploads", json={"kind": "voice", "size": len(data), "national_id": nid})
+    assert resp.status_code == 201
+    upload_id = resp.get_json()["upload_id"]
+    assert client.put(f"/api/patient/uploads/{upload_id}", data=data, headers={"Upload-Offset": "0"}).status_code == 200
+    assert client.post(f"/api/patient/uploads/{upload_id}/complete", json={}).status_code == 200
+    return upload_id
+
+
+def test_rejected_booking_gives_the_upload_back(client):
+    booking = {"name": "Upload Test", "national_id": NID, "phone": "01234567890"}
+    assert client.post("/api/patient/book", json=booking).status_code == 201
+
+    upload_id = upload(client, NID)
+    resp = client.post("/api/patient/book", json={**booking, "voice_upload_id": upload_id})
+    assert resp.status_code == 409  # already pending
+    assert client.get(f"/api/patient/uploads/{upload_id}").get_json()["status"] == "complete"
+
+    other = "29906060000002"
+    upload_id = upload(client, other)
+    resp = client.post("/api/patient/book", json={**booking, "national_id": other, "voice_upload_id": upload_id})
+    assert resp.status_code == 201 and resp.get_json()["voice_note_path"]
+    assert client.get(f"/api/patient/uploads/{upload_id}").status_code == 404
+
+
+def test_open_uploads_are_capped_per_national_id(client):
+    nid = "29906060000003"
+    body = {"kind": "image", "size": 10, "national_id": nid}
+    for _ in range(app_patient.UPLOADS.max_open_per_nid):
+        assert client.post("/api/patient/uploads", json=body).status_code == 201
+    assert client.post("/api/patient/uploads", json=body).status_code == 429
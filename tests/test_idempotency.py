@@ -0,0 +1,71 @@
+"""Idempotency-Key replays only the request it was first used with."""
+import app_patient
+
+
+def booking(nid):
+    return {"name": "Key Test", "national_id": nid, "phone": "01234567890", "symptoms": "pain"}
+
+
+def test_same_request_is_replayed():
+    client = app_patient.create_app().test_client()
+    headers = {"Idempotency-Key": "test-replay"}
+    first = client.post("/api/patient/book", json=booking("29904040000001"), headers=headers)
+    again = client.post("/api/patient/book", json=booking("29904040000001"), headers=headers)
+    assert first.status_code == again.status_code == 201
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.get_json() == first.get_json()
+
+
+def test_key_reused_with_another_request_is_rejected():
+    client = app_patient.create_app().test_client()
+    headers = {"Idempotency-Key": "test-mismatch"}
+    assert client.post("/api/patient/book", json=booking("29904040000002"), headers=headers).status_code == 201
+    resp = client.post("/api/patient/book", json=booking("29904040000003"), headers=headers)
+    assert resp.status_code == 422
+    assert "Idempotent-Replayed" not in resp.headers
+
+
+class _SlowWriter:
+    """Stands in for the booking writer: the booking finishes when the test says so."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, payload, phone):
+        from concurrent.futures import Future
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+def test_queued_booking_past_its_timeout_is_finished_later(monkeypatch):
+    writer = _SlowWriter()
+    monkeypatch.setattr(app_patient, "BOOKING_WRITER", writer)
+    monkeypatch.setattr(app_patient, "BOOKING_TIMEOUT", 0.01)
+    client = app_patient.create_app().test_client()
+    headers = {"Idempotency-Key": "test-deferred"}
+    body = booking("29904040000004")
+
+    first = client.post("/api/patient/book", json=body, headers=headers)
+    assert first.status_code == 202 and first.get_json()["idempotency_key"] == "test-deferred"
+
+    writer.futures[0].set_result(({"ticket_number": "1"}, 201))
+    again = client.post("/api/patient/book", json=body, headers=headers)
+    assert again.status_code == 201 and again.headers["Idempotent-Replayed"] == "true"
+    assert len(writer.futures) == 1
+
+
+class _NoTokens:
+    def take(self, key):
+        return 30.0
+
+
+def test_replay_skips_admission_control(monkeypatch):
+    client = app_patient.create_app().test_client()
+    headers = {"Idempotency-Key": "test-admission"}
+    body = booking("29904040000005")
+    assert client.post("/api/patient/book", json=body, headers=headers).status_code == 201
+
+    monkeypatch.setattr(app_patient.ADMISSION, "ip_buckets", _NoTokens())
+    again = client.post("/api/patient/book", json=body, headers=headers)
+    assert again.status_code == 201 and again.headers["Idempotent-Replayed"] == "true"
+    assert client.post("/api/patient/book", json=booking("29904040000006")).status_code == 429
@@ -0,0 +1,36 @@
+"""/api/metrics needs a staff login without METRICS_TOKEN, and write transactions time the write lock."""
+import sqlite3
+
+import app_staff
+import metrics
+
+
+def test_staff_metrics_need_login():
+    client = app_staff.create_app().test_client()
+    assert client.get("/api/metrics").status_code == 403
+    with client.session_transaction() as sess:
+        sess["role"] = "staff"
+    body = client.get("/api/metrics").get_data(as_text=True)
+    assert 'http_requests_in_flight{app="staff"}' in body
+
+
+def lock_waits():
+    for line in metrics.REGISTRY.render().splitlines():
+        if line.startswith("db_write_lock_wait_seconds_count"):
+            return int(line.split()[-1])
+    return 0
+
+
+def test_write_lock_wait_is_timed(tmp_path):
+    conn = metrics.connect(tmp_path / "t.db")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    before = lock_waits()
+    conn.execute("INSERT INTO t (x) VALUES (1)")
+    conn.execute("INSERT INTO t (x) VALUES (2)")  # same transaction: one wait
+    conn.commit()
+    assert lock_waits() == before + 1
+
+    auto = metrics.connect(tmp_path / "t.db", isolation_level=None)  # autocommit: left alone
+    auto.execute("INSERT INTO t (x) VALUES (3)")
+    assert lock_waits() == before + 1
+    assert sqlite3.connect(tmp_path / "t.db").execute("SELECT COUNT(*) FROM t").fetchone()[0] == 3
@@ -0,0 +1,56 @@
+"""The one-pending-appointment index is built without rewriting existing rows."""
+import logging
+import sqlite3
+
+import pytest
+
+import pending_rule
+from seed import SCHEMA
+
+
+def connector(path):
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return connect
+
+
+def test_duplicates_are_logged_and_checked_until_resolved(tmp_path, monkeypatch, caplog):
+    connect = connector(tmp_path / "dup.db")
+    conn = connect()
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO appointments (name, phone, national_id, status, scheduled_date) "
+        "VALUES (?, '01234567890', ?, ?, ?)",
+        [("A", "29906060000001", "pending", "2099-01-01"), ("A", "29906060000001", None, "2099-02-01"),
+         ("B", "29906060000002", "pending", "2020-01-01")],
+    )
+    conn.commit()
+    conn.close()
+
+    guard = pending_rule.PendingGuard(connect)
+    with caplog.at_level(logging.WARNING, logger="pending_rule"):
+        guard.prepare()
+    assert not guard.indexed and "1 patients have more than one pending appointment" in caplog.text
+
+    conn = connect()
+    assert guard.check(conn, "29906060000001")["scheduled_date"] == "2099-01-01"
+    assert guard.check(conn, "29906060000002") is None  # its pending one is in the past: closed
+    conn.commit()
+    assert [r[0] for r in conn.execute("SELECT status FROM appointments ORDER BY id")] == ["pending", None, "no_show"]
+    conn.execute("UPDATE appointments SET status = 'completed' WHERE scheduled_date = '2099-01-01'")
+    conn.commit()
+    conn.close()
+
+    guard.prepare()
+    assert not guard.indexed  # not retried before RETRY_SECONDS
+    monkeypatch.setattr(pending_rule, "_retry_at", {})
+    guard.prepare()
+    assert guard.indexed
+    conn = connect()
+    with pytest.raises(sqlite3.IntegrityError) as info:
+        conn.execute("INSERT INTO appointments (name, phone, national_id) VALUES ('A', '01234567890', '29906060000001')")
+    assert pending_rule.is_duplicate(info.value)
+    assert guard.check(conn, "29906060000001") is None  # the insert checks now
+    conn.close()
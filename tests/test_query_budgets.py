@@ -0,0 +1,76 @@
+"""
+Query budgets for the hot endpoints (query_profiler.assert_queries).
+
+Each endpoint is called once to warm its caches and apply lazy migrations,
+then measured. A new query per row (N+1) or a lost index fails here.
+Dashboard totals count the whole table, so scans of appointments are allowed
+there and on the unfiltered appointments list.
+"""
+import itertools
+
+import pytest
+
+import app_patient
+import app_staff
+from query_profiler import assert_queries
+
+_nids = (f"2990202{n:07d}" for n in itertools.count())
+
+
+def booking():
+    return {"name": "Budget Test", "national_id": next(_nids), "phone": "01234567890", "symptoms": "pain"}
+
+
+@pytest.fixture(scope="module")
+def patient():
+    client = app_patient.create_app().test_client()
+    assert client.post("/api/patient/book", json=booking()).status_code == 201
+    return client
+
+
+@pytest.fixture(scope="module")
+def staff(patient):  # after a booking, so the patient-side migrations and indexes exist
+    client = app_staff.create_app().test_client()
+    client.get("/api/dashboard")
+    client.get("/api/appointments")
+    return client
+
+
+def test_patient_book(patient):
+    resp = assert_queries(patient, "POST", "/api/patient/book", max_queries=4, json=booking())
+    assert resp.status_code == 201
+
+
+def test_patient_book_duplicate(patient):
+    body = booking()
+    assert patient.post("/api/patient/book", json=body).status_code == 201
+    resp = assert_queries(patient, "POST", "/api/patient/book", max_queries=4, json=body)
+    assert resp.status_code == 409
+
+
+def test_dashboard(staff):
+    resp = assert_queries(staff, "GET", "/api/dashboard", max_queries=10, allow_scans=("appointments",))
+    assert resp.status_code == 200
+
+
+def test_appointments_list(staff):
+    resp = assert_queries(staff, "GET", "/api/appointments", max_queries=3, allow_scans=("appointments",))
+    assert resp.status_code == 200 and len(resp.get_json()["appointments"]) == 10
+
+
+def test_appointments_by_date(staff):
+    day = staff.get("/api/appointments").get_json()["appointments"][0]["scheduled_date"]
+    resp = assert_queries(staff, "GET", f"/api/appointments?date={day}", max_queries=3)
+    assert resp.status_code == 200
+
+
+def test_executemany_is_profiled(tmp_path):
+    import sqlite3
+    import query_profiler
+
+    conn = sqlite3.connect(tmp_path / "t.db", factory=query_profiler.ProfiledConnection)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    with query_profiler.capture() as statements:
+        conn.executemany("INSERT INTO t (x) VALUES (?)", ((i,) for i in range(5)))
+    conn.close()
+    assert [(st.sql, st.rows) for st in statements] == [("INSERT INTO t (x) VALUES (?)", 5)]
@@ -0,0 +1,87 @@
+"""
+Staff create, reschedule and delete go through the Storage interface and keep
+the pending rule and the seat bitmap right.
+"""
+import datetime as dt
+
+import pytest
+
+import app_staff
+
+NID = "29905050000001"
+
+
+@pytest.fixture(scope="module")
+def staff():
+    return app_staff.create_app().test_client()
+
+
+def test_create_update_delete(staff):
+    body = {"name": "Staff Test", "national_id": NID, "phone": "01234567890", "symptoms": "pain"}
+    resp = staff.post("/api/appointments", json=body)
+    assert resp.status_code == 201
+    appt = resp.get_json()["appointment"]
+    assert appt["status"] == "pending" and appt["image_paths"] == []
+
+    assert staff.post("/api/appointments", json=body).status_code == 409
+
+    later = (dt.date.fromisoformat(appt["scheduled_date"]) + dt.timedelta(days=1)).isoformat()
+    resp = staff.put(f"/api/appointments/{appt['id']}", json={"scheduled_date": later})
+    assert resp.status_code == 200 and resp.get_json()["data"]["scheduled_date"] == later
+
+    resp = staff.put(f"/api/appointments/{appt['id']}",
+                     json={"status": "completed", "completion_hour": "10:30", "procedures_done": "filling"})
+    data = resp.get_json()["data"]
+    assert data["status"] == "completed" and data["symptoms"] == "pain\nProcedures: filling"
+    resp = staff.put(f"/api/appointments/{appt['id']}",
+                     json={"status": "completed", "use_now": True, "symptoms": "pain, swelling", "procedures_done": "x-ray"})
+    assert resp.get_json()["data"]["symptoms"] == "pain, swelling\nProcedures: x-ray"  # the body's symptoms are kept
+
+    assert staff.delete(f"/api/appointments/{appt['id']}").status_code == 200
+    assert staff.delete(f"/api/appointments/{appt['id']}").status_code == 404
+    assert staff.put(f"/api/appointments/{appt['id']}", json={"name": "x"}).status_code == 404
+
+
+def test_reschedule_to_a_full_date_is_refused(staff):
+    body = {"name": "Staff Test", "national_id": "29905050000002", "phone": "01234567890"}
+    appt = staff.post("/api/appointments", json=body).get_json()["appointment"]
+    closed = (dt.date.today() + dt.timedelta(days=200)).isoformat()
+    override = staff.post("/api/capacity/overrides", json={"start_date": closed, "capacity": 0, "reason": "test"})
+    assert override.status_code == 201
+    try:
+        resp = staff.put(f"/api/appointments/{appt['id']}", json={"scheduled_date": closed})
+        assert resp.status_code == 409
+    finally:
+        staff.delete(f"/api/capacity/overrides/{override.get_json()['id']}")
+        staff.delete(f"/api/appointments/{appt['id']}")
+
+
+def test_full_slot_day_raises(tmp_path):
+    import sqlite3
+    import slots
+
+    conn = sqlite3.connect(tmp_path / "s.db")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE appointments (scheduled_date TEXT, slot_time TEXT, slot_chair INTEGER)")
+    template = slots.SlotTemplate(9 * 60, 30, 1, 1)  # one seat
+    seats = slots.SlotAllocator(lambda: conn, lambda day: template)
+    day = dt.date(2030, 1, 1)
+
+    def insert(slot_time, slot_chair):
+        conn.execute("INSERT INTO appointments VALUES (?, ?, ?)", (day.isoformat(), slot_time, slot_chair))
+
+    assert seats.book(conn, day, insert)[1:] == ("09:00", 1)
+    with pytest.raises(slots.SlotsFull):
+        seats.book(conn, day, insert)
+
+
+def test_attachments_zip_needs_staff_login(staff):
+    url = f"/api/patients/{NID}/attachments.zip"
+    assert staff.get(url).status_code == 403
+    with staff.session_transaction() as sess:
+        sess["role"] = "staff"
+    try:
+        assert staff.get(url).status_code == 404  # let through; this patient has no files
+    finally:
+        with staff.session_transaction() as sess:
+            sess.clear()
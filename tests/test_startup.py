@@ -0,0 +1,46 @@
+"""
+A startup budget: importing both apps and building them, in a fresh
+interpreter. A heavy import moved back to module level fails here.
+
+The budget is three times benchmarks/bench_startup.py's (STARTUP_BUDGET_MS,
+600 ms to first response), so a slow CI machine does not trip it.
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BUDGET_S = 3 * float(os.getenv("STARTUP_BUDGET_MS", "600")) / 1000
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app_patient, app_staff
+t1 = time.perf_counter()
+app_patient.create_app()
+app_staff.create_app()
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1}))
+"""
+
+
+def slowest_imports(stderr, top=8):
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cum_us, name = line[len("import time:"):].split("|")
+            rows.append((int(cum_us), name.strip()))
+    return ", ".join(f"{name} {us / 1000:.0f} ms" for us, name in sorted(rows, reverse=True)[:top])
+
+
+def test_apps_start_within_budget():
+    env = {**os.environ, "PATIENT_JOBS": "off", "STAFF_JOBS": "off"}  # no threads in the probe
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True, timeout=60)
+    phases = json.loads(out.stdout.strip().splitlines()[-1])
+    total = phases["import"] + phases["create_app"]
+    assert total < BUDGET_S, (
+        f"startup took {total:.2f} s (import {phases['import']:.2f} s, create_app {phases['create_app']:.2f} s), "
+        f"budget {BUDGET_S:.1f} s; slowest imports: {slowest_imports(out.stderr)}"
+    )
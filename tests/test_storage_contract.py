@@ -0,0 +1,20 @@
+"""
+Every storage_contract check, against both storage engines.
+"""
+import pytest
+
+import storage_contract
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_storage(request, tmp_path):
+    if request.param == "memory":
+        return storage_contract.memory_engine
+    return storage_contract.sqlite_engine(str(tmp_path))
+
+
+@pytest.mark.parametrize("check", storage_contract.CHECKS, ids=lambda fn: fn.__name__[len("check_"):])
+def test_contract(make_storage, check):
+    s = make_storage()
+    s.prepare()
+    check(s)
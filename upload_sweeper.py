@@ -0,0 +1,284 @@
+"""
+Find uploaded files that no appointment refers to, and quarantine or delete them.
+
+Files can be left behind in three ways:
+  - DELETE /api/appointments/<id> removes the row but not its files;
+  - book_appointment saves the files before validating, so a rejected or
+    failed booking leaves them behind;
+  - a staff edit that replaces image_paths or voice_note_path leaves the old file.
+
+The sweep walks yarab/uploads with os.scandir, one directory at a time, so
+memory does not grow with the number of files. Patient folders are
+reconciled in batches of SWEEP_BATCH folders, with one indexed
+`national_id IN (...)` query per clinic database for each batch. Uploads are
+shared by all clinics, so a file is kept if any clinic refers to it. The old
+flat uploads/images and uploads/voices folders are checked against all
+references to them, which are loaded once.
+
+Files modified within SWEEP_GRACE_HOURS (24) are never touched: a booking
+saves its files before its row is committed. An orphan is:
+  - quarantine (default): moved to yarab/quarantine/<same path> and deleted
+    from there after SWEEP_QUARANTINE_DAYS (30);
+  - delete: removed straight away;
+  - dry-run: only counted.
+
+    python upload_sweeper.py [--mode quarantine|delete|dry-run] [--grace-hours 24] [--db FILE ...]
+
+With SWEEP_INTERVAL_MINUTES > 0 the staff app runs a sweep on that interval
+in a background thread. Totals go to /api/metrics: uploads_orphans_total,
+uploads_reclaimed_bytes_total and uploads_last_sweep_timestamp.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+from schema import ro_uri
+from storage import decode_image_paths
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+BASE = os.path.join(HERE, "yarab")  # stored paths are relative to this ("uploads/patients/...")
+LEGACY_DIRS = ("uploads/images", "uploads/voices")
+MODES = ("quarantine", "delete", "dry-run")
+
+log = logging.getLogger(__name__)
+
+
+class SweepStats:
+    __slots__ = ("scanned", "scanned_bytes", "recent", "orphans", "orphan_bytes", "reclaimed_bytes",
+                 "purged", "errors")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _files(path):
+    """Every regular file under `path`, depth first, one open directory per level."""
+    try:
+        it = os.scandir(path)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _row_paths(row, out):
+    image_paths, voice = row[0], row[1]
+    out.update(decode_image_paths(image_paths))
+    if voice:
+        out.add(voice)
+
+
+class UploadSweeper:
+    def __init__(self, connects, base=BASE, mode=None, grace_hours=None, batch=None, quarantine_days=None,
+                 interval_minutes=None):
+        """connects: [() -> sqlite3.Connection], one per clinic database (all share the uploads tree)"""
+        self.connects = list(connects)
+        self.base = base
+        self.mode = mode or os.getenv("SWEEP_MODE", "quarantine")
+        if self.mode not in MODES:
+            raise ValueError(f"SWEEP_MODE must be one of {', '.join(MODES)}, not {self.mode!r}")
+        self.grace = (grace_hours if grace_hours is not None else float(os.getenv("SWEEP_GRACE_HOURS", "24"))) * 3600
+        self.batch = batch or int(os.getenv("SWEEP_BATCH", "200"))
+        self.quarantine_days = (
+            quarantine_days if quarantine_days is not None else float(os.getenv("SWEEP_QUARANTINE_DAYS", "30"))
+        )
+        self.interval_minutes = (
+            interval_minutes if interval_minutes is not None else float(os.getenv("SWEEP_INTERVAL_MINUTES", "0"))
+        )
+        self.quarantine_dir = os.path.join(base, "quarantine")
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ------------- references -------------
+
+    def _query(self, sql, args=()):
+        refs = set()
+        for connect in self.connects:
+            conn = connect()
+            try:
+                for row in conn.execute(sql, args):
+                    _row_paths(tuple(row.values()) if isinstance(row, dict) else row, refs)
+            finally:
+                conn.close()
+        return refs
+
+    def _patient_refs(self, national_ids):
+        marks = ",".join("?" * len(national_ids))
+        return self._query(
+            f"SELECT image_paths, voice_note_path FROM appointments WHERE national_id IN ({marks})", national_ids
+        )
+
+    def _legacy_refs(self):
+        return self._query(
+            "SELECT image_paths, voice_note_path FROM appointments "
+            "WHERE image_paths LIKE '%uploads/images/%' OR voice_note_path LIKE 'uploads/voices/%'"
+        )
+
+    # ------------- sweep -------------
+
+    def sweep(self):
+        """One pass over the uploads tree. Returns SweepStats."""
+        stats = SweepStats()
+        cutoff = time.time() - self.grace
+        patients = os.path.join(self.base, "uploads", "patients")
+
+        batch = []
+        for folder in self._patient_folders(patients):
+            batch.append(folder)
+            if len(batch) >= self.batch:
+                self._sweep_batch(batch, cutoff, stats)
+                batch = []
+        if batch:
+            self._sweep_batch(batch, cutoff, stats)
+
+        legacy = None
+        for rel_dir in LEGACY_DIRS:
+            for entry in _files(os.path.join(self.base, *rel_dir.split("/"))):
+                if legacy is None:
+                    legacy = self._legacy_refs()  # only when there is something to check
+                self._consider(entry, legacy, cutoff, stats)
+
+        if self.mode == "quarantine":
+            self._purge_quarantine(stats)
+        REGISTRY.gauge_set("uploads_last_sweep_timestamp", time.time())
+        return stats
+
+    @staticmethod
+    def _patient_folders(root):
+        try:
+            it = os.scandir(root)
+        except FileNotFoundError:
+            return
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False) and entry.name.startswith("patient_"):
+                    yield entry
+
+    def _sweep_batch(self, folders, cutoff, stats):
+        refs = self._patient_refs([f.name[len("patient_"):] for f in folders])
+        for folder in folders:
+            for entry in _files(folder.path):
+                self._consider(entry, refs, cutoff, stats)
+            self._prune_dirs(folder.path, cutoff)
+
+    def _consider(self, entry, refs, cutoff, stats):
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            return
+        stats.scanned += 1
+        stats.scanned_bytes += st.st_size
+        if os.path.relpath(entry.path, self.base).replace(os.sep, "/") in refs:
+            return
+        if st.st_mtime > cutoff:
+            stats.recent += 1
+            return
+        stats.orphans += 1
+        stats.orphan_bytes += st.st_size
+        if self.mode == "dry-run":
+            return
+        try:
+            if self.mode == "delete":
+                os.remove(entry.path)
+            else:
+                dest = os.path.join(self.quarantine_dir, os.path.relpath(entry.path, self.base))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(entry.path, dest)
+                os.utime(dest)  # quarantine age counts from now
+        except OSError as exc:
+            stats.errors += 1
+            log.warning("could not move %s: %s", entry.path, exc)
+            return
+        stats.reclaimed_bytes += st.st_size
+        REGISTRY.inc("uploads_orphans_total", (("action", self.mode),))
+        REGISTRY.inc("uploads_reclaimed_bytes_total", value=st.st_size)
+
+    def _prune_dirs(self, path, cutoff):
+        """Remove empty folders left behind, bottom up (not ones a booking may be about to write to)."""
+        if self.mode == "dry-run":
+            return
+        for sub in ("images", "voices", ""):
+            d = os.path.join(path, sub) if sub else path
+            try:
+                if os.stat(d).st_mtime <= cutoff:
+                    os.rmdir(d)  # fails unless empty
+            except OSError:
+                pass
+
+    def _purge_quarantine(self, stats):
+        cutoff = time.time() - self.quarantine_days * 86400
+        for entry in _files(self.quarantine_dir):
+            try:
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime <= cutoff:
+                    os.remove(entry.path)
+                    stats.purged += 1
+            except OSError:
+                stats.errors += 1
+
+    # ------------- schedule -------------
+
+    def start(self):
+        """Sweep every SWEEP_INTERVAL_MINUTES in a daemon thread (no-op when 0)."""
+        if self.interval_minutes <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="upload-sweeper", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval_minutes * 60)
+            try:
+                stats = self.sweep()
+                if stats.orphans:
+                    log.info("%d orphaned files, %d bytes reclaimed (%s)",
+                             stats.orphans, stats.reclaimed_bytes, self.mode)
+            except Exception:
+                log.exception("sweep failed")
+
+
+def _connector(path):
+    def connect():
+        return sqlite3.connect(ro_uri(path), uri=True, timeout=30)
+    return connect
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quarantine or delete uploads no appointment refers to")
+    parser.add_argument("--mode", choices=MODES, default=None, help="SWEEP_MODE, default quarantine")
+    parser.add_argument("--grace-hours", type=float, default=None)
+    parser.add_argument("--db", action="append", default=None,
+                        help="database to check (repeatable); default: every clinic's database")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        paths = args.db
+    else:
+        import services  # DENTAL_DB and CLINICS
+        paths = [c.db_path for c in services.CLINICS.values()]
+    sweeper = UploadSweeper([_connector(p) for p in paths], mode=args.mode, grace_hours=args.grace_hours)
+    t0 = time.perf_counter()
+    stats = sweeper.sweep()
+    print(f"scanned {stats.scanned} files ({stats.scanned_bytes / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+    print(f"orphans: {stats.orphans} files, {stats.orphan_bytes / 1e6:.1f} MB ({sweeper.mode}); "
+          f"reclaimed {stats.reclaimed_bytes / 1e6:.1f} MB; within grace period: {stats.recent}")
+    if stats.purged or stats.errors:
+        print(f"purged from quarantine: {stats.purged}; errors: {stats.errors}")
+
+
+if __name__ == "__main__":
+    main()